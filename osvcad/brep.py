@@ -0,0 +1,178 @@
+# coding: utf-8
+
+r"""BRep serialization of shapes
+
+BRep is the native OpenCascade format: writing and reading it is much faster
+than going through STEP. It is used to hand shapes over to other processes and
+its text is the content key of a shape (see shape_hash()).
+
+"""
+
+import functools
+import logging
+import hashlib
+import threading
+from collections import OrderedDict
+from os import close, remove
+from tempfile import mkstemp
+
+from OCC.Core.BRep import BRep_Builder
+from OCC.Core.BRepBuilderAPI import BRepBuilderAPI_Copy
+from OCC.Core.BRepTools import breptools_Write, breptools_Read
+from OCC.Core.TopoDS import TopoDS_Shape
+
+logger = logging.getLogger(__name__)
+
+# Number of shape hashes kept in memory
+HASH_CACHE_SIZE = 1024
+
+
+def topods_shape(shape):
+    r"""The OCC shape of a ccad shape or of an OCC shape
+
+    Parameters
+    ----------
+    shape : ccad.model.Shape or TopoDS_Shape
+
+    Returns
+    -------
+    TopoDS_Shape
+
+    """
+    return shape.shape if hasattr(shape, "shape") else shape
+
+
+def memoize_by_shape(maxsize):
+    r"""Decorator that memoizes a function of a shape by shape identity
+
+    The results of the last maxsize calls (shape and other arguments) are
+    kept. The shapes are kept referenced so that their ids cannot be reused
+    by other shapes. The decorated function gets a remember(shape, result,
+    *args, **kwargs) method to record a result known in advance.
+
+    Parameters
+    ----------
+    maxsize : int
+
+    """
+    def decorator(function):
+        cache = OrderedDict()
+        lock = threading.Lock()
+
+        def remember(shape, result, *args, **kwargs):
+            key = (id(shape), args, tuple(sorted(kwargs.items())))
+            with lock:
+                cache[key] = (shape, result)
+                cache.move_to_end(key)
+                if len(cache) > maxsize:
+                    cache.popitem(last=False)
+
+        @functools.wraps(function)
+        def memoized(shape, *args, **kwargs):
+            key = (id(shape), args, tuple(sorted(kwargs.items())))
+            with lock:
+                if key in cache and cache[key][0] is shape:
+                    cache.move_to_end(key)
+                    return cache[key][1]
+            result = function(shape, *args, **kwargs)
+            remember(shape, result, *args, **kwargs)
+            return result
+
+        memoized.remember = remember
+        return memoized
+    return decorator
+
+
+def write_brep(shape, brep_file_path):
+    r"""Write a shape to a BRep file
+
+    The shape is copied first so that no triangulation gets written: the file
+    content only depends on the geometry.
+
+    Parameters
+    ----------
+    shape : ccad.model.Shape or TopoDS_Shape
+    brep_file_path : str
+
+    """
+    copy = BRepBuilderAPI_Copy(topods_shape(shape)).Shape()
+    if not breptools_Write(copy, brep_file_path):
+        msg = "Could not write BRep file %s" % brep_file_path
+        logger.error(msg)
+        raise IOError(msg)
+
+
+def read_brep(brep_file_path):
+    r"""Read a shape from a BRep file
+
+    Parameters
+    ----------
+    brep_file_path : str
+
+    Returns
+    -------
+    TopoDS_Shape
+
+    """
+    shape = TopoDS_Shape()
+    if not breptools_Read(shape, brep_file_path, BRep_Builder()):
+        msg = "Could not read BRep file %s" % brep_file_path
+        logger.error(msg)
+        raise IOError(msg)
+    return shape
+
+
+def brep_bytes(shape):
+    r"""The BRep serialization of a shape
+
+    Parameters
+    ----------
+    shape : ccad.model.Shape or TopoDS_Shape
+
+    Returns
+    -------
+    bytes
+
+    """
+    handle, path = mkstemp(suffix=".brep")
+    close(handle)
+    try:
+        write_brep(shape, path)
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        remove(path)
+
+
+@memoize_by_shape(HASH_CACHE_SIZE)
+def shape_hash(shape):
+    r"""Content hash of a shape
+
+    The hash is the sha1 of the BRep serialization of the shape. It is
+    remembered for the last HASH_CACHE_SIZE shapes, so that asking for the
+    hash of the same shape object again is free.
+
+    Parameters
+    ----------
+    shape : ccad.model.Shape or TopoDS_Shape
+
+    Returns
+    -------
+    str : hexadecimal digest
+
+    """
+    return hashlib.sha1(brep_bytes(shape)).hexdigest()
+
+
+def remember_shape_hash(shape, digest):
+    r"""Record the known content hash of a shape (e.g. read from a stepzip
+    manifest), so that shape_hash() does not serialize it
+
+    Parameters
+    ----------
+    shape : ccad.model.Shape or TopoDS_Shape
+    digest : str
+        sha1 of the BRep serialization of the shape
+
+    """
+    shape_hash.remember(shape, digest)
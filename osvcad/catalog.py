@@ -0,0 +1,469 @@
+# coding: utf-8
+
+r"""SQLite catalog of the parts of shelves
+
+The catalog stores, for each stepzip file of the scanned folders, the fields
+of its name (see nomenclature.decode_part_name()), its anchors, its bounding
+box, its volume and the content hash of its shape. The queries (e.g. all
+STEEL CHASSIS parts longer than 700 mm with an anchor named D3) are answered
+by the database, without reading the CAD files.
+
+The scan is incremental: a file whose modification time and size did not
+change is not read again and a file whose content hash did not change only
+has its modification time updated. The geometry of the version 2 stepzip
+files comes from their manifest, the version 1 files are loaded (once) to
+compute it.
+
+"""
+
+from __future__ import print_function
+
+import argparse
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import zipfile
+from os.path import join, abspath, expanduser, dirname, exists, basename, \
+    splitext, getmtime, getsize
+
+from osvcad.nomenclature import decode_part_name, parse_dimensional
+from osvcad.stepzip import read_manifest, read_stepzip_anchors, parse_anchors
+from osvcad.thumbnails import file_hash
+
+logger = logging.getLogger(__name__)
+
+# Bump when the tables change : the catalog is then built again
+CATALOG_VERSION = 1
+
+DEFAULT_PATH = join(expanduser("~"), ".osvcad", "catalog.sqlite")
+
+EXTENSIONS = (".stepzip",)
+
+STEP_EXTENSIONS = (".stp", ".step")
+
+# unit of the dimensional field of a name -> mm
+_UNITS = {"mm": 1., "cm": 10., "m": 1000.}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS parts (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    file_hash TEXT NOT NULL,
+    name TEXT NOT NULL,
+    sector TEXT,
+    domain TEXT,
+    function TEXT,
+    dimensional TEXT,
+    material TEXT,
+    origin TEXT,
+    alpha TEXT,
+    nominal_length REAL,
+    x_min REAL, y_min REAL, z_min REAL,
+    x_max REAL, y_max REAL, z_max REAL,
+    length REAL,
+    volume REAL,
+    shape_hash TEXT
+);
+CREATE TABLE IF NOT EXISTS anchors (
+    part_id INTEGER NOT NULL REFERENCES parts(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    x REAL, y REAL, z REAL,
+    u REAL, v REAL, w REAL
+);
+CREATE INDEX IF NOT EXISTS parts_nomenclature
+    ON parts(sector, domain, function, material);
+CREATE INDEX IF NOT EXISTS parts_material ON parts(material);
+CREATE INDEX IF NOT EXISTS parts_length ON parts(length);
+CREATE INDEX IF NOT EXISTS parts_shape_hash ON parts(shape_hash);
+CREATE INDEX IF NOT EXISTS anchors_name ON anchors(name, part_id);
+CREATE INDEX IF NOT EXISTS anchors_part ON anchors(part_id);
+"""
+
+_PART_COLUMNS = ("path", "mtime", "size", "file_hash", "name", "sector",
+                 "domain", "function", "dimensional", "material", "origin",
+                 "alpha", "nominal_length", "x_min", "y_min", "z_min",
+                 "x_max", "y_max", "z_max", "length", "volume", "shape_hash")
+
+
+def nominal_length(dimensional):
+    r"""Largest dimension of the dimensional field of a name, in mm
+
+    Returns
+    -------
+    float or None : None if there is no dimension or no unit
+
+    """
+    dimensions, unit = parse_dimensional(dimensional)
+    if len(dimensions) == 0 or unit not in _UNITS:
+        return None
+    return max(value for _, value in dimensions) * _UNITS[unit]
+
+
+def _stepzip_anchors(stepzip, manifest):
+    r"""Anchors of a stepzip file, read without extraction"""
+    if manifest is not None:
+        return read_stepzip_anchors(stepzip, manifest)
+    with zipfile.ZipFile(stepzip) as zip_ref:
+        for name in zip_ref.namelist():
+            if splitext(name)[1].lower() not in STEP_EXTENSIONS:
+                return parse_anchors(zip_ref.read(name).decode("utf-8"))
+    return dict()
+
+
+def _stepzip_geometry(stepzip):
+    r"""Bounding box, volume and shape hash of a version 1 stepzip file
+
+    The STEP file is extracted to a temporary folder and loaded.
+
+    """
+    # OCC is only needed for the files without manifest
+    from aocutils.analyze.bounds import BoundingBox
+    from ccad.model import from_step
+    from osvcad.brep import brep_bytes, topods_shape
+    from osvcad.mass_properties import shape_mass_properties
+
+    folder = tempfile.mkdtemp(prefix="osvcad_catalog_")
+    try:
+        with zipfile.ZipFile(stepzip) as zip_ref:
+            step_names = [name for name in zip_ref.namelist()
+                          if splitext(name)[1].lower() in STEP_EXTENSIONS]
+            if len(step_names) != 1:
+                raise ValueError("No single STEP file in %s" % stepzip)
+            zip_ref.extract(step_names[0], folder)
+        shape = from_step(join(folder, step_names[0]))
+        bb = BoundingBox(topods_shape(shape))
+        volume, _, _ = shape_mass_properties(shape)
+        return ([bb.x_min, bb.y_min, bb.z_min, bb.x_max, bb.y_max, bb.z_max],
+                volume,
+                hashlib.sha1(brep_bytes(shape)).hexdigest())
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def describe_stepzip(stepzip, geometry=True):
+    r"""Catalog record of a stepzip file
+
+    Parameters
+    ----------
+    stepzip : str
+    geometry : bool, optional (default is True)
+        Load the version 1 files to get their bounding box and volume? If
+        False, these are None
+
+    Returns
+    -------
+    tuple(dict, dict)
+        The part columns (without path, mtime, size and file_hash) and the
+        anchors
+
+    """
+    name = splitext(basename(stepzip))[0]
+    fields = decode_part_name(name)
+    if fields is None:
+        fields = dict((field, None) for field in ("sector", "domain",
+                                                  "function", "dimensional",
+                                                  "material", "origin",
+                                                  "alpha"))
+    record = dict(fields, name=name)
+    record["nominal_length"] = nominal_length(fields["dimensional"]) \
+        if fields["dimensional"] is not None else None
+
+    manifest = read_manifest(stepzip)
+    if manifest is not None:
+        bounding_box = manifest["bounding_box"]
+        volume = manifest["volume"]
+        shape_hash = manifest["shape_hash"]
+    elif geometry is True:
+        bounding_box, volume, shape_hash = _stepzip_geometry(stepzip)
+    else:
+        bounding_box, volume, shape_hash = [None] * 6, None, None
+
+    for key, value in zip(("x_min", "y_min", "z_min",
+                           "x_max", "y_max", "z_max"), bounding_box):
+        record[key] = value
+    record["volume"] = volume
+    record["shape_hash"] = shape_hash
+    # the geometry is more reliable than the name
+    if bounding_box[0] is not None:
+        record["length"] = max(bounding_box[3] - bounding_box[0],
+                               bounding_box[4] - bounding_box[1],
+                               bounding_box[5] - bounding_box[2])
+    else:
+        record["length"] = record["nominal_length"]
+    return record, _stepzip_anchors(stepzip, manifest)
+
+
+def stepzip_files(folder):
+    r"""Stepzip files of a folder and of its sub-folders"""
+    paths = list()
+    for directory, _, file_names in os.walk(folder):
+        for file_name in sorted(file_names):
+            if splitext(file_name)[1].lower() in EXTENSIONS:
+                paths.append(abspath(join(directory, file_name)))
+    return paths
+
+
+class CatalogEntry(object):
+    r"""Part of the catalog, as returned by the queries
+
+    The attributes are the columns of the parts table; anchors maps the
+    anchor names to their (position, direction).
+
+    """
+    def __init__(self, row, anchors):
+        for key in row.keys():
+            setattr(self, key, row[key])
+        self.anchors = anchors
+
+    @property
+    def bounding_box(self):
+        r"""(x_min, y_min, z_min, x_max, y_max, z_max) or None"""
+        if self.x_min is None:
+            return None
+        return (self.x_min, self.y_min, self.z_min,
+                self.x_max, self.y_max, self.z_max)
+
+    def __repr__(self):
+        return "CatalogEntry %s" % self.path
+
+
+class ScanReport(object):
+    r"""What a scan did to the catalog"""
+    def __init__(self):
+        self.added = list()
+        self.updated = list()
+        self.touched = list()
+        self.unchanged = 0
+        self.removed = list()
+        self.failed = list()
+
+    def __repr__(self):
+        return "%i added, %i updated, %i touched, %i unchanged, " \
+               "%i removed, %i failed" % (len(self.added),
+                                          len(self.updated),
+                                          len(self.touched),
+                                          self.unchanged,
+                                          len(self.removed),
+                                          len(self.failed))
+
+
+class PartsCatalog(object):
+    r"""SQLite catalog of the parts of shelves
+
+    Parameters
+    ----------
+    database_path : str, optional (default is DEFAULT_PATH)
+        ':memory:' for an in-memory catalog
+
+    """
+    def __init__(self, database_path=DEFAULT_PATH):
+        if database_path != ":memory:" and not exists(dirname(database_path)):
+            os.makedirs(dirname(database_path))
+        self.database_path = database_path
+        self.connection = sqlite3.connect(database_path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != CATALOG_VERSION:
+            logger.info("Building the catalog %s (version %i)" %
+                        (database_path, CATALOG_VERSION))
+            self.connection.executescript("DROP TABLE IF EXISTS anchors;"
+                                          "DROP TABLE IF EXISTS parts;")
+            self.connection.execute("PRAGMA user_version = %i" %
+                                    CATALOG_VERSION)
+        self.connection.executescript(_SCHEMA)
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM parts").fetchone()[0]
+
+    def _store(self, path, mtime, size, digest, geometry):
+        record, anchors = describe_stepzip(path, geometry)
+        record.update(path=path, mtime=mtime, size=size, file_hash=digest)
+        with self.connection:
+            self.connection.execute("DELETE FROM parts WHERE path = ?",
+                                    (path,))
+            cursor = self.connection.execute(
+                "INSERT INTO parts (%s) VALUES (%s)" %
+                (", ".join(_PART_COLUMNS), ", ".join("?" * len(_PART_COLUMNS))),
+                [record[column] for column in _PART_COLUMNS])
+            self.connection.executemany(
+                "INSERT INTO anchors VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(cursor.lastrowid, anchor_name) +
+                 tuple(anchor["position"]) + tuple(anchor["direction"])
+                 for anchor_name, anchor in anchors.items()])
+
+    def scan(self, folder, geometry=True):
+        r"""Bring the catalog up to date with the stepzip files of a folder
+
+        Parameters
+        ----------
+        folder : str
+        geometry : bool, optional (default is True)
+            Load the version 1 stepzip files to get their bounding box and
+            volume (see describe_stepzip())?
+
+        Returns
+        -------
+        ScanReport
+
+        """
+        report = ScanReport()
+        folder = abspath(folder)
+        # the paths in the folder sort between folder + os.sep and the
+        # string where os.sep is replaced by the next character (a case
+        # sensitive range that can use the index of the paths)
+        known = dict((row["path"], row) for row in self.connection.execute(
+            "SELECT path, mtime, size, file_hash FROM parts "
+            "WHERE path >= ? AND path < ?",
+            (folder + os.sep, folder + chr(ord(os.sep) + 1))))
+        paths = stepzip_files(folder)
+        for path in paths:
+            mtime, size = getmtime(path), getsize(path)
+            row = known.get(path)
+            if row is not None and row["mtime"] == mtime \
+                    and row["size"] == size:
+                report.unchanged += 1
+                continue
+            digest = file_hash(path)
+            if row is not None and row["file_hash"] == digest:
+                with self.connection:
+                    self.connection.execute(
+                        "UPDATE parts SET mtime = ?, size = ? WHERE path = ?",
+                        (mtime, size, path))
+                report.touched.append(path)
+                continue
+            try:
+                self._store(path, mtime, size, digest, geometry)
+            except Exception as e:
+                logger.error("Cannot catalog %s : %s" % (path, e))
+                report.failed.append(path)
+                continue
+            (report.added if row is None else report.updated).append(path)
+
+        report.removed = sorted(set(known) - set(paths))
+        with self.connection:
+            self.connection.executemany("DELETE FROM parts WHERE path = ?",
+                                        [(path,) for path in report.removed])
+        logger.info("Catalog scan of %s : %s" % (folder, report))
+        return report
+
+    def query(self,
+              sector=None,
+              domain=None,
+              function=None,
+              material=None,
+              origin=None,
+              min_length=None,
+              max_length=None,
+              anchor=None,
+              shape_hash=None):
+        r"""Parts that match all the given criteria
+
+        Parameters
+        ----------
+        sector, domain, function, material, origin : str or None
+            Exact values of the name fields
+        min_length, max_length : float or None
+            Bounds of the largest dimension of the bounding box (mm), or of
+            the name if the bounding box is unknown
+        anchor : str or None
+            Name of an anchor of the part
+        shape_hash : str or None
+            Content hash of the shape, to find the copies of a part
+
+        Returns
+        -------
+        list[CatalogEntry] : sorted by path
+
+        """
+        conditions, parameters = list(), list()
+        for column, value in (("sector", sector),
+                              ("domain", domain),
+                              ("function", function),
+                              ("material", material),
+                              ("origin", origin),
+                              ("shape_hash", shape_hash)):
+            if value is not None:
+                conditions.append("%s = ?" % column)
+                parameters.append(value)
+        if min_length is not None:
+            conditions.append("length >= ?")
+            parameters.append(min_length)
+        if max_length is not None:
+            conditions.append("length <= ?")
+            parameters.append(max_length)
+        if anchor is not None:
+            conditions.append("id IN (SELECT part_id FROM anchors "
+                              "WHERE name = ?)")
+            parameters.append(anchor)
+        where = ""
+        if len(conditions) > 0:
+            where = " WHERE " + " AND ".join(conditions)
+        rows = self.connection.execute(
+            "SELECT * FROM parts%s ORDER BY path" % where,
+            parameters).fetchall()
+
+        anchors = dict((row["id"], dict()) for row in rows)
+        if len(rows) > 0:
+            # the same filter as a subquery: no limit on the number of parts
+            for anchor_row in self.connection.execute(
+                    "SELECT * FROM anchors WHERE part_id IN "
+                    "(SELECT id FROM parts%s)" % where, parameters):
+                anchors[anchor_row["part_id"]][anchor_row["name"]] = \
+                    {"position": (anchor_row["x"],
+                                  anchor_row["y"],
+                                  anchor_row["z"]),
+                     "direction": (anchor_row["u"],
+                                   anchor_row["v"],
+                                   anchor_row["w"])}
+        return [CatalogEntry(row, anchors[row["id"]]) for row in rows]
+
+
+def main(args=None):
+    r"""Command line entry point"""
+    parser = argparse.ArgumentParser(
+        description="Scan shelves into the parts catalog and query it")
+    parser.add_argument("folders", nargs="*",
+                        help="shelves folders to scan")
+    parser.add_argument("--catalog", default=DEFAULT_PATH,
+                        help="catalog database")
+    parser.add_argument("--no-geometry", action="store_true",
+                        help="do not load the version 1 stepzip files")
+    for field in ("sector", "domain", "function", "material", "origin",
+                  "anchor"):
+        parser.add_argument("--%s" % field, default=None)
+    parser.add_argument("--min-length", type=float, default=None)
+    parser.add_argument("--max-length", type=float, default=None)
+    options = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s :: %(levelname)8s :: '
+                               '%(module)20s :: %(lineno)3d :: %(message)s')
+    catalog = PartsCatalog(options.catalog)
+    for folder in options.folders:
+        print("%s : %s" % (folder, catalog.scan(
+            folder, geometry=not options.no_geometry)))
+    for entry in catalog.query(sector=options.sector,
+                               domain=options.domain,
+                               function=options.function,
+                               material=options.material,
+                               origin=options.origin,
+                               min_length=options.min_length,
+                               max_length=options.max_length,
+                               anchor=options.anchor):
+        print(entry.path)
+    catalog.close()
+
+
+if __name__ == "__main__":
+    main()
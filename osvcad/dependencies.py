@@ -0,0 +1,158 @@
+# coding: utf-8
+
+r"""Tracking of the files the Parts of an Assembly come from
+
+Each Part created by one of the Part.from_* constructors records its Origin:
+the constructor, its arguments and the files it read. The DependencyTracker
+maps these files to the Parts of the tracked assemblies, so that a change of
+a file only rebuilds the Parts that depend on it and places again the nodes
+placed on them, instead of running the assembly script and building the
+whole assembly again.
+
+"""
+
+import logging
+from os.path import abspath
+
+from osvcad.stepzip import read_anchors
+
+logger = logging.getLogger(__name__)
+
+
+class Origin(object):
+    r"""How a Part was created
+
+    Parameters
+    ----------
+    constructor : str
+        Name of the Part class method that created the Part
+    arguments : dict
+        Keyword arguments of the constructor
+    files : list[str]
+        Files read by the constructor
+    anchors_file : str or None, optional (default is None)
+        File the anchors were read from, if it is not one of files. A change
+        of the anchors file only reads the anchors again
+
+    """
+    def __init__(self, constructor, arguments, files, anchors_file=None):
+        self.constructor = constructor
+        self.arguments = arguments
+        self.files = [abspath(f) for f in files]
+        self.anchors_file = abspath(anchors_file) \
+            if anchors_file is not None else None
+
+    @property
+    def key(self):
+        r"""The Parts with the same key are the same source Part"""
+        return self.constructor, repr(sorted(self.arguments.items()))
+
+    def __repr__(self):
+        return "%s(%s)" % (self.constructor,
+                           ", ".join("%s=%r" % item
+                                     for item in sorted(self.arguments.items())))
+
+
+class DependencyTracker(object):
+    r"""Files -> Parts of the tracked assemblies"""
+    def __init__(self):
+        # file path -> list of chains [assembly, sub-assembly, ..., part]
+        self._dependents = dict()
+
+    def track(self, assembly):
+        r"""Record the files the Parts of an assembly depend on
+
+        Parameters
+        ----------
+        assembly : Assembly
+
+        """
+        for chain in self._chains(assembly, [assembly]):
+            origin = chain[-1].origin
+            files = list(origin.files)
+            if origin.anchors_file is not None:
+                files.append(origin.anchors_file)
+            for path in files:
+                self._dependents.setdefault(path, list()).append(chain)
+
+    def forget(self, assembly):
+        r"""Stop tracking an assembly"""
+        for path in list(self._dependents.keys()):
+            chains = [chain for chain in self._dependents[path]
+                      if chain[0] is not assembly]
+            if len(chains) > 0:
+                self._dependents[path] = chains
+            else:
+                del self._dependents[path]
+
+    def _chains(self, assembly, chain):
+        for node in assembly.nodes():
+            if hasattr(node, "leaves"):
+                for sub_chain in self._chains(node, chain + [node]):
+                    yield sub_chain
+            elif getattr(node, "origin", None) is not None:
+                yield chain + [node]
+
+    def dependents(self, path):
+        r"""The Parts that depend on a file
+
+        Parameters
+        ----------
+        path : str
+
+        Returns
+        -------
+        list[list] : chains [assembly, sub-assembly, ..., part]
+
+        """
+        return list(self._dependents.get(abspath(path), list()))
+
+    def rebuild(self, path):
+        r"""Rebuild the Parts that depend on a changed file and place again
+        the nodes placed on them
+
+        The Parts that share an origin are rebuilt once and share their new
+        source shape.
+
+        Parameters
+        ----------
+        path : str
+            The changed file
+
+        Returns
+        -------
+        list[Assembly] : the tracked assemblies that have been updated
+
+        """
+        path = abspath(path)
+        chains = self.dependents(path)
+        rebuilt = dict()  # origin key -> (source shape, source anchors)
+        updated = list()
+        for chain in chains:
+            part = chain[-1]
+            origin = part.origin
+            if origin.key not in rebuilt:
+                if path == origin.anchors_file:
+                    logger.info("Reading the anchors of %s again" % origin)
+                    rebuilt[origin.key] = (part.source_shape,
+                                           read_anchors(path))
+                else:
+                    logger.info("Rebuilding %s" % origin)
+                    for origin_file in origin.files:
+                        type(part).invalidate(origin_file)
+                    new_part = getattr(type(part),
+                                       origin.constructor)(**origin.arguments)
+                    rebuilt[origin.key] = (new_part.source_shape,
+                                           new_part.source_anchors)
+            part.replace_source(*rebuilt[origin.key])
+
+            # place again from the part up to the top assembly
+            node = part
+            for assembly in reversed(chain[:-1]):
+                assembly.update_placements(node)
+                node = assembly
+            if not any(chain[0] is assembly for assembly in updated):
+                updated.append(chain[0])
+        logger.info("%i parts depending on %s rebuilt in %i assemblies" %
+                    (len(chains), path, len(updated)))
+        return updated
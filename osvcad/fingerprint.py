@@ -0,0 +1,350 @@
+# coding: utf-8
+
+r"""Geometric fingerprints of shapes
+
+The content hash of a shape (see osvcad.brep.shape_hash()) changes as soon as
+the shape is exported again or moved. The fingerprint of a shape is made of
+quantities that do not depend on its placement: volume, area, principal
+moments of inertia and numbers of topological entities, quantized and hashed
+into the invariant digest. The placed digest adds the centre of mass and the
+principal axes.
+
+Two shapes with the same invariant digest are candidates to be copies of each
+other, or mirror images (e.g. the ARCHLEFT and ARCHRIGHT parts of a chassis):
+alignment() finds the rotation or the reflection that takes one onto the other
+by matching their principal frames and checks it on their vertices. The
+aligned shapes can then share their tessellation (see
+osvcad.mesh.mesh_parts()), their mass properties (see osvcad.mass_properties)
+and their cache entries.
+
+The quantization puts the values in buckets of DIGITS significant digits:
+two values on either side of a rounding boundary (e.g. 1.2345649 and
+1.2345651) fall in different buckets although they differ by much less than
+the precision. The copies of a shape whose volume, area or moments are that
+close to a boundary are not recognized (they are then meshed separately), but
+two different shapes are never aligned: alignment() checks the vertices.
+
+"""
+
+import hashlib
+import logging
+from itertools import product
+
+import numpy as np
+from OCC.Core.BRep import BRep_Tool_Pnt
+from OCC.Core.BRepGProp import brepgprop_VolumeProperties, \
+    brepgprop_SurfaceProperties
+from OCC.Core.GProp import GProp_GProps
+from OCC.Core.TopAbs import TopAbs_SOLID, TopAbs_SHELL, TopAbs_FACE, \
+    TopAbs_EDGE, TopAbs_VERTEX
+from OCC.Core.TopExp import topexp_MapShapes
+from OCC.Core.TopoDS import topods_Vertex
+from OCC.Core.TopTools import TopTools_IndexedMapOfShape
+
+from osvcad.brep import topods_shape, memoize_by_shape
+
+logger = logging.getLogger(__name__)
+
+# Significant digits kept by the quantization
+DIGITS = 6
+
+# Distance (relative to the size of the shapes) under which 2 vertices match
+ALIGNMENT_TOLERANCE = 1e-4
+
+# Number of shapes whose fingerprints are kept in memory
+FINGERPRINT_CACHE_SIZE = 1024
+
+_TOPOLOGY = (("solids", TopAbs_SOLID),
+             ("shells", TopAbs_SHELL),
+             ("faces", TopAbs_FACE),
+             ("edges", TopAbs_EDGE),
+             ("vertices", TopAbs_VERTEX))
+
+
+def quantize(value, digits=DIGITS):
+    r"""Text of a value rounded to a number of significant digits
+
+    Values closer than the precision can still round differently, if they
+    are on either side of a rounding boundary.
+
+    """
+    if value == 0.:
+        return "0"
+    return "%.*e" % (digits - 1, value)
+
+
+class Fingerprint(object):
+    r"""Geometric fingerprint of a shape
+
+    Parameters
+    ----------
+    volume : float
+    area : float
+    centre : np.ndarray
+        (3,) centre of mass
+    moments : np.ndarray
+        (3,) principal moments of inertia, in increasing order
+    axes : np.ndarray
+        3x3 matrix whose columns are the principal axes
+    counts : dict[str, int]
+        Numbers of solids, shells, faces, edges and vertices
+    vertices : np.ndarray
+        (n, 3) coordinates of the vertices, to check the alignments
+    digits : int, optional (default is DIGITS)
+
+    """
+    def __init__(self, volume, area, centre, moments, axes, counts, vertices,
+                 digits=DIGITS):
+        self.volume = volume
+        self.area = area
+        self.centre = centre
+        self.moments = moments
+        self.axes = axes
+        self.counts = counts
+        self.vertices = vertices
+        self.digits = digits
+
+    @property
+    def size(self):
+        r"""Largest distance from the centre of mass to a vertex (radius of
+        gyration if the shape has no vertex)"""
+        if self.vertices.shape[0] > 0:
+            return float(np.max(np.linalg.norm(self.vertices - self.centre,
+                                                axis=1)))
+        if self.volume != 0.:
+            return float(np.sqrt(abs(self.moments[-1] / self.volume)))
+        return 0.
+
+    @property
+    def invariant(self):
+        r"""Quantized quantities that do not depend on the placement, nor on
+        a mirroring"""
+        return tuple([quantize(self.volume, self.digits),
+                      quantize(self.area, self.digits)] +
+                     [quantize(moment, self.digits)
+                      for moment in self.moments] +
+                     ["%i" % self.counts[name] for name, _ in _TOPOLOGY])
+
+    @property
+    def invariant_digest(self):
+        r"""Hash of the invariant quantities"""
+        return hashlib.sha1("|".join(self.invariant).encode("utf-8")) \
+            .hexdigest()
+
+    @property
+    def placed_digest(self):
+        r"""Hash of the invariant quantities, of the centre of mass and of
+        the principal axes"""
+        # positions are quantized relative to the size of the shape
+        step = max(self.size, 1e-12) * 10. ** (1 - self.digits)
+        placed = ["%i" % round(c / step) for c in self.centre]
+        for axis in self.axes.T:
+            # an axis and its opposite are the same principal axis
+            axis = axis if axis[np.argmax(np.abs(axis))] > 0 else -axis
+            placed.extend(quantize(round(c, self.digits - 1), self.digits)
+                          for c in axis)
+        return hashlib.sha1("|".join(self.invariant + tuple(placed))
+                            .encode("utf-8")).hexdigest()
+
+    def __repr__(self):
+        return "Fingerprint %s (volume %s, area %s, %i faces)" % \
+               (self.invariant_digest[:12],
+                quantize(self.volume, self.digits),
+                quantize(self.area, self.digits),
+                self.counts["faces"])
+
+
+def _topology(occ_shape):
+    r"""Numbers of distinct topological entities and vertex coordinates"""
+    counts = dict()
+    vertices = np.zeros((0, 3))
+    for name, type_ in _TOPOLOGY:
+        entities = TopTools_IndexedMapOfShape()
+        topexp_MapShapes(occ_shape, type_, entities)
+        counts[name] = entities.Extent()
+        if type_ == TopAbs_VERTEX and entities.Extent() > 0:
+            vertices = np.array(
+                [BRep_Tool_Pnt(topods_Vertex(entities.FindKey(i))).Coord()
+                 for i in range(1, entities.Extent() + 1)])
+    return counts, vertices
+
+
+@memoize_by_shape(FINGERPRINT_CACHE_SIZE)
+def shape_fingerprint(shape, digits=DIGITS):
+    r"""Geometric fingerprint of a shape
+
+    The results are memoized by shape identity.
+
+    Parameters
+    ----------
+    shape : ccad.model.Shape or TopoDS_Shape
+    digits : int, optional (default is DIGITS)
+        Significant digits kept by the quantization
+
+    Returns
+    -------
+    Fingerprint
+
+    """
+    occ_shape = topods_shape(shape)
+    volume_properties = GProp_GProps()
+    brepgprop_VolumeProperties(occ_shape, volume_properties)
+    surface_properties = GProp_GProps()
+    brepgprop_SurfaceProperties(occ_shape, surface_properties)
+
+    centre = volume_properties.CentreOfMass()
+    # matrix of inertia at the centre of mass
+    inertia = volume_properties.MatrixOfInertia()
+    moments, axes = np.linalg.eigh(np.array([[inertia.Value(i, j)
+                                              for j in range(1, 4)]
+                                             for i in range(1, 4)]))
+    counts, vertices = _topology(occ_shape)
+    return Fingerprint(volume_properties.Mass(),
+                       surface_properties.Mass(),
+                       np.array(centre.Coord()),
+                       moments,
+                       axes,
+                       counts,
+                       vertices,
+                       digits)
+
+
+def _covered(points, others, tolerance, chunk_size=64):
+    r"""Does each point have a point of others closer than tolerance?"""
+    for start in range(0, points.shape[0], chunk_size):
+        chunk = points[start:start + chunk_size]
+        distances = ((chunk[:, None, :] - others[None, :, :]) ** 2).sum(-1)
+        if distances.min(axis=1).max() > tolerance ** 2:
+            return False
+    return True
+
+
+def _same_points(points, others, tolerance):
+    r"""Does each point have a point of others closer than tolerance, and
+    conversely?
+
+    The same number of points is not enough to skip the converse check:
+    several points can be close to the same point of others.
+
+    """
+    if points.shape != others.shape:
+        return False
+    if points.shape[0] == 0:
+        return True
+    return _covered(points, others, tolerance) and \
+        _covered(others, points, tolerance)
+
+
+def alignment(source, target, tolerance=ALIGNMENT_TOLERANCE):
+    r"""Matrix that takes a shape onto another one
+
+    The principal frames of the shapes are matched, the rotations being tried
+    before the reflections, and the result is checked on the vertices. The
+    shapes whose principal moments are not distinct (e.g. a cylinder) have no
+    unique principal frame: they are only aligned if the identity
+    orientation works.
+
+    Parameters
+    ----------
+    source, target : Fingerprint
+    tolerance : float, optional (default is ALIGNMENT_TOLERANCE)
+        Relative to the size of the shapes
+
+    Returns
+    -------
+    np.ndarray or None
+        4x4 matrix, with a negative determinant if the target is a mirror
+        image of the source. None if the shapes do not match
+
+    """
+    if source.invariant_digest != target.invariant_digest:
+        return None
+    distance = tolerance * max(source.size, target.size)
+    source_points = source.vertices - source.centre
+    target_points = target.vertices - target.centre
+
+    rotations = [np.identity(3)]
+    for signs in product((1., -1.), repeat=3):
+        rotation = np.dot(target.axes * np.array(signs), source.axes.T)
+        rotations.append(rotation)
+    # proper rotations first
+    rotations.sort(key=lambda r: np.linalg.det(r) < 0)
+    for rotation in rotations:
+        if _same_points(np.dot(source_points, rotation.T), target_points,
+                        distance):
+            matrix = np.identity(4)
+            matrix[:3, :3] = rotation
+            matrix[:3, 3] = target.centre - np.dot(rotation, source.centre)
+            return matrix
+    return None
+
+
+def is_mirror(source, target, tolerance=ALIGNMENT_TOLERANCE):
+    r"""Is a shape a mirror image (and not a copy) of another one?
+
+    Parameters
+    ----------
+    source, target : Fingerprint
+    tolerance : float, optional (default is ALIGNMENT_TOLERANCE)
+
+    Returns
+    -------
+    bool
+
+    """
+    matrix = alignment(source, target, tolerance)
+    return matrix is not None and np.linalg.det(matrix[:3, :3]) < 0
+
+
+def group_fingerprints(fingerprints, tolerance=ALIGNMENT_TOLERANCE):
+    r"""Group the copies and mirror images among fingerprints
+
+    Parameters
+    ----------
+    fingerprints : dict
+        key -> Fingerprint
+    tolerance : float, optional (default is ALIGNMENT_TOLERANCE)
+
+    Returns
+    -------
+    dict : key -> (prototype key, 4x4 matrix that takes the prototype shape
+        onto the shape). The prototypes map to themselves with the identity
+
+    """
+    groups = dict()
+    # invariant digest -> prototype keys
+    prototypes = dict()
+    for key, fingerprint in fingerprints.items():
+        for prototype in prototypes.get(fingerprint.invariant_digest, []):
+            matrix = alignment(fingerprints[prototype], fingerprint,
+                               tolerance)
+            if matrix is not None:
+                groups[key] = (prototype, matrix)
+                break
+        else:
+            prototypes.setdefault(fingerprint.invariant_digest,
+                                  list()).append(key)
+            groups[key] = (key, np.identity(4))
+    logger.info("%i shapes, %i distinct up to placement and mirroring" %
+                (len(fingerprints),
+                 sum(len(keys) for keys in prototypes.values())))
+    return groups
+
+
+def group_shapes(shapes, tolerance=ALIGNMENT_TOLERANCE):
+    r"""Group the copies and mirror images of shapes
+
+    Parameters
+    ----------
+    shapes : dict
+        key -> ccad.model.Shape or TopoDS_Shape
+    tolerance : float, optional (default is ALIGNMENT_TOLERANCE)
+
+    Returns
+    -------
+    dict : see group_fingerprints()
+
+    """
+    return group_fingerprints(
+        dict((key, shape_fingerprint(shape)) for key, shape in shapes.items()),
+        tolerance)
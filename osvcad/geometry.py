@@ -16,6 +16,8 @@ import logging
 import numpy as np
 
 from OCC.Core.TopoDS import TopoDS_Builder, TopoDS_Compound
+from OCC.Core.TopLoc import TopLoc_Location
+from OCC.Core.gp import gp_Trsf
 from ccad.model import Solid, Shape
 
 from osvcad.transformations import translation_matrix, rotation_matrix,\
@@ -170,6 +172,63 @@ def transform_anchor(anchor, transformation_matrix):
             "direction": (new_dx, new_dy, new_dz)}
 
 
+def homogeneous(transformation_matrix):
+    r"""Complete a 4 x 3 transformation matrix into a 4x4 homogeneous matrix
+
+    Parameters
+    ----------
+    transformation_matrix : np.ndarray
+        4 x 3 (or already 4x4) transformation matrix
+
+    Returns
+    -------
+    np.ndarray : 4x4 transformation matrix
+
+    """
+    matrix = np.identity(4)
+    matrix[:3] = np.asarray(transformation_matrix, dtype=float)[:3]
+    return matrix
+
+
+def location_from_matrix(matrix):
+    r"""OCC location from a transformation matrix
+
+    Parameters
+    ----------
+    matrix : np.ndarray
+        4x4 or 3x4 transformation matrix
+
+    Returns
+    -------
+    TopLoc_Location
+
+    """
+    trsf = gp_Trsf()
+    trsf.SetValues(*[float(v) for v in
+                     np.asarray(matrix, dtype=float)[:3, :4].flatten()])
+    return TopLoc_Location(trsf)
+
+
+def matrix_from_location(location):
+    r"""Transformation matrix of an OCC location
+
+    Parameters
+    ----------
+    location : TopLoc_Location
+
+    Returns
+    -------
+    np.ndarray : 4x4 transformation matrix
+
+    """
+    trsf = location.Transformation()
+    matrix = np.identity(4)
+    for row in range(3):
+        for column in range(4):
+            matrix[row, column] = trsf.Value(row + 1, column + 1)
+    return matrix
+
+
 def compound(shapes):
     r"""Accumulate a bunch of ccad.model.Solid in list `topo`
     to a TopoDS_Compound used to build a ccad.model.Solid
@@ -0,0 +1,157 @@
+# coding: utf-8
+
+r"""Export of Assemblies to binary glTF (GLB)
+
+Each distinct source mesh is written once in the binary buffer and each
+placed Part is a glTF node that references it with its world matrix
+(instancing). The layout of the buffer is computed from the array sizes
+before anything is written, so that the meshes are streamed to the file one
+after the other instead of assembling the whole scene in memory.
+
+"""
+
+import json
+import logging
+import struct
+
+import numpy as np
+
+from osvcad.mesh import mesh_parts
+from osvcad.mesh_cache import MeshCache
+
+logger = logging.getLogger(__name__)
+
+_GLB_MAGIC = b"glTF"
+_GLB_VERSION = 2
+_CHUNK_JSON = 0x4E4F534A
+_CHUNK_BIN = 0x004E4942
+
+_FLOAT = 5126
+_UNSIGNED_INT = 5125
+_ARRAY_BUFFER = 34962
+_ELEMENT_ARRAY_BUFFER = 34963
+_TRIANGLES = 4
+
+
+def _padded(length):
+    r"""Length rounded up to a multiple of 4 bytes"""
+    return (length + 3) & ~3
+
+
+def _gltf_document(mesh_set, unit_scale, triangle_budget=None):
+    r"""The glTF JSON document and the arrays of the binary buffer, in the
+    order of their buffer views"""
+    keys = list()
+    for _, _, key in mesh_set.instances:
+        if key not in keys:
+            keys.append(key)
+
+    buffer_views, accessors, meshes, arrays = list(), list(), list(), list()
+    offset = 0
+    mesh_indices = dict()
+    selected = mesh_set.selected(triangle_budget)
+    for key in keys:
+        mesh = selected[key]
+        if mesh.nb_triangles == 0:
+            logger.warning("Empty mesh %s not exported" % key)
+            continue
+        vertices = np.ascontiguousarray(mesh.vertices, dtype="<f4")
+        triangles = np.ascontiguousarray(mesh.triangles, dtype="<u4")
+        for array, target in ((vertices, _ARRAY_BUFFER),
+                              (triangles, _ELEMENT_ARRAY_BUFFER)):
+            buffer_views.append({"buffer": 0,
+                                 "byteOffset": offset,
+                                 "byteLength": array.nbytes,
+                                 "target": target})
+            arrays.append(array)
+            offset += _padded(array.nbytes)
+        minimum, maximum = mesh.bounding_box
+        accessors.append({"bufferView": len(buffer_views) - 2,
+                          "componentType": _FLOAT,
+                          "count": int(vertices.shape[0]),
+                          "type": "VEC3",
+                          "min": [float(v) for v in minimum],
+                          "max": [float(v) for v in maximum]})
+        accessors.append({"bufferView": len(buffer_views) - 1,
+                          "componentType": _UNSIGNED_INT,
+                          "count": int(triangles.size),
+                          "type": "SCALAR"})
+        mesh_indices[key] = len(meshes)
+        meshes.append({"name": key,
+                       "primitives": [{"attributes": {
+                                           "POSITION": len(accessors) - 2},
+                                       "indices": len(accessors) - 1,
+                                       "mode": _TRIANGLES}]})
+
+    nodes = [{"name": "root",
+              "scale": [unit_scale] * 3,
+              "children": list()}]
+    for i, (part, matrix, key) in enumerate(mesh_set.instances):
+        if key not in mesh_indices:
+            continue
+        node = {"mesh": mesh_indices[key],
+                # glTF matrices are column-major
+                "matrix": [float(v) for v in np.asarray(matrix).T.flatten()]}
+        name = getattr(part, "instance_id", None)
+        node["name"] = name if name is not None else "part_%i" % i
+        nodes[0]["children"].append(len(nodes))
+        nodes.append(node)
+
+    document = {"asset": {"version": "2.0", "generator": "osvcad"},
+                "scene": 0,
+                "scenes": [{"nodes": [0]}],
+                "nodes": nodes,
+                "meshes": meshes,
+                "accessors": accessors,
+                "bufferViews": buffer_views,
+                "buffers": [{"byteLength": offset}]}
+    return document, arrays
+
+
+def write_glb(nodes, glb_file_path, mesh_set=None, unit_scale=0.001,
+              triangle_budget=None, **mesh_parameters):
+    r"""Write an Assembly (or a list of Parts) to a GLB file
+
+    Parameters
+    ----------
+    nodes : Assembly or list[Part]
+    glb_file_path : str
+    mesh_set : osvcad.mesh.MeshSet or None, optional (default is None)
+        Already computed meshes of nodes. If None, the meshes are computed by
+        osvcad.mesh.mesh_parts() with mesh_parameters, through the mesh cache
+        in osvcad.mesh_cache.DEFAULT_DIRECTORY unless a cache is given
+        (cache=None disables it)
+    unit_scale : float, optional (default is 0.001)
+        Scale of the root node. glTF works in meters and the default converts
+        from millimeters
+    triangle_budget : int or None, optional (default is None)
+        With levels of detail, maximum number of triangles of all the
+        instances (see osvcad.mesh.select_lods()). None writes the finest
+        levels
+    mesh_parameters
+        Keyword parameters of osvcad.mesh.mesh_parts()
+
+    """
+    if mesh_set is None:
+        if "cache" not in mesh_parameters:
+            mesh_parameters["cache"] = MeshCache()
+        mesh_set = mesh_parts(nodes, **mesh_parameters)
+    document, arrays = _gltf_document(mesh_set, unit_scale, triangle_budget)
+
+    json_chunk = json.dumps(document, separators=(",", ":")).encode("utf-8")
+    json_chunk += b" " * (_padded(len(json_chunk)) - len(json_chunk))
+    bin_length = document["buffers"][0]["byteLength"]
+    total_length = 12 + 8 + len(json_chunk) + 8 + bin_length
+
+    with open(glb_file_path, "wb") as f:
+        f.write(struct.pack("<4sII", _GLB_MAGIC, _GLB_VERSION, total_length))
+        f.write(struct.pack("<II", len(json_chunk), _CHUNK_JSON))
+        f.write(json_chunk)
+        f.write(struct.pack("<II", bin_length, _CHUNK_BIN))
+        for array in arrays:
+            f.write(memoryview(array).cast("B"))
+            f.write(b"\0" * (_padded(array.nbytes) - array.nbytes))
+    logger.info("%i meshes and %i nodes written to %s" %
+                (len(document["meshes"]),
+                 len(document["nodes"]) - 1,
+                 glb_file_path))
@@ -0,0 +1,85 @@
+# coding: utf-8
+
+r"""Layout of assembly graphs
+
+The hierarchical layout puts the root of the assembly at the top and each
+node one level below the node it is placed on, which reads like the placement
+order of the assembly. It is computed in linear time and cached per graph.
+
+"""
+
+import logging
+from weakref import WeakKeyDictionary
+
+logger = logging.getLogger(__name__)
+
+# graph -> (graph and root signature, positions)
+_layouts = WeakKeyDictionary()
+
+
+def hierarchical_layout(graph, root=None):
+    r"""Tree layout of a directed graph
+
+    The leaves are spread on consecutive columns and each node is centred
+    above the nodes placed on it. A node with several predecessors is
+    placed under the first one that reaches it. The nodes that cannot be
+    reached from the root are laid out as other trees, on the right.
+
+    Parameters
+    ----------
+    graph : nx.DiGraph
+    root : node or None, optional (default is None)
+        The top node. None for graph.root if it exists, otherwise for the
+        first node without predecessor
+
+    Returns
+    -------
+    dict : node -> (x, y)
+
+    """
+    if root is None:
+        root = getattr(graph, "root", None)
+    nodes = list(graph.nodes())
+    signature = (len(nodes), tuple(graph.edges()), root)
+    if graph in _layouts and _layouts[graph][0] == signature:
+        return _layouts[graph][1]
+
+    roots = [root] if root is not None else list()
+    roots.extend(node for node in nodes
+                 if node is not root and graph.in_degree(node) == 0)
+
+    positions = dict()
+    next_column = [0.]
+
+    def place(node, depth):
+        # iterative depth first traversal: deep assemblies do not hit the
+        # recursion limit
+        stack = [(node, depth, False)]
+        while len(stack) > 0:
+            current, level, children_done = stack.pop()
+            if children_done is True:
+                children = [child for child in graph.successors(current)
+                            if positions.get(child, (None, None, None))[2]
+                            is current]
+                if len(children) == 0:
+                    x = next_column[0]
+                    next_column[0] += 1.
+                else:
+                    x = sum(positions[child][0]
+                            for child in children) / len(children)
+                positions[current] = (x, -float(level), positions[current][2])
+                continue
+            stack.append((current, level, True))
+            for child in reversed(list(graph.successors(current))):
+                if child not in positions:
+                    positions[child] = (None, None, current)
+                    stack.append((child, level + 1, False))
+
+    for node in roots + nodes:
+        if node not in positions:
+            positions[node] = (None, None, None)
+            place(node, 0)
+
+    layout = dict((node, (x, y)) for node, (x, y, _) in positions.items())
+    _layouts[graph] = (signature, layout)
+    return layout
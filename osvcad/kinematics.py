@@ -0,0 +1,126 @@
+# coding: utf-8
+
+r"""Kinematics of anchor constraints
+
+A ConstraintAnchor places its slave node by putting the anchors in opposition
+and then by rotating the slave by the constraint angle around the master
+anchor and translating it by the constraint distance along the master
+anchor. Only this last step depends on the angle and on the distance, so
+changing them moves the slave (and everything placed on it) by a rigid
+transformation that only depends on the master anchor: the assembly does not
+have to be built again to animate a constraint.
+
+"""
+
+import logging
+
+import networkx as nx
+import numpy as np
+
+from osvcad.transformations import translation_matrix, rotation_matrix
+
+logger = logging.getLogger(__name__)
+
+
+def anchor_motion_matrix(anchor, angle=0., distance=0.):
+    r"""4x4 matrix of the rotation around an anchor and the translation
+    along it that a ConstraintAnchor applies after the anchors opposition
+
+    Parameters
+    ----------
+    anchor : dict
+        The master anchor, with at least the position and direction keys
+    angle : float, optional (default is 0.)
+        Angle in degrees
+    distance : float, optional (default is 0.)
+
+    Returns
+    -------
+    np.ndarray : 4x4 transformation matrix
+
+    """
+    position = np.array(anchor["position"], dtype=float)
+    direction = np.array(anchor["direction"], dtype=float)
+    unit_direction = direction / np.linalg.norm(direction)
+    return np.dot(translation_matrix(position + unit_direction * distance),
+                  np.dot(rotation_matrix(np.radians(angle), direction),
+                         translation_matrix(-position)))
+
+
+class ConstraintSweep(object):
+    r"""Placements of the parts moved by a ConstraintAnchor of a built
+    Assembly when its angle or distance changes
+
+    The assembly is not modified: the new world matrices are computed from
+    the matrices of the built assembly, for the slave node and its
+    descendants only.
+
+    Parameters
+    ----------
+    assembly : Assembly
+    master, slave : GeometryNode
+        The nodes linked by the ConstraintAnchor
+
+    """
+    def __init__(self, assembly, master, slave):
+        assembly.build()
+        constraint = assembly.get_edge_data(master, slave)["object"]
+        self.constraint = constraint
+        self.anchor = master.anchors[constraint.anchor_name_master]
+        self._built_motion_inverse = np.linalg.inv(
+            anchor_motion_matrix(self.anchor,
+                                 constraint.angle,
+                                 constraint.distance))
+
+        # world matrices of the leaves of the moved nodes, stacked per node
+        self.moved = [slave] + [node for node in nx.descendants(assembly,
+                                                                slave)]
+        self._matrices = list()
+        for node in self.moved:
+            if hasattr(node, "leaves"):
+                matrices = [np.dot(node.matrix, matrix)
+                            for _, matrix in node.leaves()]
+            else:
+                matrices = [node.matrix]
+            self._matrices.append(np.array(matrices, dtype=float))
+
+    def delta(self, angle=None, distance=None):
+        r"""Rigid transformation from the built placement of the slave to its
+        placement for a new angle and/or distance
+
+        Parameters
+        ----------
+        angle : float or None, optional (default is None)
+            New angle of the constraint in degrees, None to keep the angle
+        distance : float or None, optional (default is None)
+            New distance of the constraint, None to keep the distance
+
+        Returns
+        -------
+        np.ndarray : 4x4 transformation matrix
+
+        """
+        if angle is None:
+            angle = self.constraint.angle
+        if distance is None:
+            distance = self.constraint.distance
+        return np.dot(anchor_motion_matrix(self.anchor, angle, distance),
+                      self._built_motion_inverse)
+
+    def matrices(self, angle=None, distance=None):
+        r"""World matrices of the moved nodes leaves
+
+        Parameters
+        ----------
+        angle, distance : see delta()
+
+        Returns
+        -------
+        list[tuple(GeometryNode, np.ndarray)]
+            Each moved node and the (k, 4, 4) world matrices of its leaves, in
+            the order of node.leaves() for a sub-assembly
+
+        """
+        delta = self.delta(angle, distance)
+        return [(node, np.matmul(delta, matrices))
+                for node, matrices in zip(self.moved, self._matrices)]
@@ -0,0 +1,146 @@
+# coding: utf-8
+
+r"""Preview of parts libraries
+
+A parts library (json file) is previewed as a grid of its parts. Each part is
+loaded once (see Part.from_library_part) and its bounding box is cached, and
+the grid is laid out part after part so that the parts can be displayed as
+soon as they are loaded.
+
+"""
+
+import json
+import logging
+from math import sqrt
+from os.path import getmtime
+
+from aocutils.analyze.bounds import BoundingBox
+
+from osvcad.nodes import Part
+
+logger = logging.getLogger(__name__)
+
+# bounding boxes cache : (library file, part id) ->
+# (library file modification time, (min corner, max corner))
+_bounding_boxes = dict()
+
+
+def library_part_ids(library_file_path):
+    r"""Identifiers of the parts of a library
+
+    Parameters
+    ----------
+    library_file_path : str
+
+    Returns
+    -------
+    list[str]
+
+    """
+    with open(library_file_path) as json_file:
+        return list(json.load(json_file)["data"].keys())
+
+
+def library_part_bounding_box(library_file_path, part_id, part):
+    r"""Cached bounding box of a library part
+
+    Parameters
+    ----------
+    library_file_path : str
+    part_id : str
+    part : Part
+        The part created from the library part
+
+    Returns
+    -------
+    tuple(tuple, tuple) : minimum and maximum corners
+
+    """
+    key = (library_file_path, part_id)
+    mtime = getmtime(library_file_path)
+    if key in _bounding_boxes and _bounding_boxes[key][0] == mtime:
+        return _bounding_boxes[key][1]
+    bb = BoundingBox(part.node_shape.shape)
+    corners = ((bb.x_min, bb.y_min, bb.z_min), (bb.x_max, bb.y_max, bb.z_max))
+    _bounding_boxes[key] = (mtime, corners)
+    return corners
+
+
+def load_library(library_file_path):
+    r"""Load the parts of a library, one at a time
+
+    Parameters
+    ----------
+    library_file_path : str
+
+    Returns
+    -------
+    generator of tuple(str, Part, tuple(tuple, tuple))
+        Part id, Part and bounding box of each library part
+
+    """
+    for part_id in library_part_ids(library_file_path):
+        part = Part.from_library_part(library_file_path, part_id)
+        yield part_id, part, library_part_bounding_box(library_file_path,
+                                                       part_id,
+                                                       part)
+
+
+class ShelfLayout(object):
+    r"""Row by row layout of bounding boxes in the XY plane
+
+    The position of a box only depends on the boxes placed before it, so
+    the parts can be displayed while the next ones are still loading.
+
+    Parameters
+    ----------
+    nb_per_row : int
+        Number of boxes on a row
+    gap_ratio : float, optional (default is 0.5)
+        Gap between boxes, relative to the size of the largest box so far
+
+    """
+    def __init__(self, nb_per_row, gap_ratio=0.5):
+        self.nb_per_row = max(1, nb_per_row)
+        self.gap_ratio = gap_ratio
+        self._nb_placed = 0
+        self._x = 0.
+        self._y = 0.
+        self._row_height = 0.
+        self._largest = 0.
+
+    @classmethod
+    def square(cls, nb_boxes, gap_ratio=0.5):
+        r"""A layout with about as many rows as columns"""
+        return cls(int(sqrt(nb_boxes)), gap_ratio)
+
+    def place(self, minimum, maximum):
+        r"""Translation that puts a box at its place in the layout
+
+        Parameters
+        ----------
+        minimum, maximum : tuple
+            Corners of the bounding box
+
+        Returns
+        -------
+        tuple(float, float, float)
+
+        """
+        x_span = maximum[0] - minimum[0]
+        y_span = maximum[1] - minimum[1]
+        self._largest = max(self._largest, x_span, y_span)
+        gap = self.gap_ratio * self._largest
+
+        if self._nb_placed > 0 and self._nb_placed % self.nb_per_row == 0:
+            # next row
+            self._x = 0.
+            self._y += self._row_height + gap
+            self._row_height = 0.
+
+        translation = (self._x - minimum[0], self._y - minimum[1], 0.)
+
+        self._x += x_span + gap
+        self._row_height = max(self._row_height, y_span)
+        self._nb_placed += 1
+        return translation
@@ -0,0 +1,141 @@
+# coding: utf-8
+
+r"""Cached mass properties of Parts and Assemblies
+
+The volume integration of a shape is expensive, so it is only done once per
+source shape: the centre of mass of a placed Part is the centre of mass of its
+source shape transformed by the Part matrix, and the properties of an
+Assembly are combined from the properties of its Parts.
+
+The volume and the centre of mass come from the geometric fingerprint of the
+shape (see osvcad.fingerprint), whose volume integration is shared with the
+meshing. The properties are kept per fingerprint prototype: a copy or a
+mirror image of a known shape (e.g. the same part exported again, or moved)
+gets the properties of the prototype, its centre of mass transformed by the
+alignment matrix.
+
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from aocutils.analyze.bounds import BoundingBox
+
+from osvcad.brep import topods_shape, memoize_by_shape
+from osvcad.fingerprint import shape_fingerprint, alignment
+
+logger = logging.getLogger(__name__)
+
+# Number of source shapes whose properties are kept in memory
+PROPERTIES_CACHE_SIZE = 1024
+
+# invariant digest -> list of (prototype fingerprint, properties)
+_prototypes = OrderedDict()
+_prototypes_lock = threading.Lock()
+
+
+def _prototype_properties(fingerprint):
+    r"""Properties of a known prototype of a fingerprint, placed by the
+    alignment matrix, or None"""
+    with _prototypes_lock:
+        candidates = list(_prototypes.get(fingerprint.invariant_digest, []))
+    for prototype, (volume, centre, dimension) in candidates:
+        matrix = alignment(prototype, fingerprint)
+        if matrix is not None:
+            return volume, np.dot(matrix[:3, :3], centre) + matrix[:3, 3], \
+                dimension
+    return None
+
+
+def _add_prototype(fingerprint, properties):
+    with _prototypes_lock:
+        _prototypes.setdefault(fingerprint.invariant_digest,
+                               list()).append((fingerprint, properties))
+        _prototypes.move_to_end(fingerprint.invariant_digest)
+        if len(_prototypes) > PROPERTIES_CACHE_SIZE:
+            _prototypes.popitem(last=False)
+
+
+@memoize_by_shape(PROPERTIES_CACHE_SIZE)
+def shape_mass_properties(shape):
+    r"""Volume, centre of mass and characteristic dimension of a shape
+
+    The results are memoized by shape identity, and shared by the copies and
+    mirror images of a shape. The characteristic dimension of a copy is the
+    one of its prototype.
+
+    Parameters
+    ----------
+    shape : ccad.model.Shape or TopoDS_Shape
+
+    Returns
+    -------
+    tuple(float, np.ndarray, float)
+        Volume, centre of mass (3,) and mean of the bounding box spans
+
+    """
+    fingerprint = shape_fingerprint(shape)
+    properties = _prototype_properties(fingerprint)
+    if properties is None:
+        bb = BoundingBox(topods_shape(shape))
+        properties = (fingerprint.volume,
+                      fingerprint.centre,
+                      (bb.x_span + bb.y_span + bb.z_span) / 3.)
+        _add_prototype(fingerprint, properties)
+    return properties
+
+
+def combined_mass_properties(leaves):
+    r"""Mass properties of placed Parts
+
+    Parameters
+    ----------
+    leaves : list[tuple(Part, np.ndarray)]
+        Parts and the 4x4 matrices that place their source shapes, as
+        returned by Assembly.leaves()
+
+    Returns
+    -------
+    tuple(float, np.ndarray, float)
+        Total volume, centre of mass (3,) and largest characteristic
+        dimension
+
+    """
+    volumes, centres, dimensions = list(), list(), list()
+    for part, matrix in leaves:
+        volume, centre, dimension = shape_mass_properties(part.source_shape)
+        matrix = np.asarray(matrix, dtype=float)
+        volumes.append(volume)
+        centres.append(np.dot(matrix[:3, :3], centre) + matrix[:3, 3])
+        dimensions.append(dimension)
+    if len(volumes) == 0:
+        return 0., np.zeros(3), 0.
+    volumes = np.array(volumes)
+    total = volumes.sum()
+    weights = volumes / total if total != 0. \
+        else np.ones(len(volumes)) / len(volumes)
+    return total, np.dot(weights, np.array(centres)), max(dimensions)
+
+
+def node_mass_properties(node):
+    r"""Mass properties of a Part or of an Assembly, in the frame of the
+    assembly the node belongs to
+
+    Parameters
+    ----------
+    node : GeometryNode
+
+    Returns
+    -------
+    tuple(float, np.ndarray, float) : see combined_mass_properties()
+
+    """
+    if hasattr(node, "leaves"):
+        leaves = [(part, np.dot(node.matrix, matrix))
+                  for part, matrix in node.leaves()]
+    else:
+        leaves = [(node, node.matrix)]
+    return combined_mass_properties(leaves)
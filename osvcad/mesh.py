@@ -0,0 +1,509 @@
+# coding: utf-8
+
+r"""Meshing of Parts and Assemblies
+
+The distinct source shapes of an Assembly (or of a list of Parts) are meshed
+once each, in parallel in a pool of processes. The shapes are handed over to
+the worker processes as BRep files and the meshes come back as compact NumPy
+arrays (see Mesh).
+
+"""
+
+from __future__ import division
+
+import logging
+import shutil
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from os.path import join
+
+import numpy as np
+
+from OCC.Core.BRep import BRep_Tool
+from OCC.Core.BRepMesh import BRepMesh_IncrementalMesh
+from OCC.Core.TopAbs import TopAbs_FACE, TopAbs_REVERSED
+from OCC.Core.TopExp import TopExp_Explorer
+from OCC.Core.TopLoc import TopLoc_Location
+from OCC.Core.TopoDS import topods_Face
+
+from osvcad.brep import topods_shape, write_brep, read_brep, shape_hash
+from osvcad.mesh_data import Mesh
+
+logger = logging.getLogger(__name__)
+
+# Default meshing parameters
+LINEAR_DEFLECTION = 0.01  # relative to the size of the edges
+ANGULAR_DEFLECTION = 0.5  # radians
+
+# Default levels of detail, as relative linear deflections (coarse to fine)
+LOD_DEFLECTIONS = (0.1, 0.03, 0.01)
+
+
+class MeshLods(object):
+    r"""Meshes of the same shape at several levels of detail
+
+    The levels are OCC relative linear deflections: the deflection of each
+    edge (and face) is relative to its own size, not to the size of the
+    shape. The error of a level is thus at most its deflection times the
+    size of the largest edge, itself bounded by the size of the shape:
+    select() compares the deflection times the projected size of the shape
+    to the acceptable error, which is conservative (a finer level than
+    necessary can be selected for shapes made of small edges).
+
+    Parameters
+    ----------
+    meshes : dict[float, Mesh], optional (default is None)
+        Meshes by relative linear deflection
+
+    """
+    def __init__(self, meshes=None):
+        self.meshes = dict() if meshes is None else dict(meshes)
+
+    @property
+    def deflections(self):
+        r"""Available deflections, from the coarsest to the finest"""
+        return sorted(self.meshes.keys(), reverse=True)
+
+    @property
+    def coarsest(self):
+        r"""The mesh with the largest deflection"""
+        return self.meshes[self.deflections[0]]
+
+    @property
+    def finest(self):
+        r"""The mesh with the smallest deflection"""
+        return self.meshes[self.deflections[-1]]
+
+    def add(self, deflection, mesh):
+        r"""Add (or replace) the mesh of a level"""
+        self.meshes[deflection] = mesh
+
+    def select(self, projected_size, max_error=2.):
+        r"""The coarsest mesh that looks right at a given size on screen
+
+        Parameters
+        ----------
+        projected_size : float
+            Size of the shape on screen (pixels)
+        max_error : float, optional (default is 2.)
+            Acceptable error on screen (pixels)
+
+        Returns
+        -------
+        Mesh
+
+        """
+        for deflection in self.deflections:
+            if deflection * projected_size <= max_error:
+                return self.meshes[deflection]
+        return self.finest
+
+    def __repr__(self):
+        return "MeshLods : %s" % ", ".join(
+            "%g -> %i triangles" % (d, self.meshes[d].nb_triangles)
+            for d in self.deflections)
+
+
+def select_lods(lods, counts, triangle_budget):
+    r"""Choose a level of detail per shape within a global triangle budget
+
+    All shapes start at their coarsest level; the shapes that are the most
+    instanced are then refined first, one level at a time, as long as the
+    budget allows it.
+
+    Parameters
+    ----------
+    lods : dict[str, MeshLods]
+        Levels of detail by shape key
+    counts : dict[str, int]
+        Number of instances of each shape
+    triangle_budget : int
+        Maximum number of triangles to display
+
+    Returns
+    -------
+    dict[str, Mesh]
+
+    """
+    levels = dict((key, 0) for key in lods)
+    total = sum(lods[key].coarsest.nb_triangles * counts.get(key, 1)
+                for key in lods)
+    refined = True
+    while refined:
+        refined = False
+        for key in sorted(lods, key=lambda k: -counts.get(k, 1)):
+            deflections = lods[key].deflections
+            if levels[key] + 1 < len(deflections):
+                current = lods[key].meshes[deflections[levels[key]]]
+                finer = lods[key].meshes[deflections[levels[key] + 1]]
+                extra = (finer.nb_triangles - current.nb_triangles) * \
+                    counts.get(key, 1)
+                if total + extra <= triangle_budget:
+                    total += extra
+                    levels[key] += 1
+                    refined = True
+    return dict((key, lods[key].meshes[lods[key].deflections[level]])
+                for key, level in levels.items())
+
+
+class MeshSet(object):
+    r"""The meshes of the distinct source shapes of a set of Parts and the
+    placed instances of these meshes
+
+    Parameters
+    ----------
+    meshes : dict[str, Mesh] or dict[str, MeshLods]
+        Meshes (or levels of detail) by source shape hash
+    instances : list[tuple(Part, np.ndarray, str)]
+        The Parts, their 4x4 world matrices and the hashes of their meshes
+
+    """
+    def __init__(self, meshes, instances):
+        self.meshes = meshes
+        self.instances = instances
+
+    def selected(self, triangle_budget=None):
+        r"""One mesh per key, the levels of detail being chosen
+
+        Parameters
+        ----------
+        triangle_budget : int or None, optional (default is None)
+            Maximum number of triangles of all the instances: the levels of
+            detail are chosen by select_lods(). None for the finest levels
+
+        Returns
+        -------
+        dict[str, Mesh]
+
+        """
+        counts = dict()
+        for _, _, key in self.instances:
+            counts[key] = counts.get(key, 0) + 1
+        selected = dict((key, mesh) for key, mesh in self.meshes.items()
+                        if not isinstance(mesh, MeshLods))
+        lods = dict((key, mesh) for key, mesh in self.meshes.items()
+                    if isinstance(mesh, MeshLods))
+        if triangle_budget is None:
+            selected.update((key, mesh.finest) for key, mesh in lods.items())
+        else:
+            used = sum(mesh.nb_triangles * counts.get(key, 0)
+                       for key, mesh in selected.items())
+            selected.update(select_lods(lods, counts, triangle_budget - used))
+        return selected
+
+    def __repr__(self):
+        return "MeshSet : %i meshes, %i instances" % (len(self.meshes),
+                                                      len(self.instances))
+
+
+def triangulate(shape,
+                linear_deflection=LINEAR_DEFLECTION,
+                angular_deflection=ANGULAR_DEFLECTION,
+                relative=True):
+    r"""Mesh a shape
+
+    Parameters
+    ----------
+    shape : ccad.model.Shape or TopoDS_Shape
+    linear_deflection : float
+    angular_deflection : float
+        In radians
+    relative : bool
+        Is linear_deflection relative to the size of the edges?
+
+    Returns
+    -------
+    Mesh
+
+    """
+    shape = topods_shape(shape)
+    BRepMesh_IncrementalMesh(shape,
+                             linear_deflection,
+                             relative,
+                             angular_deflection,
+                             True)
+    bt = BRep_Tool()
+    vertices, triangles = list(), list()
+    nb_vertices = 0
+
+    explorer = TopExp_Explorer(shape, TopAbs_FACE)
+    while explorer.More():
+        face = topods_Face(explorer.Current())
+        location = TopLoc_Location()
+        h_triangulation = bt.Triangulation(face, location)
+        if not h_triangulation.IsNull():
+            triangulation = h_triangulation.GetObject()
+            trsf = location.Transformation()
+            nodes = triangulation.Nodes()
+            face_vertices = np.array(
+                [nodes.Value(i).Transformed(trsf).Coord()
+                 for i in range(nodes.Lower(), nodes.Upper() + 1)])
+            tris = triangulation.Triangles()
+            face_triangles = np.array(
+                [tris.Value(i).Get()
+                 for i in range(tris.Lower(), tris.Upper() + 1)])
+            face_triangles += nb_vertices - nodes.Lower()
+            if face.Orientation() == TopAbs_REVERSED:
+                face_triangles = face_triangles[:, ::-1]
+            vertices.append(face_vertices)
+            triangles.append(face_triangles)
+            nb_vertices += face_vertices.shape[0]
+        explorer.Next()
+
+    if nb_vertices == 0:
+        logger.warning("Meshing produced no triangle")
+        return Mesh(np.zeros((0, 3)), np.zeros((0, 3)))
+    return Mesh(np.concatenate(vertices), np.concatenate(triangles))
+
+
+def leaves(nodes):
+    r"""Parts and world matrices of an Assembly or of a list of Parts
+
+    Parameters
+    ----------
+    nodes : Assembly or list[Part]
+
+    Returns
+    -------
+    list[tuple(Part, np.ndarray)]
+
+    """
+    if hasattr(nodes, "leaves"):
+        return nodes.leaves()
+    return [(part, part.matrix) for part in nodes]
+
+
+def _mesh_brep_file(key, brep_file_path, linear_deflection,
+                    angular_deflection, relative):
+    r"""Worker process function: mesh the shape stored in a BRep file
+
+    The shape is read from the file for each job so that a coarse level of
+    detail is never skipped because of a finer triangulation already stored
+    on the shape.
+
+    """
+    return key, linear_deflection, triangulate(
+        read_brep(brep_file_path),
+        linear_deflection=linear_deflection,
+        angular_deflection=angular_deflection,
+        relative=relative)
+
+
+def _fingerprint_brep_file(key, brep_file_path):
+    r"""Worker process function: fingerprint the shape stored in a BRep
+    file"""
+    from osvcad.fingerprint import shape_fingerprint
+    return key, shape_fingerprint(read_brep(brep_file_path))
+
+
+def _run_jobs(function, jobs, processes):
+    r"""Results of function(*job) for the jobs, in completion order
+
+    Parameters
+    ----------
+    function : callable
+    jobs : list[tuple]
+    processes : int or None
+        Number of worker processes. None uses as many processes as CPUs,
+        0 runs the jobs in the calling process
+
+    """
+    if processes == 0:
+        for job in jobs:
+            yield function(*job)
+    elif len(jobs) > 0:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [executor.submit(function, *job) for job in jobs]
+            for future in as_completed(futures):
+                yield future.result()
+
+
+def _cached_alias(cache, key, shapes, cached):
+    r"""Prototype of a shape and the matrix that takes it onto the shape,
+    following the aliases of a MeshCache
+
+    An alias is only followed if the mesh of its prototype can be obtained:
+    the prototype is one of the shapes or its meshes are in the cache.
+
+    """
+    prototype, matrix = key, np.identity(4)
+    seen = set()
+    while prototype not in seen:
+        seen.add(prototype)
+        alias = cache.get_alias(prototype)
+        if alias is None or (alias[0] not in shapes and not cached(alias[0])):
+            break
+        prototype, matrix = alias[0], np.dot(matrix, alias[1])
+    return prototype, matrix
+
+
+def mesh_parts(nodes,
+               linear_deflection=LINEAR_DEFLECTION,
+               angular_deflection=ANGULAR_DEFLECTION,
+               relative=True,
+               processes=None,
+               callback=None,
+               deflections=None,
+               cache=None,
+               share_congruent=True):
+    r"""Mesh the distinct source shapes of an Assembly or of a list of Parts
+
+    Parts that share a source shape (same object or same BRep content) are
+    meshed only once. By default (share_congruent), so are the shapes that
+    are copies or mirror images of each other up to their placement (see
+    osvcad.fingerprint). The cache is looked up first: only the shapes whose
+    meshes are not in the cache are fingerprinted, in the worker processes,
+    and the copies found are remembered by the cache.
+
+    When levels of detail are requested, the coarse levels of all the shapes
+    are computed before the finer ones, so that something can be displayed
+    quickly.
+
+    Parameters
+    ----------
+    nodes : Assembly or list[Part]
+    linear_deflection : float
+    angular_deflection : float
+        In radians
+    relative : bool
+        Is linear_deflection relative to the size of the edges?
+    processes : int or None, optional (default is None)
+        Number of worker processes. None uses as many processes as CPUs,
+        0 meshes in the calling process
+    callback : callable or None, optional (default is None)
+        Called as callback(key, mesh, nb_done, nb_total) each time a mesh is
+        ready, so that a viewer can start drawing before the end.
+        With levels of detail, mesh is the MeshLods of the shape
+    deflections : iterable of float or None, optional (default is None)
+        Relative linear deflections of the levels of detail (e.g.
+        LOD_DEFLECTIONS). None computes a single mesh per shape with
+        linear_deflection and relative. The levels of detail are always
+        relative (see MeshLods): relative cannot be False
+    cache : osvcad.mesh_cache.MeshCache or None, optional (default is None)
+        Persistent cache: the meshes found in it are not recomputed and the
+        computed meshes are stored in it
+    share_congruent : bool, optional (default is True)
+        Share the meshes of the shapes that have the same geometric
+        fingerprint and can be aligned: the instances of a copy (or of a
+        mirror image) use the mesh of the first shape with a matrix that
+        includes the alignment (mirroring instance matrices have a negative
+        determinant)
+
+    Returns
+    -------
+    MeshSet
+
+    Raises
+    ------
+    ValueError
+        If deflections are given with relative False
+
+    """
+    if deflections is not None and relative is not True:
+        msg = "The levels of detail deflections are relative"
+        logger.error(msg)
+        raise ValueError(msg)
+    instances = list()
+    shapes = dict()
+    for part, matrix in leaves(nodes):
+        key = shape_hash(part.source_shape)
+        shapes.setdefault(key, part.source_shape)
+        instances.append((part, matrix, key))
+    if deflections is None:
+        levels = [linear_deflection]
+    else:
+        levels = sorted(deflections, reverse=True)
+
+    def cache_key(key_, level_):
+        return cache.key(key_, level_, angular_deflection, relative)
+
+    def cached(key_):
+        return cache is not None and all(cache_key(key_, level) in cache
+                                         for level in levels)
+
+    # shape key -> (prototype key, matrix that takes the prototype onto the
+    # shape)
+    groups = dict((key, (key, np.identity(4))) for key in shapes)
+    if share_congruent is True and cache is not None:
+        for key in shapes:
+            groups[key] = _cached_alias(cache, key, shapes, cached)
+    # only the shapes that are still to be meshed are fingerprinted
+    unresolved = [key for key in shapes
+                  if groups[key][0] == key and not cached(key)]
+
+    directory = [None]
+    brep_files = dict()
+
+    def brep_file(key_):
+        if directory[0] is None:
+            directory[0] = tempfile.mkdtemp(prefix="osvcad_mesh_")
+        if key_ not in brep_files:
+            brep_files[key_] = join(directory[0], "%s.brep" % key_)
+            write_brep(shapes[key_], brep_files[key_])
+        return brep_files[key_]
+
+    meshes = dict()
+    try:
+        if share_congruent is True and len(unresolved) > 1:
+            from osvcad.fingerprint import group_fingerprints
+            fingerprints = dict(_run_jobs(
+                _fingerprint_brep_file,
+                [(key, brep_file(key)) for key in unresolved],
+                processes))
+            # in the order of the shapes, whatever the completion order
+            fingerprints = OrderedDict((key, fingerprints[key])
+                                       for key in unresolved)
+            for key, (prototype, matrix) in \
+                    group_fingerprints(fingerprints).items():
+                if prototype != key:
+                    groups[key] = (prototype, matrix)
+                    if cache is not None:
+                        cache.put_alias(key, prototype, matrix)
+        if share_congruent is True:
+            instances = [(part, np.dot(matrix, groups[key][1]),
+                          groups[key][0])
+                         for part, matrix, key in instances]
+        prototypes = list(OrderedDict.fromkeys(groups[key][0]
+                                               for key in shapes))
+        logger.info("Meshing %i distinct shapes for %i parts" %
+                    (len(prototypes), len(instances)))
+
+        nb_done = [0]
+        nb_total = len(levels) * len(prototypes)
+
+        def done(key_, level_, mesh_):
+            nb_done[0] += 1
+            if deflections is None:
+                meshes[key_] = mesh_
+            else:
+                meshes.setdefault(key_, MeshLods()).add(level_, mesh_)
+            if callback is not None:
+                callback(key_, meshes[key_], nb_done[0], nb_total)
+
+        # coarse levels first
+        todo = list()
+        for level in levels:
+            for key in prototypes:
+                mesh = None if cache is None \
+                    else cache.get(cache_key(key, level))
+                if mesh is None:
+                    todo.append((key, level))
+                else:
+                    done(key, level, mesh)
+        logger.info("%i meshes from cache, %i to compute" % (nb_done[0],
+                                                             len(todo)))
+
+        def computed(key_, level_, mesh_):
+            if cache is not None:
+                cache.put(cache_key(key_, level_), mesh_)
+            done(key_, level_, mesh_)
+
+        jobs = [(key, brep_file(key), level, angular_deflection, relative)
+                for key, level in todo]
+        for result in _run_jobs(_mesh_brep_file, jobs, processes):
+            computed(*result)
+    finally:
+        if directory[0] is not None:
+            shutil.rmtree(directory[0], ignore_errors=True)
+    return MeshSet(meshes, instances)
@@ -0,0 +1,182 @@
+# coding: utf-8
+
+r"""Persistent on-disk cache of meshes
+
+Each mesh is stored as 2 flat binary files (float32 vertices and uint32
+triangles) and a small JSON header, named after a key computed from the hash
+of the source shape and from the meshing parameters. The arrays are mapped
+back in memory with numpy.memmap, so that reopening a project neither copies
+the meshes nor calls the OCC mesher.
+
+The cache also remembers which shapes are copies or mirror images of other
+shapes (see osvcad.fingerprint), as aliases named after the shape hash: the
+shapes are only fingerprinted once.
+
+"""
+
+import hashlib
+import json
+import logging
+import os
+from os.path import join, exists, expanduser
+
+import numpy as np
+
+from osvcad.mesh_data import Mesh
+
+logger = logging.getLogger(__name__)
+
+# Bump to invalidate the existing caches when the stored format changes
+FORMAT_VERSION = 1
+
+DEFAULT_DIRECTORY = join(expanduser("~"), ".osvcad", "mesh_cache")
+
+
+class MeshCache(object):
+    r"""Content-addressed store of meshes
+
+    Parameters
+    ----------
+    directory : str, optional (default is DEFAULT_DIRECTORY)
+        Folder where the meshes are stored. It is created if needed
+
+    """
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        self.directory = directory
+        if not exists(directory):
+            os.makedirs(directory)
+
+    @staticmethod
+    def key(shape_hash, linear_deflection, angular_deflection, relative):
+        r"""Key of the mesh of a shape
+
+        Parameters
+        ----------
+        shape_hash : str
+            Content hash of the source shape (see osvcad.brep.shape_hash)
+        linear_deflection : float
+        angular_deflection : float
+        relative : bool
+
+        Returns
+        -------
+        str
+
+        """
+        description = "%s|%r|%r|%r|%i" % (shape_hash,
+                                          float(linear_deflection),
+                                          float(angular_deflection),
+                                          bool(relative),
+                                          FORMAT_VERSION)
+        return hashlib.sha1(description.encode("utf-8")).hexdigest()
+
+    def _path(self, key, extension):
+        return join(self.directory, "%s.%s" % (key, extension))
+
+    def __contains__(self, key):
+        return exists(self._path(key, "json"))
+
+    def get(self, key):
+        r"""Map a stored mesh in memory
+
+        Parameters
+        ----------
+        key : str
+
+        Returns
+        -------
+        Mesh or None if the key is not in the cache
+
+        """
+        try:
+            with open(self._path(key, "json")) as f:
+                header = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        nb_vertices = header["nb_vertices"]
+        nb_triangles = header["nb_triangles"]
+        # empty files cannot be memory mapped
+        if nb_vertices == 0 or nb_triangles == 0:
+            return Mesh(np.zeros((0, 3)), np.zeros((0, 3)))
+        vertices = np.memmap(self._path(key, "vertices"),
+                             dtype=np.float32,
+                             mode="r",
+                             shape=(nb_vertices, 3))
+        triangles = np.memmap(self._path(key, "triangles"),
+                              dtype=np.uint32,
+                              mode="r",
+                              shape=(nb_triangles, 3))
+        return Mesh(vertices, triangles)
+
+    def put(self, key, mesh):
+        r"""Store a mesh
+
+        The header is written last: an entry without header is incomplete and
+        ignored.
+
+        Parameters
+        ----------
+        key : str
+        mesh : Mesh
+
+        """
+        for extension, array in (("vertices", mesh.vertices),
+                                 ("triangles", mesh.triangles)):
+            path = self._path(key, extension)
+            np.ascontiguousarray(array).tofile(path + ".tmp")
+            os.replace(path + ".tmp", path)
+        path = self._path(key, "json")
+        with open(path + ".tmp", "w") as f:
+            json.dump({"nb_vertices": int(mesh.vertices.shape[0]),
+                       "nb_triangles": int(mesh.triangles.shape[0])}, f)
+        os.replace(path + ".tmp", path)
+        logger.debug("Mesh %s stored in cache" % key)
+
+    def _alias_path(self, shape_hash):
+        return join(self.directory, "%s.alias.json" % shape_hash)
+
+    def get_alias(self, shape_hash):
+        r"""Prototype of a shape that is a copy or a mirror image of another
+        shape
+
+        Parameters
+        ----------
+        shape_hash : str
+
+        Returns
+        -------
+        tuple(str, np.ndarray) or None
+            Hash of the prototype shape and 4x4 matrix that takes the
+            prototype onto the shape. None if no alias is stored
+
+        """
+        try:
+            with open(self._alias_path(shape_hash)) as f:
+                alias = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if alias.get("version") != FORMAT_VERSION:
+            return None
+        return alias["prototype"], np.array(alias["matrix"])
+
+    def put_alias(self, shape_hash, prototype_hash, matrix):
+        r"""Remember that a shape is a copy or a mirror image of another shape
+
+        Parameters
+        ----------
+        shape_hash, prototype_hash : str
+        matrix : np.ndarray
+            4x4 matrix that takes the prototype onto the shape
+
+        """
+        path = self._alias_path(shape_hash)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"version": FORMAT_VERSION,
+                       "prototype": prototype_hash,
+                       "matrix": np.asarray(matrix, dtype=float).tolist()}, f)
+        os.replace(path + ".tmp", path)
+
+    def clear(self):
+        r"""Remove all the stored meshes and aliases"""
+        for name in os.listdir(self.directory):
+            os.remove(join(self.directory, name))
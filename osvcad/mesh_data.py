@@ -0,0 +1,75 @@
+# coding: utf-8
+
+r"""Triangle meshes as compact NumPy arrays
+
+The Mesh container does not depend on OCC: the meshes read from the caches
+and from the stepzip files are built without importing the mesher (see
+osvcad.mesh).
+
+"""
+
+import numpy as np
+
+
+class Mesh(object):
+    r"""Triangle mesh stored as compact NumPy arrays
+
+    Parameters
+    ----------
+    vertices : np.ndarray
+        (n, 3) float32 array of vertex coordinates
+    triangles : np.ndarray
+        (m, 3) uint32 array of indices into vertices
+
+    """
+    def __init__(self, vertices, triangles):
+        self.vertices = np.asarray(vertices, dtype=np.float32).reshape(-1, 3)
+        self.triangles = np.asarray(triangles, dtype=np.uint32).reshape(-1, 3)
+
+    @property
+    def nb_triangles(self):
+        r"""Number of triangles of the mesh"""
+        return self.triangles.shape[0]
+
+    @property
+    def nbytes(self):
+        r"""Memory used by the mesh arrays"""
+        return self.vertices.nbytes + self.triangles.nbytes
+
+    @property
+    def bounding_box(self):
+        r"""Axis aligned bounding box of the mesh
+
+        Returns
+        -------
+        tuple(np.ndarray, np.ndarray) : minimum and maximum corners
+
+        """
+        if self.vertices.shape[0] == 0:
+            return np.zeros(3), np.zeros(3)
+        return self.vertices.min(axis=0), self.vertices.max(axis=0)
+
+    def transformed(self, matrix):
+        r"""A copy of the mesh transformed by a matrix
+
+        Parameters
+        ----------
+        matrix : np.ndarray
+            4x4 or 4 x 3 transformation matrix
+
+        Returns
+        -------
+        Mesh
+
+        """
+        matrix = np.asarray(matrix, dtype=np.float64)
+        vertices = np.dot(self.vertices, matrix[:3, :3].T) + matrix[:3, 3]
+        triangles = self.triangles
+        # a mirroring transformation turns the triangles inside out
+        if np.linalg.det(matrix[:3, :3]) < 0:
+            triangles = triangles[:, ::-1]
+        return Mesh(vertices, triangles)
+
+    def __repr__(self):
+        return "Mesh : %i vertices, %i triangles" % (self.vertices.shape[0],
+                                                     self.nb_triangles)
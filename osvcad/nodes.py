@@ -17,21 +17,24 @@ GeometryNodeAssembly can be a GeometryNode and a networkx DiGraph
 # import imp
 import importlib.util
 import logging
-import re
 import abc
 from math import radians
-from os.path import basename, splitext, exists, join, dirname
+from os.path import basename, splitext, exists, join, dirname, getmtime, \
+    abspath
 
 import networkx as nx
-# import numpy as np
+import numpy as np
 
 # from aocutils.display.wx_viewer import colour_wx_to_occ
-from ccad.model import transformed, from_step
+from ccad.model import transformed, from_step, Solid
 from cadracks_party.library_use import generate
 
 from osvcad.geometry import transformation_from_2_anchors, transform_anchor, \
-    compound
-from osvcad.stepzip import extract_stepzip
+    compound, homogeneous
+from osvcad.stepzip import extract_stepzip, read_anchors, read_manifest, \
+    read_stepzip_anchors, extract_brep
+from osvcad.brep import read_brep, remember_shape_hash
+from osvcad.dependencies import Origin
 from osvcad.transformations import translation_matrix, rotation_matrix
 from osvcad.utils.coding import overrides
 from osvcad.edges import Constraint
@@ -66,6 +69,19 @@ class GeometryNode(object):
 
         raise NotImplementedError
 
+    @property
+    @abc.abstractmethod
+    def matrix(self):
+        r"""The placement of the node relative to its source geometry
+
+        Returns
+        -------
+        np.ndarray
+            4x4 homogeneous transformation matrix
+
+        """
+        raise NotImplementedError
+
     @property
     @abc.abstractmethod
     def instance_id(self):
@@ -134,34 +150,98 @@ class Part(GeometryNode):
     anchors : dict
     instance_id : str, optional (default is None)
         An identifier for the PartGeometryNode
+    source_shape : ccad Solid, optional (default is None)
+        The shape as loaded, before any placement.
+        None means that node_shape is the source shape
+    matrix : np.ndarray, optional (default is None)
+        4x4 matrix that takes source_shape to node_shape.
+        None means identity
+    source_anchors : dict, optional (default is None)
+        The anchors of source_shape. None means that anchors are the source
+        anchors
 
     """
 
     # loaded CAD files cache
     loaded = dict()
 
-    def __init__(self, node_shape, anchors, instance_id=None):
+    # osvcad.store.ShapeStore through which the STEP files are loaded, so that
+    # the copies of a geometry share their shape. None : no store
+    shape_store = None
+
+    # library files modification times when their scripts were generated
+    generated = dict()
+
+    # built library parts cache : (library file, part id) ->
+    # (library file modification time, shape, anchors)
+    library_parts = dict()
+
+    def __init__(self, node_shape, anchors, instance_id=None,
+                 source_shape=None, matrix=None, source_anchors=None):
         self._node_shape = node_shape
         self._anchors = anchors
         self._instance_id = instance_id
+        self._source_shape = node_shape if source_shape is None \
+            else source_shape
+        self._matrix = np.identity(4) if matrix is None else matrix
+        self._source_anchors = anchors if source_anchors is None \
+            else source_anchors
+        # how the Part was created (see osvcad.dependencies)
+        self.origin = None
+
+    @classmethod
+    def invalidate(cls, path):
+        r"""Forget the cached content of a file that changed
+
+        Parameters
+        ----------
+        path : str
+
+        """
+        for loaded_path in list(cls.loaded.keys()):
+            if abspath(loaded_path) == abspath(path):
+                del cls.loaded[loaded_path]
 
     @classmethod
     def from_library_part(cls, library_file_path, part_id, instance_id=None):
-        r"""Create the GeometryNode from a library part"""
+        r"""Create the GeometryNode from a library part
+
+        The library scripts are only generated again when the library file
+        changes, and each library part is only built once: the Parts created
+        from the same library part share their source shape.
+
+        """
         logger.info("Creating GeometryNode from library (%s) part (id: %s)" %
                     (library_file_path, part_id))
-        generate(library_file_path)
-        scripts_folder = join(dirname(library_file_path), "scripts")
-        module_path = join(scripts_folder, "%s.py" % part_id)
-        spec = importlib.util.spec_from_file_location(splitext(module_path)[0], module_path)
-        module_ = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module_)
-        # module_ = imp.load_source(splitext(module_path)[0],
-        #                           module_path)
-
-        if not hasattr(module_, 'part'):
-            raise ValueError("The Python module should have a 'part' variable")
-        return cls(module_.part, module_.anchors, instance_id)
+        mtime = getmtime(library_file_path)
+        if cls.generated.get(library_file_path) != mtime:
+            generate(library_file_path)
+            cls.generated[library_file_path] = mtime
+
+        key = (library_file_path, part_id)
+        if key in cls.library_parts and cls.library_parts[key][0] == mtime:
+            _, part_shape, part_anchors = cls.library_parts[key]
+        else:
+            scripts_folder = join(dirname(library_file_path), "scripts")
+            module_path = join(scripts_folder, "%s.py" % part_id)
+            spec = importlib.util.spec_from_file_location(
+                splitext(module_path)[0], module_path)
+            module_ = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module_)
+            # module_ = imp.load_source(splitext(module_path)[0],
+            #                           module_path)
+
+            if not hasattr(module_, 'part'):
+                raise ValueError("The Python module should have a 'part' "
+                                 "variable")
+            part_shape, part_anchors = module_.part, module_.anchors
+            cls.library_parts[key] = (mtime, part_shape, part_anchors)
+        part = cls(part_shape, part_anchors, instance_id)
+        part.origin = Origin("from_library_part",
+                             dict(library_file_path=library_file_path,
+                                  part_id=part_id),
+                             [library_file_path])
+        return part
 
     @classmethod
     def from_step(cls, step_file_path, anchors=None, instance_id=None):
@@ -178,32 +258,54 @@ class Part(GeometryNode):
             s = cls.loaded[step_file_path]
         else:
             logger.info("Using cache to load %s" % step_file_path)
-            s = from_step(step_file_path)
+            if cls.shape_store is not None:
+                s = cls.shape_store.load(step_file_path)
+            else:
+                s = from_step(step_file_path)
             # Store the shape in STEP at the class level if not loaded
             cls.loaded[step_file_path] = s
 
-        return cls(s, anchors, instance_id)
+        part = cls(s, anchors, instance_id)
+        part.origin = Origin("from_step",
+                             dict(step_file_path=step_file_path,
+                                  anchors=anchors),
+                             [step_file_path])
+        return part
 
     @classmethod
     def from_stepzip(cls, stepzip_file, instance_id=None):
         r"""Alternative constructor from a 'STEP + anchors' zip file. Such a
-        file is called a 'stepzip' file in the context of Osvcad"""
+        file is called a 'stepzip' file in the context of Osvcad
+
+        The shape of a version 2 stepzip file is read from its BRep, without
+        parsing the STEP file.
+
+        """
         logger.info("Creating GeometryNode from stepzip file %s" %
                     basename(stepzip_file))
-        anchors = dict()
+        manifest = read_manifest(stepzip_file)
+        if manifest is not None and "brep" in manifest:
+            if stepzip_file in cls.loaded.keys():
+                s = cls.loaded[stepzip_file]
+            else:
+                s = Solid(read_brep(extract_brep(stepzip_file, manifest)))
+                remember_shape_hash(s, manifest["shape_hash"])
+                cls.loaded[stepzip_file] = s
+            part = cls(s, read_stepzip_anchors(stepzip_file, manifest),
+                       instance_id)
+            part.origin = Origin("from_stepzip",
+                                 dict(stepzip_file=stepzip_file),
+                                 [stepzip_file])
+            return part
         stepfile_path, anchorsfile_path = extract_stepzip(stepzip_file)
-        with open(anchorsfile_path) as f:
-            lines = f.readlines()
-            for line in lines:
-                if line not in ["\n", "\r\n"] and not line.startswith("#"):
-                    items = re.findall(r'\S+', line)
-                    key = items[0]
-                    data = [float(v) for v in items[1].split(",")]
-                    position = (data[0], data[1], data[2])
-                    direction = (data[3], data[4], data[5])
-                    anchors[key] = {"position": position,
-                                    "direction": direction}
-        return cls.from_step(stepfile_path, anchors, instance_id)
+        anchors = read_anchors(anchorsfile_path)
+        part = cls.from_step(stepfile_path, anchors, instance_id)
+        # the extracted anchors file can be edited
+        part.origin = Origin("from_stepzip",
+                             dict(stepzip_file=stepzip_file),
+                             [stepzip_file, stepfile_path],
+                             anchors_file=anchorsfile_path)
+        return part
 
     @classmethod
     def from_py_script(cls, py_script_path, instance_id=None):
@@ -221,7 +323,11 @@ class Part(GeometryNode):
         spec.loader.exec_module(module_)
         # module_ = imp.load_source(name, py_script_path)
 
-        return cls(module_.part, module_.anchors, instance_id)
+        part = cls(module_.part, module_.anchors, instance_id)
+        part.origin = Origin("from_py_script",
+                             dict(py_script_path=abspath(py_script_path)),
+                             [py_script_path])
+        return part
 
     @property
     def instance_id(self):
@@ -246,6 +352,60 @@ class Part(GeometryNode):
     def anchors(self, value):
         self._anchors = value
 
+    @property
+    def source_shape(self):
+        r"""Shape of the part before any placement
+
+        Placed copies of a Part share the same source shape, which makes it
+        the natural key to mesh, cache or export the geometry only once.
+
+        """
+        return self._source_shape
+
+    @property
+    def source_anchors(self):
+        r"""Anchors of the source shape"""
+        return self._source_anchors
+
+    @property
+    def matrix(self):
+        r"""4x4 matrix that takes the source shape to node_shape"""
+        return self._matrix
+
+    @matrix.setter
+    def matrix(self, value):
+        self._matrix = value
+
+    def reset(self, matrix):
+        r"""Place the source shape and anchors with a matrix
+
+        Parameters
+        ----------
+        matrix : np.ndarray
+            4x4 matrix
+
+        """
+        self._matrix = np.array(matrix, dtype=float)
+        self._node_shape = transformed(self._source_shape, self._matrix[:3])
+        if self._source_anchors is not None:
+            self._anchors = dict(
+                (anchor_name, transform_anchor(anchor_dict,
+                                               self._matrix[:3]))
+                for anchor_name, anchor_dict in self._source_anchors.items())
+
+    def replace_source(self, source_shape, source_anchors):
+        r"""Replace the geometry of the Part, keeping its placement
+
+        Parameters
+        ----------
+        source_shape : ccad Solid
+        source_anchors : dict
+
+        """
+        self._source_shape = source_shape
+        self._source_anchors = source_anchors
+        self.reset(self._matrix)
+
     def place(self,
               self_anchor,
               other,
@@ -296,6 +456,7 @@ class Part(GeometryNode):
             modified = other.transform(transformation_mat_)
             other.node_shape = modified.node_shape
             other.anchors = modified.anchors
+            other.matrix = modified.matrix
 
     def transform(self, transformation_matrix):
         r"""Transform the node with a 4x3 transformation matrix
@@ -315,7 +476,14 @@ class Part(GeometryNode):
         for anchor_name, anchor_dict in self.anchors.items():
             new_anchors[anchor_name] = transform_anchor(anchor_dict,
                                                         transformation_matrix)
-        return Part(new_shape, new_anchors)
+        part = Part(new_shape,
+                    new_anchors,
+                    source_shape=self.source_shape,
+                    matrix=np.dot(homogeneous(transformation_matrix),
+                                  self.matrix),
+                    source_anchors=self.source_anchors)
+        part.origin = self.origin
+        return part
 
     def translate(self, vector):
         r"""Translate the node
@@ -403,6 +571,12 @@ class Assembly(nx.DiGraph, GeometryNode):
         self._node_shape = None
         self._anchors = None
         self._instance_id = instance_id
+        # placement of the built assembly relative to its nodes positions
+        self._matrix = np.identity(4)
+        # matrices of the slave nodes before their placement by build()
+        self._pre_matrices = dict()
+        # incremented when the geometry changes after the build
+        self.revision = 0
         self.add_node(root)
         self.root = root
 
@@ -417,6 +591,11 @@ class Assembly(nx.DiGraph, GeometryNode):
         r"""Instance id getter"""
         return self._instance_id
 
+    @property
+    def matrix(self):
+        r"""4x4 matrix that takes the built nodes to the assembly placement"""
+        return self._matrix
+
     @overrides
     def transform(self, transformation_matrix):
         r"""Transform the node with a 4x3 transformation matrix
@@ -437,6 +616,8 @@ class Assembly(nx.DiGraph, GeometryNode):
             new_anchors[anchor_name] = transform_anchor(anchor_dict,
                                                         transformation_matrix)
         self._anchors = new_anchors
+        self._matrix = np.dot(homogeneous(transformation_matrix),
+                              self._matrix)
 
     def build(self):
         r"""Build the assembly using the graph used to represent it"""
@@ -451,6 +632,9 @@ class Assembly(nx.DiGraph, GeometryNode):
                 edge_target = edge[1]
                 edge_constraint = self.get_edge_data(edge_origin,
                                                      edge_target)["object"]
+                if edge_target not in self._pre_matrices:
+                    self._pre_matrices[edge_target] = \
+                        np.array(edge_target.matrix, dtype=float)
                 try:
                     edge_origin.place(
                         self_anchor=edge_constraint.anchor_name_master,
@@ -463,36 +647,84 @@ class Assembly(nx.DiGraph, GeometryNode):
                     msg = "NetworkX error"
                     logger.warning(msg)
 
-            # node shape
-            shapes = list()
             logger.debug("%i nodes in %s" % (len(self.nodes()), id(self)))
             for node in self.nodes():
-                logger.debug("Adding shape of node %s" % node)
                 try:
                     node.build()
                 except AttributeError:
                     logger.debug("Trying to build a node without a build() "
                                  "method (expected and normal)")
-                shapes.append(node._node_shape)
-
-            self._node_shape = compound(shapes)
+            self._gather()
 
-            # anchors
+            self.built = True
 
-            a = dict()
-            for node in self.nodes():
-                for anchor_name, anchor_value in node._anchors.items():
-                    # if node.instance_id is not None:
-                    if hasattr(node, 'instance_id'):
-                        if node.instance_id is not None:
-                            a[node.instance_id + "/" + str(
-                                anchor_name)] = anchor_value
-                    else:
-                        a[str(hash(node)) + "/" + str(
+    def _gather(self):
+        r"""Compute the node shape and the anchors of the assembly from the
+        nodes shapes and anchors"""
+        # node shape
+        shapes = list()
+        for node in self.nodes():
+            logger.debug("Adding shape of node %s" % node)
+            shapes.append(node._node_shape)
+
+        self._node_shape = compound(shapes)
+
+        # anchors
+
+        a = dict()
+        for node in self.nodes():
+            for anchor_name, anchor_value in node._anchors.items():
+                # if node.instance_id is not None:
+                if hasattr(node, 'instance_id'):
+                    if node.instance_id is not None:
+                        a[node.instance_id + "/" + str(
                             anchor_name)] = anchor_value
-            self._anchors = a
+                else:
+                    a[str(hash(node)) + "/" + str(
+                        anchor_name)] = anchor_value
+        self._anchors = a
 
-            self.built = True
+    def update_placements(self, node):
+        r"""Place again a node whose geometry or anchors changed and the
+        nodes placed (directly or not) on it
+
+        The other nodes do not move. Each moved node starts from its
+        position before the build placed it, so that the constraints are
+        applied once.
+
+        Parameters
+        ----------
+        node : GeometryNode
+            A node of the built assembly
+
+        """
+        edges = [(master, node) for master in self.predecessors(node)] + \
+            list(nx.bfs_edges(self, node))
+        for master, slave in edges:
+            constraint = self.get_edge_data(master, slave)["object"]
+            pre_matrix = self._pre_matrices.get(slave, np.identity(4))
+            if isinstance(slave, Part):
+                slave.reset(pre_matrix)
+            else:
+                slave.transform(np.dot(pre_matrix,
+                                       np.linalg.inv(slave.matrix))[:3])
+            master.place(self_anchor=constraint.anchor_name_master,
+                         other=slave,
+                         other_anchor=constraint.anchor_name_slave,
+                         angle=constraint.angle,
+                         distance=constraint.distance,
+                         inplace=True)
+
+        self._gather()
+        if not np.allclose(self._matrix, np.identity(4)):
+            # the assembly itself has been placed
+            self._node_shape = transformed(self._node_shape,
+                                           self._matrix[:3])
+            self._anchors = dict(
+                (anchor_name, transform_anchor(anchor_dict,
+                                               self._matrix[:3]))
+                for anchor_name, anchor_dict in self._anchors.items())
+        self.revision += 1
 
     @overrides
     def place(self,
@@ -568,6 +800,42 @@ class Assembly(nx.DiGraph, GeometryNode):
         self.build()
         return self._anchors
 
+    def leaves(self):
+        r"""Flatten the assembly (and its sub-assemblies) into its Parts
+
+        Returns
+        -------
+        list[tuple(Part, np.ndarray)]
+            The Parts and their 4x4 world matrices, i.e. the matrices that
+            take each Part's source shape to its place in the assembly
+
+        """
+        self.build()
+        leaves = list()
+        for node in self.nodes():
+            if isinstance(node, Assembly):
+                for part, matrix in node.leaves():
+                    leaves.append((part, np.dot(node.matrix, matrix)))
+            else:
+                leaves.append((node, node.matrix))
+        return leaves
+
+    def to_step(self, step_file_path, schema="AP214IS"):
+        r"""Write the assembly to a STEP file
+
+        Each distinct source shape is written once and each Part is an
+        instance of it (see osvcad.xcaf).
+
+        Parameters
+        ----------
+        step_file_path : str
+        schema : str, optional (default is "AP214IS")
+            STEP schema, one of osvcad.xcaf.STEP_SCHEMAS
+
+        """
+        from osvcad.xcaf import write_step
+        write_step(self, step_file_path, schema=schema)
+
     def link(self, master, slave, constraint):
         r"""Link 2 GeometryNodes by a constraint in Assembly
 
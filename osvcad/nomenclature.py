@@ -2,6 +2,8 @@
 
 r"""Nomenclature management"""
 
+import re
+
 sectors = {"CAR": {"en": "CAR",
                    "fr": "VOITURE"},
            "AERO": {"en": "AERO",
@@ -197,6 +199,91 @@ def nomenclature_anchor(type_, zone, dimensional, ref, language="neutral"):
                                 str(ref))
 
 
+# e.g. 'D416' or 'l54.7' in the dimensional field of a shelf file name
+_dimension = re.compile(r"^([A-Za-z]*)(\d+(?:\.\d*)?|\.\d+)$")
+
+units = ("mm", "cm", "m")
+
+
+def _split_known(fields, known):
+    r"""Number of leading fields that make a known name that contains dashes
+    (e.g. LANDING-GEAR), 1 if the name is unknown"""
+    for name in sorted(known, key=len, reverse=True):
+        nb_fields = name.count("-") + 1
+        if "-".join(fields[:nb_fields]) == name:
+            return nb_fields
+    return 1
+
+
+def parse_dimensional(dimensional):
+    r"""Dimensions of the dimensional field of a part name
+
+    The dimensions are separated by underscores, may be prefixed by a letter
+    (e.g. D for a diameter, l for a length) and the last item may be the unit.
+
+    Parameters
+    ----------
+    dimensional : str
+        e.g. '705_515_184_mm', 'D416_l174_mm' or '2.38_0.179_1.18'
+
+    Returns
+    -------
+    tuple(list[tuple(str, float)], str or None)
+        The (prefix, value) dimensions and the unit (None if not given)
+
+    """
+    items = [item for item in dimensional.split("_") if item != ""]
+    unit = None
+    if len(items) > 0 and items[-1] in units:
+        unit = items.pop()
+    dimensions = list()
+    for item in items:
+        match = _dimension.match(item)
+        if match is not None:
+            dimensions.append((match.group(1), float(match.group(2))))
+    return dimensions, unit
+
+
+def decode_part_name(name):
+    r"""Fields of a part plan name in which the fields are separated by dashes
+
+    The names of the shelf files (e.g. CAR-CHASSIS-ARCHLEFT-705_515_184_mm-
+    STEEL--) follow the part plan nomenclature with dashes between the fields;
+    the fields may be empty.
+
+    Parameters
+    ----------
+    name : str
+        File name without extension
+
+    Returns
+    -------
+    dict or None
+        The sector, domain, function, dimensional, material, origin and alpha
+        fields. None if the name does not follow the nomenclature
+
+    """
+    fields = name.split("-")
+    if len(fields) < 7:
+        return None
+    sector = fields[0]
+    i = 1 + _split_known(fields[1:], domains.get(sector, dict()).keys())
+    domain = "-".join(fields[1:i])
+    j = i + _split_known(fields[i:],
+                         functions.get(sector, dict()).get(domain,
+                                                           dict()).keys())
+    function_ = "-".join(fields[i:j])
+    if len(fields) - j < 4:
+        return None
+    return {"sector": sector,
+            "domain": domain,
+            "function": function_,
+            "dimensional": "-".join(fields[j:-3]),
+            "material": fields[-3],
+            "origin": fields[-2],
+            "alpha": fields[-1]}
+
+
 def getname(**kwargs):
     """naming a parts (legacy from Bernard)
 
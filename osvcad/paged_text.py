@@ -0,0 +1,145 @@
+# coding: utf-8
+
+r"""Paged access to large text files
+
+A large text file (e.g. a STEP or IGES file of several megabytes) is memory
+mapped and read one page at a time: only the displayed page is decoded and
+copied, and the searches run over the mapped file. The pages start and end
+on line boundaries.
+
+"""
+
+import logging
+import mmap
+import re
+from os.path import getsize
+
+logger = logging.getLogger(__name__)
+
+# Size of a page, in bytes
+PAGE_SIZE = 64 * 1024
+
+
+class PagedText(object):
+    r"""Read-only, paged view of a text file
+
+    Parameters
+    ----------
+    path : str
+    page_size : int, optional (default is PAGE_SIZE)
+        Approximate size of a page in bytes. A page is extended to the end of
+        its last line
+
+    """
+    def __init__(self, path, page_size=PAGE_SIZE):
+        self.path = path
+        self.page_size = page_size
+        self.size = getsize(path)
+        self._file = open(path, "rb")
+        # an empty file cannot be memory mapped
+        self._map = mmap.mmap(self._file.fileno(), 0,
+                              access=mmap.ACCESS_READ) if self.size > 0 \
+            else b""
+        self._boundaries = {0: 0}
+
+    @property
+    def nb_pages(self):
+        r"""Number of pages (at least 1)"""
+        return max(1, (self.size + self.page_size - 1) // self.page_size)
+
+    def boundary(self, index):
+        r"""Offset of the start of a page
+
+        Parameters
+        ----------
+        index : int
+            Page index, from 0 to nb_pages (the end of the file)
+
+        Returns
+        -------
+        int
+
+        """
+        if index not in self._boundaries:
+            start = index * self.page_size
+            if start >= self.size:
+                self._boundaries[index] = self.size
+            else:
+                # the page starts on the line after start
+                end_of_line = self._map.find(b"\n", start - 1)
+                self._boundaries[index] = self.size if end_of_line == -1 \
+                    else end_of_line + 1
+        return self._boundaries[index]
+
+    def page_bytes(self, index):
+        r"""Content of a page, as bytes"""
+        return self._map[self.boundary(index):self.boundary(index + 1)]
+
+    def page(self, index):
+        r"""Content of a page
+
+        Parameters
+        ----------
+        index : int
+
+        Returns
+        -------
+        str
+
+        """
+        if not 0 <= index < self.nb_pages:
+            raise IndexError("No page %i in %s" % (index, self.path))
+        return self.page_bytes(index).decode("utf-8", "replace")
+
+    def page_of(self, offset):
+        r"""Index of the page that contains an offset"""
+        index = min(offset // self.page_size, self.nb_pages - 1)
+        while index > 0 and self.boundary(index) > offset:
+            index -= 1
+        while index < self.nb_pages - 1 and self.boundary(index + 1) <= offset:
+            index += 1
+        return index
+
+    def find(self, text, start=0, case_sensitive=False):
+        r"""Search the whole file
+
+        Parameters
+        ----------
+        text : str
+        start : int, optional (default is 0)
+            Offset where the search starts
+        case_sensitive : bool, optional (default is False)
+
+        Returns
+        -------
+        tuple(int, int) or None
+            Offsets of the start and of the end of the first match, None if
+            there is no match
+
+        """
+        if text == "" or self.size == 0:
+            return None
+        pattern = re.compile(re.escape(text.encode("utf-8")),
+                             0 if case_sensitive is True else re.IGNORECASE)
+        match = pattern.search(self._map, start)
+        if match is None:
+            return None
+        return match.start(), match.end()
+
+    def position_in_page(self, offset):
+        r"""Page of an offset and the position of the offset in the page
+
+        Returns
+        -------
+        tuple(int, int) : page index, offset from the start of the page in
+                          bytes (as the positions in a StyledTextCtrl)
+
+        """
+        index = self.page_of(offset)
+        return index, offset - self.boundary(index)
+
+    def close(self):
+        r"""Release the memory map and the file"""
+        if self.size > 0:
+            self._map.close()
+        self._file.close()
@@ -0,0 +1,273 @@
+# coding: utf-8
+
+r"""Fast statistics of a STEP file, without an OCC parse
+
+The STEP file is memory mapped and scanned with regular expressions: the
+HEADER section is parsed (FILE_DESCRIPTION, FILE_NAME, FILE_SCHEMA) and the
+entity instances of the DATA section are counted by type. Only the
+parameters of the PRODUCT instances are parsed, to get the product names.
+
+"""
+
+import logging
+import mmap
+import re
+from collections import Counter
+from os.path import getsize
+
+logger = logging.getLogger(__name__)
+
+# Entity types of the faces of a B-Rep, for the complexity of a file
+FACE_TYPES = ("ADVANCED_FACE", "FACE_SURFACE")
+
+# Number of entity instances scanned between 2 cancellation checks
+CHECK_INTERVAL = 10000
+
+_COMMENT = re.compile(br"/\*.*?\*/", re.DOTALL)
+
+# '#12 = TYPE(' or '#12 = (' for a complex instance
+_INSTANCE = re.compile(br"#\d+\s*=\s*(?:([A-Za-z_]\w*)|\()")
+
+_TOKEN = re.compile(r"'(?:[^']|'')*'|\(|\)|,|[^'(),\s]+")
+
+_FILE_NAME_FIELDS = ("name", "time_stamp", "author", "organization",
+                     "preprocessor_version", "originating_system",
+                     "authorisation")
+
+
+def parse_parameters(text):
+    r"""Parse the parameter list of a STEP instance or header entity
+
+    Parameters
+    ----------
+    text : str
+        The parameters, between parentheses, e.g. "('a',(#1,#2),$,.T.)"
+
+    Returns
+    -------
+    list
+        The parameters : str for the strings (unescaped), the references
+        ('#12'), the enumerations ('.T.') and the numbers, None for the unset
+        parameters ('$' and '*'), list for the aggregates and
+        tuple(str, list) for the typed parameters, e.g. LENGTH_MEASURE(1.)
+
+    """
+    tokens = _TOKEN.findall(text)
+    if len(tokens) == 0 or tokens[0] != "(":
+        raise ValueError("Not a parameter list : %s" % text[:80])
+    parameters, _ = _parse_list(tokens, 1)
+    return parameters
+
+
+def _parse_list(tokens, index):
+    r"""Parse a list whose opening parenthesis is before tokens[index]
+
+    Returns
+    -------
+    tuple(list, int) : the list and the index of the token after its closing
+                       parenthesis
+
+    """
+    values = list()
+    while index < len(tokens):
+        token = tokens[index]
+        if token == ")":
+            return values, index + 1
+        if token == ",":
+            index += 1
+        elif token == "(":
+            value, index = _parse_list(tokens, index + 1)
+            values.append(value)
+        elif token.startswith("'"):
+            values.append(token[1:-1].replace("''", "'"))
+            index += 1
+        elif index + 1 < len(tokens) and tokens[index + 1] == "(":
+            value, index = _parse_list(tokens, index + 2)
+            values.append((token.upper(), value))
+        else:
+            values.append(None if token in ("$", "*") else token)
+            index += 1
+    raise ValueError("Unbalanced parentheses")
+
+
+def _instance_end(data, start):
+    r"""Offset of the ';' that ends the instance starting at start"""
+    in_string = False
+    for index in range(start, len(data)):
+        character = data[index:index + 1]
+        if character == b"'":
+            in_string = not in_string
+        elif character == b";" and not in_string:
+            return index
+    return len(data)
+
+
+def _complex_types(text):
+    r"""Types of the partial instances of a complex instance
+
+    Parameters
+    ----------
+    text : str
+        From the opening parenthesis of the complex instance
+
+    """
+    types = list()
+    depth = 0
+    for token in _TOKEN.findall(text):
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+            if depth == 0:
+                break
+        elif depth == 1 and token != "," and not token.startswith("'"):
+            types.append(token.upper())
+    return types
+
+
+class StepStatistics(object):
+    r"""Header and entity statistics of a STEP file
+
+    Attributes
+    ----------
+    path : str
+    size : int
+        Size of the file in bytes
+    schemas : list[str]
+        FILE_SCHEMA
+    file_description : list
+        FILE_DESCRIPTION parameters
+    file_name : dict
+        FILE_NAME fields (name, time_stamp, author, organization,
+        preprocessor_version, originating_system, authorisation)
+    products : list[str]
+        Names of the PRODUCT instances
+    entity_counts : Counter
+        Number of instances of each entity type. A complex instance is
+        counted under the types of its partial instances joined by spaces
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+        self.schemas = list()
+        self.file_description = list()
+        self.file_name = dict()
+        self.products = list()
+        self.entity_counts = Counter()
+
+    @property
+    def nb_entities(self):
+        r"""Number of entity instances of the DATA section"""
+        return sum(self.entity_counts.values())
+
+    @property
+    def nb_faces(self):
+        r"""Number of faces, a rough measure of the complexity of the
+        geometry"""
+        return sum(self.entity_counts[t] for t in FACE_TYPES)
+
+    def __repr__(self):
+        return "<StepStatistics %s : %s, %i entities, %i faces, " \
+               "products %s>" % (self.path,
+                                 ", ".join(self.schemas),
+                                 self.nb_entities,
+                                 self.nb_faces,
+                                 self.products)
+
+
+def scan_step(path, token=None):
+    r"""Statistics of a STEP file
+
+    Parameters
+    ----------
+    path : str
+    token : object or None, optional (default is None)
+        Cancellation token with a check() method that raises to stop the
+        scan (e.g. osvcad.ui.worker.CancelToken), called every
+        CHECK_INTERVAL entity instances
+
+    Returns
+    -------
+    StepStatistics
+
+    Raises
+    ------
+    ValueError
+        If the file is not a STEP (ISO-10303-21) file
+
+    """
+    statistics = StepStatistics(path)
+    statistics.size = getsize(path)
+    if statistics.size == 0:
+        raise ValueError("%s is empty" % path)
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if data.find(b"ISO-10303-21", 0, 1024) == -1:
+                raise ValueError("%s is not a STEP file" % path)
+            data_start = _scan_header(data, statistics)
+            _scan_data(data, data_start, statistics, token)
+        finally:
+            data.close()
+    logger.debug("Scanned %r" % statistics)
+    return statistics
+
+
+def _scan_header(data, statistics):
+    r"""Parse the HEADER section
+
+    Returns
+    -------
+    int : offset of the DATA section
+
+    """
+    header_start = data.find(b"HEADER;")
+    header_end = data.find(b"ENDSEC;", header_start)
+    if header_start == -1 or header_end == -1:
+        raise ValueError("%s has no HEADER section" % statistics.path)
+    header = _COMMENT.sub(b"", data[header_start + 7:header_end])
+    header = header.decode("utf-8", "replace")
+
+    for entity in re.finditer(r"([A-Za-z_]\w*)\s*(\(.*?\))\s*;", header,
+                              re.DOTALL):
+        name = entity.group(1).upper()
+        try:
+            parameters = parse_parameters(entity.group(2))
+        except ValueError as e:
+            logger.warning("Cannot parse %s in %s : %s" %
+                           (name, statistics.path, e))
+            continue
+        if name == "FILE_SCHEMA" and len(parameters) > 0:
+            statistics.schemas = list(parameters[0])
+        elif name == "FILE_DESCRIPTION":
+            statistics.file_description = parameters
+        elif name == "FILE_NAME":
+            statistics.file_name = dict(zip(_FILE_NAME_FIELDS, parameters))
+
+    return header_end + 7
+
+
+def _scan_data(data, start, statistics, token=None):
+    r"""Count the entity instances and read the names of the products"""
+    counts = statistics.entity_counts
+    for i, instance in enumerate(_INSTANCE.finditer(data, start)):
+        if token is not None and i % CHECK_INTERVAL == 0:
+            token.check()
+        entity_type = instance.group(1)
+        if entity_type is not None:
+            entity_type = entity_type.decode("ascii").upper()
+            counts[entity_type] += 1
+            if entity_type == "PRODUCT":
+                end = _instance_end(data, instance.end())
+                text = data[instance.end():end].decode("utf-8", "replace")
+                try:
+                    parameters = parse_parameters(text)
+                    statistics.products.append(parameters[1])
+                except (ValueError, IndexError) as e:
+                    logger.warning("Cannot parse a PRODUCT in %s : %s" %
+                                   (statistics.path, e))
+        else:
+            end = _instance_end(data, instance.end())
+            text = data[instance.end() - 1:end].decode("utf-8", "replace")
+            counts[" ".join(_complex_types(text))] += 1
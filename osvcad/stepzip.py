@@ -1,16 +1,57 @@
 # coding: utf-8
 
-r"""Utilities to group a STEP file and an anchors file in a zip file"""
+r"""Utilities to group a STEP file and an anchors file in a zip file
 
-import logging
+A version 1 stepzip file only contains the STEP file and the anchors file.
+
+A version 2 stepzip file adds a manifest (manifest.json) with precomputed
+metadata (content hash of the shape, bounding box, mass properties), the
+shape as a BRep, the anchors as JSON (.janchors) and optionally a coarse
+mesh. The BRep, the anchors and the mesh are stored uncompressed : the mesh
+arrays are memory mapped straight from the stepzip file and the BRep is read
+without parsing the STEP file. Creating a version 2 file reads the STEP file
+with OCC : version 1 is the default.
+
+The members of a version 2 file are extracted to a cache folder
+(EXTRACT_DIRECTORY), not next to the stepzip file in the shelf.
+
+"""
 
-from os.path import basename, splitext, dirname, join
+import hashlib
+import json
+import logging
+import os
+import re
+import struct
 import zipfile
+from os.path import basename, splitext, dirname, join, exists, getmtime, \
+    getsize, abspath, expanduser
+
+import numpy as np
+
+from osvcad.mesh_data import Mesh
 
 logger = logging.getLogger(__name__)
 
+STEPZIP_VERSION = 2
+
+MANIFEST = "manifest.json"
 
-def create_stepzip(step_file, anchors_file):
+# Extension of the JSON anchors files (not .json : the .json files of a shelf
+# are parts libraries)
+JSON_ANCHORS_EXTENSION = ".janchors"
+
+EXTRACT_DIRECTORY = join(expanduser("~"), ".osvcad", "stepzip_cache")
+
+_LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+
+def create_stepzip(step_file,
+                   anchors_file,
+                   version=1,
+                   stepzip_file=None,
+                   mesh_deflection=None):
     r"""Procedure to create a zip file from a STEP file and an anchors file
 
     Parameters
@@ -19,24 +60,170 @@ def create_stepzip(step_file, anchors_file):
         Path to the STEP file
     anchors_file : str
         Path to the anchors file
+    version : int, optional (default is 1)
+        1 : STEP and anchors files only, 2 (STEPZIP_VERSION) : with the
+        precomputed metadata. Version 2 reads the STEP file and requires OCC
+        and ccad
+    stepzip_file : str or None, optional (default is None)
+        Path to the created file. None for a .zip file named after the STEP
+        file, in its folder
+    mesh_deflection : float or None, optional (default is None)
+        Relative linear deflection of the mesh stored in a version 2 file.
+        None : no mesh
+
+    Returns
+    -------
+    str : path to the created file
 
     """
-    zf = zipfile.ZipFile("%s/%s.zip" % (dirname(step_file),
-                                        basename(splitext(step_file)[0])),
-                         "w",
-                         zipfile.ZIP_DEFLATED)
-    zf.write(step_file, basename(step_file))
-    zf.write(anchors_file, basename(anchors_file))
-    zf.close()
+    if stepzip_file is None:
+        stepzip_file = "%s/%s.zip" % (dirname(step_file),
+                                      basename(splitext(step_file)[0]))
+    if version == 1:
+        zf = zipfile.ZipFile(stepzip_file, "w", zipfile.ZIP_DEFLATED)
+        zf.write(step_file, basename(step_file))
+        zf.write(anchors_file, basename(anchors_file))
+        zf.close()
+    elif version == 2:
+        _create_stepzip_2(step_file, anchors_file, stepzip_file,
+                          mesh_deflection)
+    else:
+        raise ValueError("Unknown stepzip version %s" % version)
+    return stepzip_file
+
 
+def _create_stepzip_2(step_file, anchors_file, stepzip_file, mesh_deflection):
+    r"""Create a version 2 stepzip file"""
+    # OCC is only needed to create the file
+    from aocutils.analyze.bounds import BoundingBox
+    from ccad.model import from_step
+    from osvcad.brep import brep_bytes, topods_shape
+    from osvcad.mass_properties import shape_mass_properties
+
+    name = basename(splitext(step_file)[0])
+    shape = from_step(step_file)
+    brep = brep_bytes(shape)
+    bb = BoundingBox(topods_shape(shape))
+    volume, centre, dimension = shape_mass_properties(shape)
+
+    manifest = {"format": "stepzip",
+                "version": 2,
+                "name": name,
+                "step": basename(step_file),
+                "brep": "%s.brep" % name,
+                "anchors": "%s%s" % (name, JSON_ANCHORS_EXTENSION),
+                "shape_hash": hashlib.sha1(brep).hexdigest(),
+                "bounding_box": [bb.x_min, bb.y_min, bb.z_min,
+                                 bb.x_max, bb.y_max, bb.z_max],
+                "volume": volume,
+                "centre_of_mass": [float(c) for c in centre],
+                "characteristic_dimension": dimension}
+
+    arrays = list()
+    if mesh_deflection is not None:
+        from osvcad.mesh import triangulate
+        mesh = triangulate(shape, linear_deflection=mesh_deflection)
+        manifest["mesh"] = {"vertices": "%s.vertices" % name,
+                            "triangles": "%s.triangles" % name,
+                            "nb_vertices": int(mesh.vertices.shape[0]),
+                            "nb_triangles": int(mesh.triangles.shape[0]),
+                            "linear_deflection": mesh_deflection}
+        arrays = [(manifest["mesh"]["vertices"],
+                   np.ascontiguousarray(mesh.vertices, dtype=np.float32)),
+                  (manifest["mesh"]["triangles"],
+                   np.ascontiguousarray(mesh.triangles, dtype=np.uint32))]
+
+    with zipfile.ZipFile(stepzip_file, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(MANIFEST, json.dumps(manifest, indent=2))
+        zf.write(step_file, manifest["step"])
+        zf.writestr(zipfile.ZipInfo(manifest["brep"]), brep,
+                    compress_type=zipfile.ZIP_STORED)
+        zf.writestr(zipfile.ZipInfo(manifest["anchors"]),
+                    json.dumps(read_anchors(anchors_file), indent=2),
+                    compress_type=zipfile.ZIP_STORED)
+        for member_name, array in arrays:
+            zf.writestr(zipfile.ZipInfo(member_name), array.tobytes(),
+                        compress_type=zipfile.ZIP_STORED)
+    logger.info("Stepzip file %s created (version 2)" % stepzip_file)
+
+
+def read_manifest(stepzip):
+    r"""Manifest of a stepzip file
+
+    Parameters
+    ----------
+    stepzip : str
+        Path to the stepzip file
+
+    Returns
+    -------
+    dict or None : None for a version 1 stepzip file
+
+    """
+    with zipfile.ZipFile(stepzip) as zip_ref:
+        if MANIFEST not in zip_ref.namelist():
+            return None
+        return json.loads(zip_ref.read(MANIFEST).decode("utf-8"))
 
-def extract_stepzip(stepzip):
+
+def extraction_directory(stepzip, cache_directory=EXTRACT_DIRECTORY):
+    r"""Cache folder where the members of a version 2 stepzip file are
+    extracted
+
+    The folder depends on the path, modification time and size of the
+    stepzip file: a modified file is extracted again.
+
+    """
+    key = "%s|%r|%i" % (abspath(stepzip), getmtime(stepzip), getsize(stepzip))
+    return join(cache_directory,
+                hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+
+def extract_member(stepzip, name, path):
+    r"""Extract a member of a stepzip file to a path
+
+    The file is written to a temporary file first and renamed, so that
+    concurrent readers never see a partial file.
+
+    """
+    with zipfile.ZipFile(stepzip) as zip_ref:
+        data = zip_ref.read(name)
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+
+def _extract_member(stepzip, name, cache_directory):
+    r"""Extract a member of a version 2 stepzip file to its cache folder,
+    unless it has already been extracted
+
+    Returns
+    -------
+    str : path to the extracted file
+
+    """
+    directory = extraction_directory(stepzip, cache_directory)
+    path = join(directory, name)
+    if not exists(path):
+        if not exists(directory):
+            os.makedirs(directory)
+        extract_member(stepzip, name, path)
+    return path
+
+
+def extract_stepzip(stepzip, cache_directory=EXTRACT_DIRECTORY):
     r"""Extract the contents of a STEP + anchors zip file
 
+    A version 1 stepzip file is extracted next to itself (the extracted
+    anchors file can be edited). Only the STEP file and the anchors file of
+    a version 2 stepzip file are extracted, to a cache folder.
+
     Parameters
     ----------
     stepzip : str
         Path to the STEP + anchors zip file
+    cache_directory : str, optional (default is EXTRACT_DIRECTORY)
+        Where the version 2 stepzip files are extracted
 
     Returns
     -------
@@ -46,6 +233,12 @@ def extract_stepzip(stepzip):
     zip_ref = zipfile.ZipFile(stepzip)
     step_file_path, anchors_file_path = None, None
 
+    if MANIFEST in zip_ref.namelist():
+        manifest = json.loads(zip_ref.read(MANIFEST).decode("utf-8"))
+        zip_ref.close()
+        return _extract_member(stepzip, manifest["step"], cache_directory), \
+            _extract_member(stepzip, manifest["anchors"], cache_directory)
+
     if len(zip_ref.namelist()) != 2:
         msg = "The zip file should contain 2 files"
         raise ValueError(msg)
@@ -60,3 +253,171 @@ def extract_stepzip(stepzip):
     zip_ref.extractall(dirname(stepzip))
     zip_ref.close()
     return step_file_path, anchors_file_path
+
+
+def member_offset(stepzip, name):
+    r"""Offset of the data of an uncompressed member of a zip file
+
+    Parameters
+    ----------
+    stepzip : str
+        Path to the zip file
+    name : str
+        Name of the member
+
+    Returns
+    -------
+    tuple(int, int) : offset and size of the member data in the zip file
+
+    Raises
+    ------
+    ValueError
+        If the member is compressed
+
+    """
+    with zipfile.ZipFile(stepzip) as zip_ref:
+        info = zip_ref.getinfo(name)
+    if info.compress_type != zipfile.ZIP_STORED:
+        raise ValueError("%s is compressed in %s" % (name, stepzip))
+    with open(stepzip, "rb") as f:
+        f.seek(info.header_offset)
+        header = _LOCAL_HEADER.unpack(f.read(_LOCAL_HEADER.size))
+    if header[0] != _LOCAL_HEADER_SIGNATURE:
+        raise ValueError("Bad zip local header for %s in %s" %
+                         (name, stepzip))
+    # the local extra field may differ from the central directory one
+    name_length, extra_length = header[9], header[10]
+    offset = info.header_offset + _LOCAL_HEADER.size + name_length + \
+        extra_length
+    return offset, info.file_size
+
+
+def member_memmap(stepzip, name, dtype, shape):
+    r"""Memory map an uncompressed member of a zip file as an array
+
+    Parameters
+    ----------
+    stepzip : str
+    name : str
+    dtype : np.dtype
+    shape : tuple
+
+    Returns
+    -------
+    np.memmap (read only)
+
+    """
+    offset, size = member_offset(stepzip, name)
+    if size != np.dtype(dtype).itemsize * int(np.prod(shape)):
+        raise ValueError("%s of %s does not match the shape %s" %
+                         (name, stepzip, shape))
+    return np.memmap(stepzip, dtype=dtype, mode="r", offset=offset,
+                     shape=shape)
+
+
+def read_stepzip_mesh(stepzip, manifest=None):
+    r"""Mesh stored in a version 2 stepzip file, memory mapped
+
+    Parameters
+    ----------
+    stepzip : str
+    manifest : dict or None, optional (default is None)
+        The manifest, if already read
+
+    Returns
+    -------
+    osvcad.mesh_data.Mesh or None if the file has no mesh
+
+    """
+    if manifest is None:
+        manifest = read_manifest(stepzip)
+    if manifest is None or "mesh" not in manifest:
+        return None
+    mesh = manifest["mesh"]
+    # empty members cannot be memory mapped
+    if mesh["nb_vertices"] == 0 or mesh["nb_triangles"] == 0:
+        return Mesh(np.zeros((0, 3)), np.zeros((0, 3)))
+    return Mesh(member_memmap(stepzip, mesh["vertices"], np.float32,
+                              (mesh["nb_vertices"], 3)),
+                member_memmap(stepzip, mesh["triangles"], np.uint32,
+                              (mesh["nb_triangles"], 3)))
+
+
+def read_stepzip_anchors(stepzip, manifest):
+    r"""Anchors of a version 2 stepzip file, read without extraction"""
+    with zipfile.ZipFile(stepzip) as zip_ref:
+        return _anchors_from_json(
+            zip_ref.read(manifest["anchors"]).decode("utf-8"))
+
+
+def extract_brep(stepzip, manifest, cache_directory=EXTRACT_DIRECTORY):
+    r"""Extract the BRep file of a version 2 stepzip file to its cache folder
+
+    The BRep file is only extracted again if the stepzip file changed.
+
+    Returns
+    -------
+    str : path to the BRep file
+
+    """
+    return _extract_member(stepzip, manifest["brep"], cache_directory)
+
+
+def _anchors_from_json(text):
+    anchors = dict()
+    for key, anchor in json.loads(text).items():
+        anchors[key] = {"position": tuple(anchor["position"]),
+                        "direction": tuple(anchor["direction"])}
+    return anchors
+
+
+def read_anchors(anchors_file):
+    r"""Read an anchors file
+
+    Each line of an anchors file is an anchor name followed by the position
+    and the direction of the anchor, e.g. 'AXIS_AXLE 0,0,0,0,0,1'. The empty
+    lines and the lines starting with # are ignored.
+
+    A JSON anchors file (.janchors as in version 2 stepzip files, or .json)
+    maps the anchor names to their position and direction.
+
+    Parameters
+    ----------
+    anchors_file : str
+        Path to the anchors file
+
+    Returns
+    -------
+    dict : anchor name -> {"position": (x, y, z), "direction": (x, y, z)}
+
+    """
+    with open(anchors_file) as f:
+        if splitext(anchors_file)[1].lower() in (JSON_ANCHORS_EXTENSION,
+                                                 ".json"):
+            return _anchors_from_json(f.read())
+        return parse_anchors(f.read())
+
+
+def parse_anchors(text):
+    r"""Parse the content of an anchors file (see read_anchors())
+
+    Parameters
+    ----------
+    text : str
+
+    Returns
+    -------
+    dict : anchor name -> {"position": (x, y, z), "direction": (x, y, z)}
+
+    """
+    anchors = dict()
+    for line in text.splitlines(True):
+        if line.strip() != "" and not line.startswith("#"):
+            items = re.findall(r'\S+', line)
+            key = items[0]
+            data = [float(v) for v in items[1].split(",")]
+            position = (data[0], data[1], data[2])
+            direction = (data[3], data[4], data[5])
+            anchors[key] = {"position": position,
+                            "direction": direction}
+    return anchors
@@ -0,0 +1,137 @@
+# coding: utf-8
+
+r"""Export of Assemblies to binary STL
+
+The triangles are taken from the NumPy meshes of osvcad.mesh: all the
+instances of a mesh are transformed at once with vectorized operations and
+each STL file is written with a single write of a structured array.
+
+"""
+
+import logging
+import struct
+from os.path import join, exists
+from os import makedirs
+
+import numpy as np
+
+from osvcad.mesh import mesh_parts
+from osvcad.mesh_cache import MeshCache
+
+logger = logging.getLogger(__name__)
+
+STL_DTYPE = np.dtype([("normal", "<f4", (3,)),
+                      ("vertices", "<f4", (3, 3)),
+                      ("attribute", "<u2")])
+
+
+def stl_records(mesh, matrices):
+    r"""Binary STL records of the triangles of a mesh placed by several
+    matrices
+
+    Parameters
+    ----------
+    mesh : osvcad.mesh.Mesh
+    matrices : np.ndarray
+        (k, 4, 4) array of transformation matrices
+
+    Returns
+    -------
+    np.ndarray
+        (k * nb_triangles) array of STL_DTYPE records
+
+    """
+    matrices = np.asarray(matrices, dtype=np.float64).reshape(-1, 4, 4)
+    corners = mesh.vertices[mesh.triangles].astype(np.float64)  # (m, 3, 3)
+    placed = np.einsum("kij,mvj->kmvi", matrices[:, :3, :3], corners) + \
+        matrices[:, None, None, :3, 3]  # (k, m, 3, 3)
+    # mirroring transformations turn the triangles inside out
+    mirrored = np.linalg.det(matrices[:, :3, :3]) < 0
+    placed[mirrored] = placed[mirrored][:, :, ::-1]
+    placed = placed.reshape(-1, 3, 3)
+
+    normals = np.cross(placed[:, 1] - placed[:, 0], placed[:, 2] - placed[:, 0])
+    lengths = np.linalg.norm(normals, axis=1)
+    lengths[lengths == 0.] = 1.
+    normals /= lengths[:, None]
+
+    records = np.zeros(placed.shape[0], dtype=STL_DTYPE)
+    records["normal"] = normals
+    records["vertices"] = placed
+    return records
+
+
+def _write_records(stl_file_path, records, name):
+    r"""Write binary STL records with a single write"""
+    header = ("osvcad %s" % name).encode("ascii", "replace")[:80]
+    with open(stl_file_path, "wb") as f:
+        f.write(header.ljust(80, b" ") +
+                struct.pack("<I", records.shape[0]) +
+                records.tobytes())
+
+
+def write_stl(nodes, path, mesh_set=None, merged=True, triangle_budget=None,
+              **mesh_parameters):
+    r"""Write an Assembly (or a list of Parts) to binary STL
+
+    Parameters
+    ----------
+    nodes : Assembly or list[Part]
+    path : str
+        Path to the STL file if merged is True, otherwise path to the folder
+        where the STL files are written (one per part, named after the part
+        instance_id)
+    mesh_set : osvcad.mesh.MeshSet or None, optional (default is None)
+        Already computed meshes of nodes. If None, the meshes are computed by
+        osvcad.mesh.mesh_parts() with mesh_parameters, through the mesh cache
+        in osvcad.mesh_cache.DEFAULT_DIRECTORY unless a cache is given
+        (cache=None disables it)
+    merged : bool, optional (default is True)
+        Write a single file for the whole assembly?
+    triangle_budget : int or None, optional (default is None)
+        With levels of detail, maximum number of triangles of all the
+        instances (see osvcad.mesh.select_lods()). None writes the finest
+        levels
+    mesh_parameters
+        Keyword parameters of osvcad.mesh.mesh_parts()
+
+    Returns
+    -------
+    list[str] : paths of the written files
+
+    """
+    if mesh_set is None:
+        if "cache" not in mesh_parameters:
+            mesh_parameters["cache"] = MeshCache()
+        mesh_set = mesh_parts(nodes, **mesh_parameters)
+    meshes = mesh_set.selected(triangle_budget)
+
+    if merged is True:
+        matrices = dict()
+        for _, matrix, key in mesh_set.instances:
+            matrices.setdefault(key, list()).append(matrix)
+        records = [stl_records(meshes[key], np.array(key_matrices))
+                   for key, key_matrices in matrices.items()]
+        records = np.concatenate(records) if len(records) > 0 \
+            else np.zeros(0, dtype=STL_DTYPE)
+        _write_records(path, records, "assembly")
+        logger.info("%i triangles written to %s" % (records.shape[0], path))
+        return [path]
+
+    if not exists(path):
+        makedirs(path)
+    paths = list()
+    for i, (part, matrix, key) in enumerate(mesh_set.instances):
+        name = getattr(part, "instance_id", None)
+        if name is None:
+            name = "part_%i" % i
+        stl_file_path = join(path, "%s.stl" % name.replace("/", "_"))
+        if stl_file_path in paths:
+            stl_file_path = join(path, "%s_%i.stl" % (name.replace("/", "_"),
+                                                      i))
+        _write_records(stl_file_path,
+                       stl_records(meshes[key], matrix),
+                       name)
+        paths.append(stl_file_path)
+    logger.info("%i STL files written to %s" % (len(paths), path))
+    return paths
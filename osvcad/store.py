@@ -0,0 +1,358 @@
+# coding: utf-8
+
+r"""Content-addressed store of shapes
+
+The same geometry is often copied in several shelves under different names.
+The store keeps one BRep file per distinct shape, named after its content hash
+(see osvcad.brep.shape_hash()), and one shape object in memory per content
+hash: all the copies of a geometry resolve to the same stored shape, which is
+loaded once.
+
+An index maps the path, modification time and size of the loaded CAD files to
+their content hash, and the hash of the bytes of the CAD files to the content
+hash of their shape: a CAD file is only parsed the first time its content is
+met, whatever its name and folder. The index is written by
+ShapeStore.save(). The report (see ShapeStore.report()) tells how much
+storage and load time the deduplication saves.
+
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from os.path import join, exists, expanduser, abspath, splitext, getmtime, \
+    getsize
+
+from ccad.model import from_step, Solid
+
+from osvcad.brep import read_brep, write_brep, shape_hash, \
+    remember_shape_hash
+from osvcad.thumbnails import file_hash, cad_files
+
+logger = logging.getLogger(__name__)
+
+# Bump to invalidate the existing stores when the stored format changes
+FORMAT_VERSION = 1
+
+DEFAULT_DIRECTORY = join(expanduser("~"), ".osvcad", "shape_store")
+
+
+def _load_cad_file(cad_file_path):
+    r"""ccad shape of a STEP or version 1 stepzip file"""
+    if splitext(cad_file_path)[1].lower() == ".stepzip":
+        from osvcad.stepzip import extract_stepzip
+        cad_file_path, _ = extract_stepzip(cad_file_path)
+    return from_step(cad_file_path)
+
+
+class StoreReport(object):
+    r"""Savings of the deduplication of a ShapeStore
+
+    Attributes
+    ----------
+    nb_files : int
+        Number of indexed CAD files
+    nb_shapes : int
+        Number of distinct shapes they contain
+    stored_bytes : int
+        Size of the stored BRep files
+    duplicated_bytes : int
+        Size the BRep files would have without deduplication
+    load_time : float
+        Time (s) to parse all the indexed CAD files
+    unique_load_time : float
+        Time (s) to parse one CAD file per distinct shape
+    session_loads, session_parsed : int
+        Number of loads and of CAD files parsed since the store was created
+    session_time_saved : float
+        Parsing time (s) saved by the loads that did not parse
+
+    """
+    def __init__(self):
+        self.nb_files = 0
+        self.nb_shapes = 0
+        self.stored_bytes = 0
+        self.duplicated_bytes = 0
+        self.load_time = 0.
+        self.unique_load_time = 0.
+        self.session_loads = 0
+        self.session_parsed = 0
+        self.session_time_saved = 0.
+
+    @property
+    def saved_bytes(self):
+        return self.duplicated_bytes - self.stored_bytes
+
+    @property
+    def saved_load_time(self):
+        return self.load_time - self.unique_load_time
+
+    def __repr__(self):
+        return "%i files, %i shapes : %.1f MB saved (%.1f MB stored), " \
+               "%.2f s of loading saved (%.2f s for all the files) ; " \
+               "session : %i loads, %i parsed, %.2f s saved" % \
+               (self.nb_files,
+                self.nb_shapes,
+                self.saved_bytes / 1e6,
+                self.stored_bytes / 1e6,
+                self.saved_load_time,
+                self.load_time,
+                self.session_loads,
+                self.session_parsed,
+                self.session_time_saved)
+
+
+class ShapeStore(object):
+    r"""Content-addressed store of shapes
+
+    Parameters
+    ----------
+    directory : str, optional (default is DEFAULT_DIRECTORY)
+        Folder where the shapes are stored. It is created if needed
+    loader : callable or None, optional (default is None)
+        Function of a CAD file path that returns its ccad shape. None for
+        ccad's STEP reader (the BRep of a version 2 stepzip file is
+        extracted to the store, a version 1 stepzip file is extracted first)
+
+    Notes
+    -----
+    The loads are serialized (the parts are loaded from background threads).
+    The index is only written by save().
+
+    """
+    def __init__(self, directory=DEFAULT_DIRECTORY, loader=None):
+        self.directory = directory
+        if not exists(directory):
+            os.makedirs(directory)
+        self.loader = self._load_cad_file if loader is None else loader
+        # content hash -> shape, the shapes shared by the copies
+        self.shapes = dict()
+        self.session_loads = 0
+        self.session_parsed = 0
+        self.session_time_saved = 0.
+        self._lock = threading.RLock()
+        self._index = self._read_index()
+        # has the index changed since it was read or saved?
+        self._modified = False
+
+    def path(self, digest):
+        r"""Path to the BRep file of a shape"""
+        return join(self.directory, "%s.brep" % digest)
+
+    def __contains__(self, digest):
+        return exists(self.path(digest))
+
+    @property
+    def _index_path(self):
+        return join(self.directory, "index.json")
+
+    def _read_index(self):
+        try:
+            with open(self._index_path) as f:
+                index = json.load(f)
+        except (IOError, OSError, ValueError):
+            index = dict()
+        if index.get("version") != FORMAT_VERSION:
+            index = {"version": FORMAT_VERSION, "files": dict(),
+                     "contents": dict(), "load_times": dict()}
+        return index
+
+    def save(self):
+        r"""Write the index, if it changed"""
+        with self._lock:
+            if not self._modified:
+                return
+            with open(self._index_path + ".tmp", "w") as f:
+                json.dump(self._index, f)
+            os.replace(self._index_path + ".tmp", self._index_path)
+            self._modified = False
+
+    def close(self):
+        r"""Save the index"""
+        self.save()
+
+    def _load_cad_file(self, cad_file_path):
+        r"""ccad shape of a CAD file
+
+        The BRep of a version 2 stepzip file is extracted straight to its
+        place in the store.
+
+        """
+        if splitext(cad_file_path)[1].lower() == ".stepzip":
+            from osvcad.stepzip import read_manifest, extract_member
+            manifest = read_manifest(cad_file_path)
+            if manifest is not None:
+                digest = manifest["shape_hash"]
+                if digest not in self:
+                    extract_member(cad_file_path, manifest["brep"],
+                                   self.path(digest))
+                shape = Solid(read_brep(self.path(digest)))
+                remember_shape_hash(shape, digest)
+                return shape
+        return _load_cad_file(cad_file_path)
+
+    def lookup(self, cad_file_path):
+        r"""Content hash of the shape of a CAD file, without reading the file
+
+        Returns
+        -------
+        str or None
+            None if the file is not indexed, changed or if its shape is no
+            longer stored
+
+        """
+        entry = self._index["files"].get(abspath(cad_file_path))
+        if entry is None:
+            return None
+        mtime, file_size, _, digest = entry
+        try:
+            if getmtime(cad_file_path) != mtime \
+                    or getsize(cad_file_path) != file_size:
+                return None
+        except OSError:
+            return None
+        return digest if digest in self else None
+
+    def _register(self, cad_file_path, content, digest):
+        self._index["files"][abspath(cad_file_path)] = \
+            [getmtime(cad_file_path), getsize(cad_file_path), content, digest]
+        self._index["contents"][content] = digest
+        self._modified = True
+
+    def _shape(self, digest):
+        r"""Shape of a content hash, read from its BRep file if not in
+        memory"""
+        if digest not in self.shapes:
+            shape = Solid(read_brep(self.path(digest)))
+            remember_shape_hash(shape, digest)
+            self.shapes[digest] = shape
+        return self.shapes[digest]
+
+    def _saved(self, digest, start):
+        r"""Account for a load that did not parse the CAD file"""
+        load_time = self._index["load_times"].get(digest, 0.)
+        self.session_time_saved += max(0., load_time -
+                                       (time.perf_counter() - start))
+
+    def load(self, cad_file_path):
+        r"""Shape of a CAD file, shared by all the copies of its geometry
+
+        Parameters
+        ----------
+        cad_file_path : str
+
+        Returns
+        -------
+        ccad shape
+
+        """
+        with self._lock:
+            return self._load(cad_file_path)
+
+    def _load(self, cad_file_path):
+        start = time.perf_counter()
+        self.session_loads += 1
+        digest = self.lookup(cad_file_path)
+        if digest is not None:
+            shape = self._shape(digest)
+            self._saved(digest, start)
+            return shape
+
+        # a byte identical copy of a known file
+        content = file_hash(cad_file_path)
+        digest = self._index["contents"].get(content)
+        if digest is not None and digest in self:
+            self._register(cad_file_path, content, digest)
+            shape = self._shape(digest)
+            self._saved(digest, start)
+            logger.info("%s is a copy of stored shape %s" %
+                        (cad_file_path, digest))
+            return shape
+
+        shape = self.loader(cad_file_path)
+        load_time = time.perf_counter() - start
+        self.session_parsed += 1
+        digest = shape_hash(shape)
+        if digest in self.shapes:
+            logger.info("%s has the geometry of stored shape %s" %
+                        (cad_file_path, digest))
+            shape = self.shapes[digest]
+        else:
+            if digest not in self:
+                write_brep(shape, self.path(digest))
+            self.shapes[digest] = shape
+        self._index["load_times"][digest] = \
+            max(load_time, self._index["load_times"].get(digest, 0.))
+        self._register(cad_file_path, content, digest)
+        return shape
+
+    def report(self):
+        r"""How much storage and load time the deduplication saves
+
+        Returns
+        -------
+        StoreReport
+
+        """
+        report = StoreReport()
+        with self._lock:
+            files = dict(self._index["files"])
+            load_times = dict(self._index["load_times"])
+        digests = [entry[3] for entry in files.values()]
+        brep_sizes = dict((digest, getsize(self.path(digest)))
+                          for digest in set(digests) if digest in self)
+        report.nb_files = len(files)
+        report.nb_shapes = len(brep_sizes)
+        report.stored_bytes = sum(brep_sizes.values())
+        report.duplicated_bytes = sum(brep_sizes.get(digest, 0)
+                                      for digest in digests)
+        report.load_time = sum(load_times.get(digest, 0.)
+                               for digest in digests)
+        report.unique_load_time = sum(load_times.get(digest, 0.)
+                                      for digest in brep_sizes)
+        report.session_loads = self.session_loads
+        report.session_parsed = self.session_parsed
+        report.session_time_saved = self.session_time_saved
+        return report
+
+    def clear(self):
+        r"""Remove all the stored shapes and the index"""
+        with self._lock:
+            for name in os.listdir(self.directory):
+                os.remove(join(self.directory, name))
+            self.shapes = dict()
+            self._index = self._read_index()
+            self._modified = False
+
+
+def main(args=None):
+    r"""Command line entry point"""
+    parser = argparse.ArgumentParser(
+        description="Store the shapes of the STEP and stepzip files of "
+                    "folders and report the deduplication savings")
+    parser.add_argument("folders", nargs="+")
+    parser.add_argument("--store", default=DEFAULT_DIRECTORY,
+                        help="shape store folder")
+    options = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s :: %(levelname)8s :: '
+                               '%(module)20s :: %(lineno)3d :: %(message)s')
+    store = ShapeStore(options.store)
+    for folder in options.folders:
+        for path in cad_files(folder):
+            try:
+                store.load(path)
+            except Exception as e:
+                logger.error("Cannot store %s : %s" % (path, e))
+    store.close()
+    print(store.report())
+
+
+if __name__ == "__main__":
+    main()
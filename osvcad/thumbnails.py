@@ -0,0 +1,326 @@
+# coding: utf-8
+
+r"""Offscreen rendering of thumbnails of CAD files
+
+The thumbnails of the STEP and stepzip files of a folder are rendered by an
+OCC offscreen renderer in a pool of processes and stored as PNG files named
+after the hash of the content of the CAD file: renaming or copying a file does
+not render it again.
+
+An index maps the path, modification time and size of the rendered files to
+their thumbnail, so that the UI finds a thumbnail without reading (and
+hashing) the CAD file.
+
+"""
+
+from __future__ import print_function
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from os.path import join, exists, expanduser, abspath, splitext, getmtime, \
+    getsize
+
+logger = logging.getLogger(__name__)
+
+# Bump to invalidate the existing thumbnails when the rendering changes
+FORMAT_VERSION = 1
+
+DEFAULT_DIRECTORY = join(expanduser("~"), ".osvcad", "thumbnails")
+
+DEFAULT_SIZE = 128
+
+EXTENSIONS = (".step", ".stp", ".stepzip")
+
+# one offscreen renderer per process, created on first use
+_renderer = None
+
+
+def file_hash(file_path, chunk_size=1 << 20):
+    r"""sha1 of the content of a file
+
+    Parameters
+    ----------
+    file_path : str
+    chunk_size : int, optional (default is 1 MB)
+
+    Returns
+    -------
+    str
+
+    """
+    sha1 = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class ThumbnailCache(object):
+    r"""Content-addressed store of thumbnails
+
+    Parameters
+    ----------
+    directory : str, optional (default is DEFAULT_DIRECTORY)
+        Folder where the thumbnails are stored. It is created if needed
+
+    """
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        self.directory = directory
+        if not exists(directory):
+            os.makedirs(directory)
+        self._index = None
+        self._index_mtime = None
+
+    @staticmethod
+    def key(cad_file_path, size=DEFAULT_SIZE):
+        r"""Key of the thumbnail of a CAD file
+
+        Parameters
+        ----------
+        cad_file_path : str
+        size : int, optional (default is DEFAULT_SIZE)
+            Width and height of the thumbnail in pixels
+
+        Returns
+        -------
+        str
+
+        """
+        description = "%s|%i|%i" % (file_hash(cad_file_path),
+                                    size,
+                                    FORMAT_VERSION)
+        return hashlib.sha1(description.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        r"""Path to the PNG file of a thumbnail"""
+        return join(self.directory, "%s.png" % key)
+
+    @property
+    def _index_path(self):
+        return join(self.directory, "index.json")
+
+    def _load_index(self):
+        r"""The index, read again if it has been modified (e.g. by the
+        command line tool)"""
+        try:
+            mtime = getmtime(self._index_path)
+        except OSError:
+            self._index = dict()
+            return self._index
+        if self._index is None or mtime != self._index_mtime:
+            try:
+                with open(self._index_path) as f:
+                    self._index = json.load(f)
+            except (IOError, OSError, ValueError):
+                self._index = dict()
+            self._index_mtime = mtime
+        return self._index
+
+    @staticmethod
+    def _entry(cad_file_path, size):
+        return "%s|%i" % (abspath(cad_file_path), size)
+
+    def lookup(self, cad_file_path, size=DEFAULT_SIZE):
+        r"""Thumbnail of a CAD file, without reading the CAD file
+
+        Parameters
+        ----------
+        cad_file_path : str
+        size : int, optional (default is DEFAULT_SIZE)
+
+        Returns
+        -------
+        str or None
+            Path to the PNG file, None if the file has no up to date
+            thumbnail
+
+        """
+        entry = self._load_index().get(self._entry(cad_file_path, size))
+        if entry is None:
+            return None
+        mtime, file_size, key = entry
+        try:
+            if getmtime(cad_file_path) != mtime \
+                    or getsize(cad_file_path) != file_size:
+                return None
+        except OSError:
+            return None
+        path = self.path(key)
+        return path if exists(path) else None
+
+    def register(self, entries):
+        r"""Add rendered thumbnails to the index
+
+        Parameters
+        ----------
+        entries : list[tuple(str, int, str)]
+            CAD file path, size and key of each thumbnail
+
+        """
+        index = self._load_index()
+        for cad_file_path, size, key in entries:
+            index[self._entry(cad_file_path, size)] = \
+                [getmtime(cad_file_path), getsize(cad_file_path), key]
+        with open(self._index_path + ".tmp", "w") as f:
+            json.dump(index, f)
+        os.replace(self._index_path + ".tmp", self._index_path)
+
+
+def _load_shape(cad_file_path):
+    r"""OCC shape of a STEP or stepzip file"""
+    ext = splitext(cad_file_path)[1].lower()
+    if ext == ".stepzip":
+        from osvcad.nodes import Part
+        return Part.from_stepzip(cad_file_path).node_shape.shape
+    from aocxchange.step import StepImporter
+    from osvcad.geometry import compound
+    return compound(StepImporter(cad_file_path).shapes).shape
+
+
+def render_thumbnail(cad_file_path, png_file_path, size=DEFAULT_SIZE):
+    r"""Render the thumbnail of a CAD file with an offscreen renderer
+
+    Parameters
+    ----------
+    cad_file_path : str
+    png_file_path : str
+    size : int, optional (default is DEFAULT_SIZE)
+
+    Returns
+    -------
+    str : png_file_path
+
+    """
+    global _renderer
+    if _renderer is None:
+        from OCC.Display.OCCViewer import OffscreenRenderer
+        _renderer = OffscreenRenderer(screen_size=(size, size))
+    _renderer.SetSize(size, size)
+    _renderer.EraseAll()
+    _renderer.DisplayShape(_load_shape(cad_file_path), update=False)
+    _renderer.View_Iso()
+    _renderer.FitAll()
+    _renderer.View.Dump(png_file_path)
+    return png_file_path
+
+
+def _render_job(cad_file_path, png_file_path, size):
+    r"""Render in a worker process, without propagating the failures"""
+    try:
+        render_thumbnail(cad_file_path, png_file_path + ".tmp.png", size)
+        os.replace(png_file_path + ".tmp.png", png_file_path)
+        return cad_file_path, True
+    except Exception as e:
+        logger.error("Cannot render %s : %s" % (cad_file_path, e))
+        return cad_file_path, False
+
+
+def cad_files(folder):
+    r"""STEP and stepzip files of a folder and of its sub-folders"""
+    paths = list()
+    for directory, _, file_names in os.walk(folder):
+        for file_name in sorted(file_names):
+            if splitext(file_name)[1].lower() in EXTENSIONS:
+                paths.append(join(directory, file_name))
+    return paths
+
+
+def make_thumbnails(cad_file_paths,
+                    size=DEFAULT_SIZE,
+                    cache=None,
+                    processes=None,
+                    force=False):
+    r"""Render the missing thumbnails of CAD files
+
+    Parameters
+    ----------
+    cad_file_paths : list[str]
+    size : int, optional (default is DEFAULT_SIZE)
+    cache : ThumbnailCache or None, optional (default is None)
+        None for a ThumbnailCache in DEFAULT_DIRECTORY
+    processes : int or None, optional (default is None)
+        Number of worker processes (None : number of CPUs, 0 : render in the
+        calling process)
+    force : bool, optional (default is False)
+        Render again the thumbnails that are already in the cache?
+
+    Returns
+    -------
+    dict[str, str] : CAD file path -> PNG file path of the available thumbnails
+
+    """
+    if cache is None:
+        cache = ThumbnailCache()
+
+    keys = dict()
+    seen = set()
+    jobs = list()
+    for cad_file_path in cad_file_paths:
+        key = cache.key(cad_file_path, size)
+        # identical files are rendered once
+        if key not in seen \
+                and (force is True or not exists(cache.path(key))):
+            jobs.append((cad_file_path, cache.path(key), size))
+        seen.add(key)
+        keys[cad_file_path] = key
+    logger.info("%i thumbnails in cache, %i to render" %
+                (len(cad_file_paths) - len(jobs), len(jobs)))
+
+    if processes == 0:
+        results = [_render_job(*job) for job in jobs]
+    elif len(jobs) > 0:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [executor.submit(_render_job, *job) for job in jobs]
+            results = [future.result() for future in as_completed(futures)]
+    else:
+        results = list()
+    for cad_file_path, success in results:
+        if success is False:
+            logger.warning("No thumbnail for %s" % cad_file_path)
+
+    thumbnails = dict((cad_file_path, cache.path(key))
+                      for cad_file_path, key in keys.items()
+                      if exists(cache.path(key)))
+    cache.register([(cad_file_path, size, keys[cad_file_path])
+                    for cad_file_path in thumbnails])
+    return thumbnails
+
+
+def main(args=None):
+    r"""Command line entry point"""
+    parser = argparse.ArgumentParser(
+        description="Render the thumbnails of the STEP and stepzip files of "
+                    "folders")
+    parser.add_argument("folders", nargs="+")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE,
+                        help="thumbnail width and height in pixels")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="number of worker processes")
+    parser.add_argument("--cache", default=DEFAULT_DIRECTORY,
+                        help="thumbnails folder")
+    parser.add_argument("--force", action="store_true",
+                        help="render again the cached thumbnails")
+    options = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s :: %(levelname)8s :: '
+                               '%(module)20s :: %(lineno)3d :: %(message)s')
+    paths = list()
+    for folder in options.folders:
+        paths.extend(cad_files(folder))
+    thumbnails = make_thumbnails(paths,
+                                 size=options.size,
+                                 cache=ThumbnailCache(options.cache),
+                                 processes=options.processes,
+                                 force=options.force)
+    print("%i/%i thumbnails in %s" % (len(thumbnails),
+                                      len(paths),
+                                      options.cache))
+
+
+if __name__ == "__main__":
+    main()
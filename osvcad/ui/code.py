@@ -12,6 +12,10 @@ import wx.stc
 from corelib.core.files import p_, is_binary
 from corelib.core.python_ import is_valid_python
 
+from osvcad.paged_text import PagedText
+from osvcad.step_scan import scan_step
+from osvcad.ui.worker import BackgroundLoader
+
 logger = logging.getLogger(__name__)
 
 
@@ -48,12 +52,16 @@ class CodePanel(wx.Panel):
         #                          0,
         #                          wx.ALIGN_CENTER | wx.ALL, 10)
 
-        self.file_editor = Editor(self, model, self.save_button)
+        self.navigation = PagedNavigation(self)
+
+        self.file_editor = Editor(self, model, self.save_button,
+                                  self.navigation)
         self.file_editor.Disable()
         # self.python_definition_file_editor.EmptyUndoBuffer()
 
         sizer = wx.BoxSizer(wx.VERTICAL)
 
+        sizer.Add(self.navigation, 0, wx.EXPAND)
         sizer.Add(self.file_editor, 90, wx.EXPAND)
         sizer.Add(self.save_button, 0, wx.ALIGN_RIGHT)
 
@@ -83,10 +91,83 @@ class CodePanel(wx.Panel):
         with open(self.file_editor.filepath, 'w') as f:
             f.write(self.file_editor.GetText())
 
-        self.save_button.Disable()
-        self.file_editor.initial_content = self.file_editor.GetText()
-        # refresh all views
-        self.model.set_selected(self.file_editor.filepath)
+        changed_lines = self.file_editor.changed_lines
+        self.file_editor.reset_modifications()
+        # rebuild what depends on the file and refresh all views
+        self.model.file_saved(self.file_editor.filepath, changed_lines)
+
+
+class PagedNavigation(wx.Panel):
+    r"""Page and search controls of the editor when it displays a large
+    text file one page at a time
+
+    Parameters
+    ----------
+    parent : wx window
+
+    """
+    def __init__(self, parent):
+        wx.Panel.__init__(self, parent=parent, id=wx.ID_ANY)
+        self.editor = None
+
+        self.previous_button = wx.Button(self, wx.ID_ANY, "<",
+                                         style=wx.BU_EXACTFIT)
+        self.next_button = wx.Button(self, wx.ID_ANY, ">",
+                                     style=wx.BU_EXACTFIT)
+        self.page_label = wx.StaticText(self, wx.ID_ANY, "")
+        self.info_label = wx.StaticText(self, wx.ID_ANY, "")
+        self.search = wx.SearchCtrl(self, wx.ID_ANY,
+                                    style=wx.TE_PROCESS_ENTER)
+        self.search.ShowCancelButton(True)
+
+        self.Bind(wx.EVT_BUTTON, self.on_previous, self.previous_button)
+        self.Bind(wx.EVT_BUTTON, self.on_next, self.next_button)
+        self.search.Bind(wx.EVT_TEXT_ENTER, self.on_search)
+        self.search.Bind(wx.EVT_SEARCHCTRL_SEARCH_BTN, self.on_search)
+
+        sizer = wx.BoxSizer(wx.HORIZONTAL)
+        sizer.Add(self.previous_button, 0, wx.ALIGN_CENTER_VERTICAL)
+        sizer.Add(self.next_button, 0, wx.ALIGN_CENTER_VERTICAL)
+        sizer.Add(self.page_label, 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
+        sizer.Add(self.info_label, 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
+        sizer.AddStretchSpacer()
+        sizer.Add(self.search, 0, wx.ALIGN_CENTER_VERTICAL)
+        self.SetSizer(sizer)
+        self.Hide()
+
+    def update(self, page, nb_pages):
+        r"""Show the controls for the page of a paged file"""
+        self.page_label.SetLabel("Page %i / %i" % (page + 1, nb_pages))
+        self.previous_button.Enable(page > 0)
+        self.next_button.Enable(page < nb_pages - 1)
+        if not self.IsShown():
+            self.Show()
+            self.GetParent().Layout()
+
+    def set_info(self, text):
+        r"""Summary of the paged file"""
+        self.info_label.SetLabel(text)
+
+    def clear(self):
+        r"""Hide the controls"""
+        self.info_label.SetLabel("")
+        if self.IsShown():
+            self.Hide()
+            self.GetParent().Layout()
+
+    def on_previous(self, evt):
+        r"""Callback for a click on the previous page button"""
+        self.editor.show_page(self.editor.page - 1)
+
+    def on_next(self, evt):
+        r"""Callback for a click on the next page button"""
+        self.editor.show_page(self.editor.page + 1)
+
+    def on_search(self, evt):
+        r"""Callback for a search in the paged file"""
+        if not self.editor.find_next(self.search.GetValue()):
+            wx.Bell()
+
 
 faces = {
     'times': 'Times New Roman',
@@ -99,16 +180,61 @@ faces = {
     }
 
 
+def update_line_ranges(ranges, line, lines_added):
+    r"""Update the modified line ranges after an insertion or a deletion
+
+    Parameters
+    ----------
+    ranges : list[tuple(int, int)]
+        Sorted, disjoint ranges of modified lines (first, last)
+    line : int
+        Line of the insertion or deletion
+    lines_added : int
+        Number of lines added (negative for a deletion)
+
+    Returns
+    -------
+    list[tuple(int, int)] : the sorted, merged ranges, including the modified
+                            line(s)
+
+    """
+    def shift(l):
+        return l if l <= line else max(line, l + lines_added)
+
+    shifted = [(shift(first), shift(last)) for first, last in ranges]
+    shifted.append((line, line + max(lines_added, 0)))
+    merged = list()
+    for first, last in sorted(shifted):
+        if len(merged) > 0 and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
 class Editor(wx.stc.StyledTextCtrl):
-    """Code Editor"""
-    def __init__(self, parent, model, save_button):
+    """Code Editor
+
+    The STEP, IGES and STL files are displayed one page at a time, read only:
+    the editor never holds the whole content of a multi-megabyte CAD file.
+
+    """
+    def __init__(self, parent, model, save_button, navigation):
         wx.stc.StyledTextCtrl.__init__(self, parent)
         self.model = model
         self.save_button = save_button
+        self.navigation = navigation
+        self.navigation.editor = self
+        self.paged = None
+        self.page = 0
+        # the STEP statistics are computed in a worker thread
+        self.scanner = BackgroundLoader("step scanner")
+        self._search = None  # (searched text, offset of the next search)
+        # line ranges modified since the last save point
+        self.changed_lines = list()
         self.model.observe("selected_changed", self.on_selected_changed)
         self.model.observe("root_folder_changed", self.on_root_folder_changed)
         # self.save_button = wx.Button(self, wx.ID_ANY, "Save code")
-        self.initial_content = "".encode('utf-8')
         self.filepath = None
         self.SetLexer(wx.stc.STC_LEX_PYTHON)
         self.SetTabWidth(4)
@@ -170,6 +296,9 @@ class Editor(wx.stc.StyledTextCtrl):
 
         # bind some events ...
         self.Bind(wx.stc.EVT_STC_UPDATEUI, self.onUpdateUI)
+        self.Bind(wx.stc.EVT_STC_MODIFIED, self.on_modified)
+        self.Bind(wx.stc.EVT_STC_SAVEPOINTREACHED, self.on_save_point_reached)
+        self.Bind(wx.stc.EVT_STC_SAVEPOINTLEFT, self.on_save_point_left)
         self.Bind(wx.stc.EVT_STC_MARGINCLICK, self.onMarginClick)
         self.Bind(wx.EVT_KEY_DOWN, self.onKeyPressed)
         # self.Bind(wx.EVT_KEY_UP, self.onKeyUp)
@@ -260,6 +389,8 @@ class Editor(wx.stc.StyledTextCtrl):
         ext = splitext(sel)[1].lower()
         logger.info("File extension : %s" % ext)
 
+        self.close_paged()
+
         if isfile(sel):
             if is_binary(sel):
                 if ext in [".stepzip"]:
@@ -278,8 +409,7 @@ class Editor(wx.stc.StyledTextCtrl):
                     self.Disable()
                 elif ext in [".step", ".stp", ".iges", ".igs", ".stl"]:
                     self.SetLexer(wx.stc.STC_LEX_AUTOMATIC)
-                    self.load_file(sel)
-                    self.Disable()
+                    self.load_paged(sel)
                 elif ext == ".json":
                     self.SetLexer(wx.stc.STC_LEX_AUTOMATIC)
                     self.load_file(sel)
@@ -295,25 +425,146 @@ class Editor(wx.stc.StyledTextCtrl):
             self.SetText("Not a file")
             self.Disable()
 
+        if self.paged is None and not self.IsEnabled():
+            self.reset_modifications()
+
         self.Layout()
 
         logger.debug("code change detected in 3D panel")
 
     def on_root_folder_changed(self, evt):
         r"""Callback for a change of root folder"""
+        self.close_paged()
         self.SetText("")
+        self.reset_modifications()
         self.Disable()
 
     def load_file(self, filepath):
         """Load a file in the PythonEditor"""
         with open(filepath) as f:
-            self.initial_content = f.read()
+            content = f.read()
             self.filepath = filepath
 
-        # self.SetTextUTF8(self.initial_content)
-        self.SetText(self.initial_content)
-        # self.save_button.Disable()
+        # self.SetTextUTF8(content)
+        self.SetText(content)
+        self.reset_modifications()
+
+    def reset_modifications(self):
+        r"""Mark the current content as unmodified"""
         self.EmptyUndoBuffer()
+        self.SetSavePoint()
+        self.changed_lines = list()
+        self.save_button.Disable()
+
+    def on_modified(self, evt):
+        r"""Callback for an insertion or a deletion of text
+
+        Records the modified lines, without reading the content.
+
+        """
+        if self.paged is None and evt.GetModificationType() & \
+                (wx.stc.STC_MOD_INSERTTEXT | wx.stc.STC_MOD_DELETETEXT):
+            self.changed_lines = update_line_ranges(
+                self.changed_lines,
+                self.LineFromPosition(evt.GetPosition()),
+                evt.GetLinesAdded())
+        evt.Skip()
+
+    def on_save_point_reached(self, evt):
+        r"""Callback for a return to the saved content (e.g. by undo)"""
+        self.save_button.Disable()
+
+    def on_save_point_left(self, evt):
+        r"""Callback for a first modification since the last save"""
+        if self.paged is None and self.filepath is not None:
+            self.save_button.Enable()
+
+    def load_paged(self, filepath):
+        r"""Display a large text file one page at a time, read only"""
+        self.paged = PagedText(filepath)
+        self.filepath = filepath
+        logger.info("%s : %i bytes, %i pages" % (filepath,
+                                                 self.paged.size,
+                                                 self.paged.nb_pages))
+        if splitext(filepath)[1].lower() in [".step", ".stp"]:
+            self.navigation.set_info("Scanning ...")
+            self.scanner.submit(lambda token: scan_step(filepath, token),
+                                on_done=self._show_statistics,
+                                on_error=self._scan_failed)
+        self.show_page(0)
+        self.Enable()
+
+    def _show_statistics(self, statistics):
+        r"""Display the statistics of the scanned STEP file (UI thread)"""
+        self.navigation.set_info("%s | %i entities | %i faces | %s" %
+                                 (", ".join(statistics.schemas),
+                                  statistics.nb_entities,
+                                  statistics.nb_faces,
+                                  ", ".join(statistics.products)))
+
+    def _scan_failed(self, e):
+        r"""The scanned file is not a STEP file (UI thread)"""
+        logger.warning(e)
+        self.navigation.set_info("")
+
+    def close_paged(self):
+        r"""Leave the paged mode"""
+        self.scanner.cancel()
+        if self.paged is not None:
+            self.paged.close()
+            self.paged = None
+            self._search = None
+            self.navigation.clear()
+        self.SetReadOnly(False)
+
+    def show_page(self, index, selection=None):
+        r"""Display a page of the paged file
+
+        Parameters
+        ----------
+        index : int
+        selection : tuple(int, int) or None, optional (default is None)
+            Start and end positions, in the page, of the text to select
+
+        """
+        index = max(0, min(index, self.paged.nb_pages - 1))
+        if index != self.page or selection is None:
+            self.SetReadOnly(False)
+            self.SetText(self.paged.page(index))
+            self.SetReadOnly(True)
+            self.reset_modifications()
+            self.page = index
+        if selection is not None:
+            self.SetSelection(*selection)
+            self.ScrollToLine(max(0, self.LineFromPosition(selection[0]) - 5))
+        self.navigation.update(index, self.paged.nb_pages)
+
+    def find_next(self, text):
+        r"""Search the whole paged file for the next occurrence of a text
+
+        The search wraps around at the end of the file.
+
+        Returns
+        -------
+        bool : True if the text has been found
+
+        """
+        if self.paged is None or text == "":
+            return False
+        if self._search is None or self._search[0] != text:
+            self._search = (text, self.paged.boundary(self.page))
+        match = self.paged.find(text, self._search[1])
+        if match is None and self._search[1] > 0:
+            match = self.paged.find(text, 0)
+        if match is None:
+            return False
+        self._search = (text, match[1])
+        page, start = self.paged.position_in_page(match[0])
+        end = self.paged.position_in_page(match[1])[1] \
+            if self.paged.page_of(match[1]) == page \
+            else len(self.paged.page_bytes(page))
+        self.show_page(page, (start, end))
+        return True
 
     def onKeyPressed(self, event):
         if self.CallTipActive():
@@ -346,21 +597,13 @@ class Editor(wx.stc.StyledTextCtrl):
             event.Skip()
 
     def has_been_modified(self):
-        """True if the current content is different from the content
-        when a file was loaded"""
-        if self.initial_content == self.GetText().encode('utf-8'):
-            return False
-        else:
-            return True
+        """True if the content has been modified since the file was loaded
+        or saved"""
+        return self.paged is None and self.GetModify()
 
     def onUpdateUI(self, evt):
         """Update the user interface"""
 
-        if self.has_been_modified():
-            self.save_button.Enable()
-        else:
-            self.save_button.Disable()
-
         # check for matching braces
         brace_at_caret = -1
         brace_opposite = -1
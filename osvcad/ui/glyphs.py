@@ -0,0 +1,67 @@
+# coding: utf-8
+
+r"""Batched glyphs for the 3D display of anchors
+
+All the anchors to display are gathered in 2 compounds: one of line segments
+and one of arrowheads. The arrowheads are located instances of a single cone,
+so the cone is only built (and meshed) once.
+
+"""
+
+import logging
+
+from OCC.Core.BRep import BRep_Builder
+from OCC.Core.BRepBuilderAPI import BRepBuilderAPI_MakeEdge
+from OCC.Core.BRepPrimAPI import BRepPrimAPI_MakeCone
+from OCC.Core.TopLoc import TopLoc_Location
+from OCC.Core.TopoDS import TopoDS_Compound
+from OCC.Core.gp import gp_Pnt, gp_Vec, gp_Dir, gp_Ax3, gp_Trsf
+
+logger = logging.getLogger(__name__)
+
+
+def anchors_glyphs(anchors, length=100.):
+    r"""Line segments and arrowheads of anchors
+
+    Parameters
+    ----------
+    anchors : dict[dict]
+        The anchors, with at least the position and direction keys
+    length : float, optional (default is 100.)
+        Length of the displayed anchor vectors
+
+    Returns
+    -------
+    tuple(TopoDS_Compound, TopoDS_Compound) : segments, arrowheads
+
+    """
+    builder = BRep_Builder()
+    segments = TopoDS_Compound()
+    builder.MakeCompound(segments)
+    arrowheads = TopoDS_Compound()
+    builder.MakeCompound(arrowheads)
+
+    # the arrowhead is the last fifth of the anchor vector
+    cone = BRepPrimAPI_MakeCone(length / 20., 0., length / 5.).Shape()
+
+    for anchor in anchors.values():
+        direction = gp_Vec(*anchor["direction"])
+        if direction.Magnitude() == 0.:
+            logger.warning("Anchor with a null direction not displayed")
+            continue
+        direction.Multiply(length / direction.Magnitude())
+
+        start = gp_Pnt(*anchor["position"])
+        builder.Add(segments,
+                    BRepBuilderAPI_MakeEdge(start,
+                                            start.Translated(direction)).Edge())
+
+        to_arrowhead = gp_Vec(direction.X(), direction.Y(), direction.Z())
+        to_arrowhead.Multiply(4. / 5.)
+        placement = gp_Trsf()
+        placement.SetDisplacement(gp_Ax3(),
+                                  gp_Ax3(start.Translated(to_arrowhead),
+                                         gp_Dir(direction)))
+        builder.Add(arrowheads, cone.Moved(TopLoc_Location(placement)))
+
+    return segments, arrowheads
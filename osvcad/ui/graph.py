@@ -4,18 +4,22 @@ r"""3D visualization of geometry"""
 
 from __future__ import division
 
-import imp
+from functools import partial
 from os.path import isdir, splitext
 import logging
 
 import wx
-from OCC.Core.gp import gp_Pnt, gp_Vec
+from OCC.Core.BRep import BRep_Builder
+from OCC.Core.BRepBuilderAPI import BRepBuilderAPI_MakeEdge
+from OCC.Core.BRepPrimAPI import BRepPrimAPI_MakeSphere
+from OCC.Core.TopoDS import TopoDS_Compound
+from OCC.Core.gp import gp_Pnt
 
-from corelib.core.python_ import is_valid_python
-from corelib.core.memoize import memoize
 from aocutils.display.wx_viewer import Wx3dViewer, colour_wx_to_occ
 
+from osvcad.mass_properties import node_mass_properties
 from osvcad.ui.sequences import color_from_sequence
+from osvcad.ui.worker import BackgroundLoader
 
 logger = logging.getLogger(__name__)
 
@@ -27,18 +31,26 @@ class GraphPanel(Wx3dViewer):
                  model,
                  viewer_background_color=(50., 50., 50.),
                  object_transparency=0.2, text_height=20,
-                 text_colour=(0., 0., 0.)):
+                 text_colour=(0., 0., 0.),
+                 max_edge_labels=100):
         super(GraphPanel, self).__init__(parent=parent,
                                          viewer_background_color=viewer_background_color,
                                          show_topology_menu=False)
         self.model = model
         self.model.observe("selected_changed", self.on_selected_change)
+        self.model.observe("assembly_updated", self.on_assembly_updated)
 
         self.viewer_display.View.SetBackgroundColor(colour_wx_to_occ(viewer_background_color))
 
         self.objects_transparency = object_transparency
         self.text_height = text_height
         self.text_colour = text_colour
+        self.max_edge_labels = max_edge_labels
+
+        self.loader = BackgroundLoader("graph loader")
+        # the displayed assembly and its revision, not displayed again if
+        # selected again unchanged
+        self._displayed = None
 
         self.Bind(wx.EVT_SIZE, self.OnSize)
 
@@ -46,59 +58,78 @@ class GraphPanel(Wx3dViewer):
         self.Layout()
 
     def on_selected_change(self, change):
-        """Callback function for listener"""
+        """Callback function for listener
 
-        # TODO: investigate why importing Part
-        # at top of file causes an app crash
-        from osvcad.nodes import Part
+        The Python files are evaluated by the model, which shares the
+        evaluation with the other panels.
 
+        """
         logger.debug("Selection changed")
+        self.loader.submit(partial(self._load, self.model.selected),
+                           on_done=self._show,
+                           on_error=self._load_failed)
 
-        sel = self.model.selected
-
-        if not isdir(sel):
-            # what extension ?
-            ext = splitext(sel)[1].lower()
-
-            logger.info("File extension : %s" % ext)
-
-            if ext == ".py":
-                with open(sel) as f:
-                    content = f.read()
-
-                if is_valid_python(content) is True:
-                    with wx.BusyInfo("Loading Python defined geometry ...") as _:
-                        module_ = imp.load_source(sel, sel)
-                    # has_part = hasattr(module_, "part")
-                    has_assembly = hasattr(module_, "assembly")
-                    # has_anchors = hasattr(module_, "anchors")
-
-                    self.erase_all()
-
-                    if has_assembly is True:
-                        logger.info("%s has assembly" % sel)
-                        try:
-                            self.display_assembly(module_.assembly, transparency=0.4)
-                        except KeyError as ke:
-                            self.erase_all()
-                            logger.exception(ke)
-                    else:
-                        self.erase_all()
-                        logger.warning("Nothing to display in graph panel")
-                else:  # the file is not a valid Python file
-                    logger.warning("Not a valid python file")
-                    self.erase_all()
-
-            elif ext in [".step", ".stp", ".iges", ".igs", ".stl", ".json",
-                         ".stepzip", ".anchors"]:
-                self.erase_all()
+    def on_assembly_updated(self, assembly):
+        r"""Callback for a displayed assembly patched in place (see
+        Model.file_saved())"""
+        logger.debug("Displayed assembly updated")
+        self._show(assembly)
+
+    def _load(self, sel, token):
+        r"""Get the assembly of the selection (worker thread)
+
+        Returns
+        -------
+        Assembly or None
+
+        """
+        if isdir(sel) or splitext(sel)[1].lower() != ".py":
+            return None
 
-        else:  # a directory is selected
-            self.erase_all()
+        evaluation = self.model.evaluate(sel)
+        token.check()
 
+        if evaluation.has_assembly is True:
+            logger.info("%s has assembly" % sel)
+            # compute (and cache) the mass properties out of the UI thread
+            for node in evaluation.assembly.nodes():
+                token.check()
+                node_mass_properties(node)
+            return evaluation.assembly
+        logger.warning("Nothing to display in graph panel")
+        return None
+
+    def _show(self, assembly):
+        r"""Display the result of _load() (UI thread)
+
+        The evaluations are cached by the model: an unchanged script gives
+        the same assembly, which is already displayed unless it has been
+        patched since (see Model.file_saved()).
+
+        """
+        if assembly is not None and self._displayed is not None \
+                and assembly is self._displayed[0] \
+                and assembly.revision == self._displayed[1]:
+            self.Layout()
+            return
+        self.erase_all()
+        self._displayed = (assembly, assembly.revision) \
+            if assembly is not None else None
+        if assembly is not None:
+            try:
+                self.display_assembly(assembly, transparency=0.4)
+            except KeyError as ke:
+                self.erase_all()
+                self._displayed = None
+                logger.exception(ke)
         self.Layout()
+        logger.debug("code change detected in graph panel")
 
-        logger.debug("code change detected in 3D panel")
+    def _load_failed(self, exception):
+        r"""Clear the view after a failed load (UI thread)"""
+        self.erase_all()
+        self._displayed = None
+        self.Layout()
 
     def display_part(self, part, color_255=None, transparency=0.):
         r"""Display a single Part (shape + anchors)
@@ -115,6 +146,11 @@ class GraphPanel(Wx3dViewer):
     def display_assembly(self, assembly, transparency=0.):
         r"""Display an assembly of parts and assemblies
 
+        The nodes are spheres at their centres of mass, batched in one
+        compound per color, and the edges are batched in a single compound.
+        The constraint names are only displayed if there are no more than
+        max_edge_labels edges.
+
         Parameters
         ----------
         assembly : AssemblyGeometryNode
@@ -123,67 +159,41 @@ class GraphPanel(Wx3dViewer):
         """
         assembly.build()
 
+        builder = BRep_Builder()
+        spheres = dict()  # color -> compound of the spheres of that color
+        centres = dict()
         for i, node in enumerate(assembly.nodes()):
-
-            # display a sphere at the barycentre
-            from OCC.Core.BRepPrimAPI import BRepPrimAPI_MakeSphere
-            sphere = BRepPrimAPI_MakeSphere(_centre_of_mass(node.node_shape.shape),
-                                            _characteristic_dimension(node.node_shape.shape) / 10.)
-            sphere.Build()
-            self.display_shape(sphere.Shape(),
-                               # color_=colour_wx_to_occ((randint(0, 255),
-                               #                          randint(0, 255),
-                               #                          randint(0, 255))),
-                               color_=colour_wx_to_occ(color_from_sequence(i, "colors")),
+            _, centre, dimension = node_mass_properties(node)
+            centres[node] = gp_Pnt(*centre)
+            color_255 = color_from_sequence(i, "colors")
+            if color_255 not in spheres:
+                spheres[color_255] = TopoDS_Compound()
+                builder.MakeCompound(spheres[color_255])
+            builder.Add(spheres[color_255],
+                        BRepPrimAPI_MakeSphere(centres[node],
+                                               dimension / 10.).Shape())
+
+        for color_255, compound in spheres.items():
+            self.display_shape(compound,
+                               color_=colour_wx_to_occ(color_255),
                                transparency=transparency)
 
-            # self._display_anchors(assembly.anchors)
-
-        for edge in assembly.edges(data=True):
-            start = _centre_of_mass(edge[0].node_shape.shape)  # gp_Pnt
-            end = _centre_of_mass(edge[1].node_shape.shape)  # gp_Pnt
-
-            vec = gp_Vec(end.X() - start.X(),
-                         end.Y() - start.Y(),
-                         end.Z() - start.Z())
-            from OCC.Core.BRepBuilderAPI import BRepBuilderAPI_MakeEdge
-            e = BRepBuilderAPI_MakeEdge(start, end)
-
-            self.display_shape(e.Shape())
-
-            edge_constraint = assembly.get_edge_data(edge[0],
-                                                 edge[1])["object"]
-
-            self.display_message(gp_Pnt((start.X() + 2 * end.X()) / 3,
-                                        (start.Y() + 2 * end.Y()) / 3,
-                                        (start.Z() + 2 * end.Z()) / 3),
-                                 text_to_write=edge_constraint.__class__.__name__,
-                                 height=13,
-                                 message_color=(0, 0, 0))  # black
+        edges = TopoDS_Compound()
+        builder.MakeCompound(edges)
+        labels = len(assembly.edges()) <= self.max_edge_labels
+        for start_node, end_node, data in assembly.edges(data=True):
+            start = centres[start_node]
+            end = centres[end_node]
+            if start.Distance(end) > 0.:
+                builder.Add(edges, BRepBuilderAPI_MakeEdge(start, end).Edge())
+
+            if labels is True:
+                self.display_message(
+                    gp_Pnt((start.X() + 2 * end.X()) / 3,
+                           (start.Y() + 2 * end.Y()) / 3,
+                           (start.Z() + 2 * end.Z()) / 3),
+                    text_to_write=data["object"].__class__.__name__,
+                    height=13,
+                    message_color=(0, 0, 0))  # black
+        self.display_shape(edges)
         self.viewer_display.FitAll()
-
-
-@memoize
-def _centre_of_mass(shape):
-    r"""
-    
-    Parameters
-    ----------
-    shape : OCC Shape
-
-    Returns
-    -------
-    gp_Pnt
-
-    """
-    from OCC.Core.BRepGProp import brepgprop_VolumeProperties
-    from OCC.Core.GProp import GProp_GProps
-    g = GProp_GProps()
-    brepgprop_VolumeProperties(shape, g)
-    return g.CentreOfMass()
-
-
-def _characteristic_dimension(shape):
-    from aocutils.analyze.bounds import BoundingBox
-    bb = BoundingBox(shape)
-    return (bb.x_span + bb.y_span + bb.z_span) / 3.
@@ -93,10 +93,28 @@ class OsvCadUiFrame(wx.Frame):
             wx.MessageBox(msg, 'Warning', wx.OK | wx.ICON_WARNING)
 
         self.model = model
+        # coalesce the bursts of selections
+        try:
+            self.model.notification_delay = \
+                float(self.config["model"]["notification_delay"])
+        except (TypeError, KeyError):
+            self.model.notification_delay = 0.15
+        self.model.call_later = \
+            lambda delay, callback: wx.CallLater(int(delay * 1000), callback)
+
+        # share the shapes of the copies of a geometry
+        self.shape_store = None
+        try:
+            if self.config["shape_store"]["enabled"] == "True":
+                from osvcad.nodes import Part
+                from osvcad.store import ShapeStore
+                self.shape_store = Part.shape_store = ShapeStore()
+        except (TypeError, KeyError):
+            pass
 
         # Panels
         self.log_panel = LogPanel(self,
-                                  threadsafe=False,
+                                  threadsafe=True,
                                   format_='%(asctime)s :: %(levelname)6s :: '
                                           '%(name)20s :: %(lineno)3d :: '
                                           '%(message)s')
@@ -295,6 +313,11 @@ class OsvCadUiFrame(wx.Frame):
         event : wx.event
 
         """
+        for observer in self.model.timings:
+            logger.info("Observer timing : %s" % observer)
+        if self.shape_store is not None:
+            self.shape_store.close()
+            logger.info("Shape store : %s" % self.shape_store.report())
         if self.confirm_close is True:
             dlg = wx.MessageDialog(self,
                                    "Do you really want to close "
@@ -3,20 +3,136 @@
 r"""Model of the waterline app"""
 
 import sys
+import importlib.util
 import logging
+import threading
+import time
+from hashlib import sha1
+from os.path import abspath, splitext
 
 from atom.api import Atom
-from atom.scalars import Str
+from atom.scalars import Str, Value, Float
+
+from corelib.core.python_ import is_valid_python
+
+from osvcad.dependencies import DependencyTracker
 
 logger = logging.getLogger(__name__)
 
+# Delay (s) before trying again to rebuild after a save while a file is being
+# evaluated
+REBUILD_RETRY_DELAY = 0.2
+
+
+class Evaluation(object):
+    r"""The result of running a Python file
+
+    Parameters
+    ----------
+    path : str
+        Path to the Python file
+    content_hash : str
+        sha1 of the file content when it was run
+
+    """
+    def __init__(self, path, content_hash):
+        self.path = path
+        self.content_hash = content_hash
+        self.module = None
+        self.assembly = None
+        self.part = None
+        self.error = None
+
+    @property
+    def has_assembly(self):
+        r"""Does the file define an 'assembly' variable?"""
+        return self.assembly is not None
+
+    @property
+    def has_part(self):
+        r"""Does the file define a 'part' variable?"""
+        return self.part is not None
+
+    def __repr__(self):
+        return "Evaluation of %s (%s)" % (self.path, self.content_hash)
+
+
+class TimedObserver(object):
+    r"""Observer callback that records the time spent in each call
+
+    Parameters
+    ----------
+    topic : str
+    callback : callable
+    slow : float
+        Duration in seconds above which a call is logged as slow
+
+    """
+    def __init__(self, topic, callback, slow):
+        self.topic = topic
+        self.callback = callback
+        self.slow = slow
+        self.name = getattr(callback, "__qualname__", repr(callback))
+        self.calls = 0
+        self.total = 0.
+        self.maximum = 0.
+
+    @property
+    def mean(self):
+        r"""Mean duration of a call, in seconds"""
+        return self.total / self.calls if self.calls > 0 else 0.
+
+    def __call__(self, argument):
+        start = time.perf_counter()
+        try:
+            return self.callback(argument)
+        finally:
+            duration = time.perf_counter() - start
+            self.calls += 1
+            self.total += duration
+            self.maximum = max(self.maximum, duration)
+            if duration > self.slow:
+                logger.warning("%s took %.3f s to handle %s" %
+                               (self.name, duration, self.topic))
+
+    def __repr__(self):
+        return "%s (%s) : %i calls, %.3f s total, %.3f s mean, " \
+               "%.3f s max" % (self.name, self.topic, self.calls, self.total,
+                               self.mean, self.maximum)
+
 
 class Model(Atom):
-    r"""Model for the waterline app"""
+    r"""Model for the waterline app
+
+    The selection changes are notified after notification_delay seconds
+    without a new change, if call_later is set : a burst of selections (e.g.
+    arrow keys in the tree) results in a single notification of the latest
+    selection. The observers are timed (see timings).
+
+    """
     root_folder = Str()
     selected = Str()
     code = Str()
 
+    # coalescing of the notifications
+    notification_delay = Float(0.)
+    # call_later(delay, callback) -> object with a Stop() method, calls
+    # callback after delay seconds in the UI thread (e.g. wx.CallLater).
+    # None : notify immediately
+    call_later = Value()
+    _pending = Value(factory=dict)
+
+    # per observer timings
+    slow_observer = Float(0.5)
+    _observers = Value(factory=dict)
+
+    # last evaluation of each Python file, by path
+    evaluations = Value(factory=dict)
+    evaluation_lock = Value(factory=threading.Lock)
+
+    # files -> Parts of the evaluated assemblies
+    tracker = Value(factory=DependencyTracker)
+
     def set_root_folder(self, root_folder):
         r"""Set the root folder
         
@@ -35,7 +151,202 @@ class Model(Atom):
         logger.debug("Setting the selected item")
         self.selected = selected
         logger.debug("Notify that selected item changed")
-        self.notify("selected_changed", None)
+        self.notify_later("selected_changed", None)
+
+    def observe(self, topic, callback):
+        r"""Observe a topic, timing the calls of the callback"""
+        key = (topic, callback)
+        if key not in self._observers:
+            self._observers[key] = TimedObserver(topic,
+                                                 callback,
+                                                 self.slow_observer)
+        super(Model, self).observe(topic, self._observers[key])
+
+    def unobserve(self, topic, callback):
+        r"""Stop observing a topic"""
+        observer = self._observers.pop((topic, callback), None)
+        if observer is not None:
+            super(Model, self).unobserve(topic, observer)
+
+    def notify_later(self, topic, argument):
+        r"""Notify a topic once a burst of changes is over
+
+        A pending notification of the same topic is replaced : only the
+        latest one is delivered.
+
+        Parameters
+        ----------
+        topic : str
+        argument : object
+            Passed to the observers
+
+        """
+        if self.call_later is None or self.notification_delay <= 0.:
+            self.notify(topic, argument)
+            return
+        pending = self._pending.pop(topic, None)
+        if pending is not None:
+            pending.Stop()
+            logger.debug("Coalescing %s notifications" % topic)
+        self._pending[topic] = self.call_later(
+            self.notification_delay,
+            lambda: self._deliver(topic, argument))
+
+    def _deliver(self, topic, argument):
+        self._pending.pop(topic, None)
+        self.notify(topic, argument)
+
+    @property
+    def timings(self):
+        r"""Timings of the observers, the slowest (in total) first
+
+        Returns
+        -------
+        list[TimedObserver]
+
+        """
+        return sorted(self._observers.values(),
+                      key=lambda observer: observer.total,
+                      reverse=True)
+
+    def evaluate(self, path):
+        r"""Run a Python file, once per content
+
+        All the panels share the evaluation: the file is only run again when
+        its content changes. The method is thread safe; a caller asking for
+        a file that is being run waits for the result instead of running it
+        a second time.
+
+        Parameters
+        ----------
+        path : str
+            Path to the Python file
+
+        Returns
+        -------
+        Evaluation
+
+        """
+        # TODO: investigate why importing Part
+        # at top of file causes an app crash
+        from osvcad.nodes import Part
+
+        with open(path, "rb") as f:
+            content = f.read()
+        content_hash = sha1(content).hexdigest()
+
+        with self.evaluation_lock:
+            evaluation = self.evaluations.get(path)
+            if evaluation is not None \
+                    and evaluation.content_hash == content_hash:
+                logger.debug("Reusing %s" % evaluation)
+                return evaluation
+
+            if evaluation is not None and evaluation.has_assembly is True:
+                self.tracker.forget(evaluation.assembly)
+
+            logger.info("Evaluating %s" % path)
+            evaluation = Evaluation(path, content_hash)
+            try:
+                if is_valid_python(content.decode("utf-8")) is not True:
+                    raise SyntaxError("Not a valid python file")
+                spec = importlib.util.spec_from_file_location(
+                    splitext(path)[0], path)
+                module_ = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module_)
+                evaluation.module = module_
+                if hasattr(module_, "assembly"):
+                    module_.assembly.build()
+                    evaluation.assembly = module_.assembly
+                    self.tracker.track(module_.assembly)
+                if hasattr(module_, "part"):
+                    evaluation.part = Part(module_.part,
+                                           getattr(module_, "anchors", dict()))
+            except Exception as e:
+                logger.exception(e)
+                evaluation.error = e
+            self.evaluations[path] = evaluation
+            return evaluation
+
+    def file_saved(self, path, changed_lines=None):
+        r"""Update the evaluations after a file has been saved and refresh
+        the views
+
+        The Parts that depend on the file are rebuilt in the evaluated
+        assemblies, which are patched in place: if the displayed assembly is
+        one of them, its observers are notified with "assembly_updated" and
+        patch what they display. A Python file no Part depends on may be a
+        module imported by the evaluated scripts (e.g. a sub-assembly
+        module): it is unloaded and the displayed script is evaluated again.
+        The saved script is only evaluated again if it is the displayed one.
+
+        Parameters
+        ----------
+        path : str
+            Path to the saved file
+        changed_lines : list[tuple(int, int)] or None, optional
+            Ranges of lines (first, last) modified since the previous save.
+            None (the default) if unknown. An empty list means that the
+            content did not change : nothing is rebuilt
+
+        """
+        if changed_lines is not None:
+            if len(changed_lines) == 0:
+                logger.info("%s saved without modification" % path)
+                return
+            logger.info("%s saved, modified lines : %s" %
+                        (path, ", ".join("%i-%i" % (first + 1, last + 1)
+                                         for first, last in changed_lines)))
+        self._rebuild(path)
+
+    def _rebuild(self, path):
+        r"""Rebuild what depends on a saved file (see file_saved())
+
+        The UI thread never waits for an evaluation running in a worker
+        thread: if the evaluation lock is taken, the rebuild is tried again
+        REBUILD_RETRY_DELAY seconds later (it waits for the lock only if
+        call_later is not set).
+
+        """
+        if not self.evaluation_lock.acquire(False):
+            if self.call_later is not None:
+                logger.debug("Evaluation in progress, rebuild after the save "
+                             "of %s postponed" % path)
+                self.call_later(REBUILD_RETRY_DELAY,
+                                lambda: self._rebuild(path))
+                return
+            self.evaluation_lock.acquire()
+        displayed = self.evaluations.get(self.selected)
+        unloaded = False
+        try:
+            updated = self.tracker.rebuild(path)
+            if len(updated) == 0 and path.endswith(".py") \
+                    and path not in self.evaluations:
+                for name, module_ in list(sys.modules.items()):
+                    module_file = getattr(module_, "__file__", None)
+                    if module_file is not None \
+                            and abspath(module_file) == abspath(path):
+                        logger.info("Unloading module %s" % name)
+                        del sys.modules[name]
+                        unloaded = True
+                for evaluation in self.evaluations.values():
+                    if evaluation.has_assembly is True:
+                        self.tracker.forget(evaluation.assembly)
+                self.evaluations.clear()
+        finally:
+            self.evaluation_lock.release()
+
+        if self.selected != "" and abspath(path) == abspath(self.selected):
+            # the script changed : it is run again
+            self.set_selected(self.selected)
+        elif unloaded is True:
+            # the displayed script may import the module
+            self.set_selected(self.selected)
+        elif displayed is not None and displayed.has_assembly is True \
+                and any(assembly is displayed.assembly
+                        for assembly in updated):
+            logger.info("Patching the displayed assembly")
+            self.notify("assembly_updated", displayed.assembly)
 
     # def set_code(self, code):
     #     r"""Set the code
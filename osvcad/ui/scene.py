@@ -0,0 +1,205 @@
+# coding: utf-8
+
+r"""Incremental display of the content of a 3D viewer
+
+The objects displayed in a viewer are kept in a map by key, so that a new
+content only adds the objects that are new, removes the ones that are gone
+and moves the ones whose placement changed, instead of erasing and
+displaying everything again on every selection.
+
+Shapes are displayed in their source frame and placed by the local
+transformation of their interactive object (AIS location): moving a part
+does not rebuild its presentation, and the instances of a source shape share
+their triangulation.
+
+"""
+
+import logging
+
+import numpy as np
+from OCC.Core.gp import gp_Pnt
+
+from aocutils.display.wx_viewer import colour_wx_to_occ
+
+from osvcad.geometry import location_from_matrix
+
+logger = logging.getLogger(__name__)
+
+
+class SceneContent(object):
+    r"""What a viewer should display
+
+    The shapes are identified by a key: 2 shapes with the same key are
+    considered the same geometry with the same display attributes. The
+    glyphs and the labels are not diffed, they are replaced on every update.
+
+    """
+    def __init__(self):
+        self.shapes = list()
+        self.glyphs = list()
+        self.labels = list()
+        # assembly node -> keys of its shapes, to move the node afterwards
+        self.node_keys = dict()
+
+    def add_shape(self, key, shape, matrix=None, color_255=(255, 255, 255),
+                  transparency=0., node=None):
+        r"""Add a shape to the content
+
+        Parameters
+        ----------
+        key : hashable
+            Identity of the shape and of its display attributes
+        shape : TopoDS_Shape
+            The shape, in its source frame
+        matrix : np.ndarray or None, optional (default is None)
+            4x4 placement of the shape, None for identity
+        color_255 : tuple of integers from 0 to 255
+        transparency : float from 0 to 1
+        node : GeometryNode or None, optional (default is None)
+            The assembly node the shape belongs to
+
+        """
+        if matrix is None:
+            matrix = np.identity(4)
+        self.shapes.append((key, shape, matrix, color_255, transparency))
+        if node is not None:
+            self.node_keys.setdefault(node, list()).append(key)
+
+    def add_glyph(self, shape, color_255):
+        r"""Add a shape that is displayed as is, without diff"""
+        self.glyphs.append((shape, color_255))
+
+    def add_label(self, position, text, height, color):
+        r"""Add a text label
+
+        Parameters
+        ----------
+        position : tuple(float, float, float)
+        text : str
+        height : int
+        color : tuple of floats from 0 to 1
+
+        """
+        self.labels.append((position, text, height, color))
+
+
+def _single(ais):
+    r"""DisplayShape returns a list when it displays several objects"""
+    return ais[0] if isinstance(ais, list) else ais
+
+
+class Scene(object):
+    r"""Displayed objects of a viewer, by key
+
+    Parameters
+    ----------
+    viewer_display : OCC.Display.OCCViewer.Viewer3d
+
+    """
+    def __init__(self, viewer_display):
+        self.viewer_display = viewer_display
+        # key -> (shape, AIS object, matrix). The shape is referenced so that
+        # keys built from id(shape) stay valid
+        self._objects = dict()
+        self._glyphs = list()
+        self._labels = list()
+        self.node_keys = dict()
+
+    @property
+    def keys(self):
+        r"""Keys of the displayed shapes"""
+        return set(self._objects.keys())
+
+    def update(self, content):
+        r"""Make the viewer display the content with as few changes as
+        possible
+
+        Parameters
+        ----------
+        content : SceneContent
+
+        Returns
+        -------
+        tuple(int, int, int) : number of added, moved and removed shapes
+
+        """
+        context = self.viewer_display.Context
+        wanted = set(key for key, _, _, _, _ in content.shapes)
+
+        removed = 0
+        for key in list(self._objects.keys()):
+            if key not in wanted:
+                context.Remove(self._objects.pop(key)[1], False)
+                removed += 1
+
+        added, moved = 0, 0
+        for key, shape, matrix, color_255, transparency in content.shapes:
+            if key in self._objects:
+                _, ais, displayed_matrix = self._objects[key]
+                if not np.allclose(matrix, displayed_matrix):
+                    context.SetLocation(ais, location_from_matrix(matrix))
+                    self._objects[key] = (shape, ais, matrix)
+                    moved += 1
+                continue
+            ais = _single(self.viewer_display.DisplayShape(
+                shape,
+                color=colour_wx_to_occ(color_255),
+                transparency=transparency,
+                update=False))
+            if not np.allclose(matrix, np.identity(4)):
+                context.SetLocation(ais, location_from_matrix(matrix))
+            self._objects[key] = (shape, ais, matrix)
+            added += 1
+
+        self._replace_overlays(content)
+        self.node_keys = content.node_keys
+        context.UpdateCurrentViewer()
+        logger.debug("Scene update : %i added, %i moved, %i removed" %
+                     (added, moved, removed))
+        return added, moved, removed
+
+    def move(self, key, matrix):
+        r"""Relocate a displayed shape
+
+        The viewer is not updated, call redraw() after moving shapes
+
+        Parameters
+        ----------
+        key : hashable
+        matrix : np.ndarray
+            New 4x4 placement of the shape
+
+        """
+        shape, ais, _ = self._objects[key]
+        self.viewer_display.Context.SetLocation(ais,
+                                                location_from_matrix(matrix))
+        self._objects[key] = (shape, ais, matrix)
+
+    def redraw(self):
+        r"""Update the viewer after moves"""
+        self.viewer_display.Context.UpdateCurrentViewer()
+
+    def _replace_overlays(self, content):
+        r"""Replace the glyphs and labels"""
+        context = self.viewer_display.Context
+        for ais in self._glyphs:
+            context.Remove(ais, False)
+        for structure in self._labels:
+            structure.Erase()
+        self._glyphs = [_single(self.viewer_display.DisplayShape(
+                            shape, color=colour_wx_to_occ(color_255),
+                            update=False))
+                        for shape, color_255 in content.glyphs]
+        self._labels = [self.viewer_display.DisplayMessage(
+                            gp_Pnt(*position), text, height=height,
+                            message_color=color)
+                        for position, text, height, color in content.labels]
+
+    def forget(self):
+        r"""Forget the displayed objects, when the viewer has been erased by
+        other means"""
+        self._objects.clear()
+        self._glyphs = list()
+        self._labels = list()
+        self.node_keys = dict()
+
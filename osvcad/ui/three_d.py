@@ -4,28 +4,32 @@ r"""3D visualization of geometry"""
 
 from __future__ import division
 
-import imp
-from os.path import isdir, splitext
+from functools import partial
+from os.path import isdir, splitext, getmtime
 from random import randint
 import logging
-import json
-import math
+import time
 
+import numpy as np
 import wx
-from OCC.Core.gp import gp_Pnt, gp_Vec
+from OCC.Core.gp import gp_Pnt
 
-from corelib.core.python_ import is_valid_python
 from aocutils.display.wx_viewer import Wx3dViewer, colour_wx_to_occ
-from aocutils.analyze.bounds import BoundingBox
-from aocutils.brep.edge_make import edge
 from aocxchange.step import StepImporter
 from aocxchange.iges import IgesImporter
 from aocxchange.stl import StlImporter
 
+from osvcad.kinematics import ConstraintSweep
 from osvcad.ui.sequences import color_from_sequence
+from osvcad.ui.worker import BackgroundLoader
+from osvcad.ui.glyphs import anchors_glyphs
+from osvcad.ui.scene import Scene, SceneContent
 
 logger = logging.getLogger(__name__)
 
+# Returned by a load that displays its geometry progressively
+_DISPLAYED = "displayed"
+
 
 class ThreeDPanel(Wx3dViewer):
     r"""Panel containing topology information about the loaded shape"""
@@ -34,17 +38,30 @@ class ThreeDPanel(Wx3dViewer):
                  model,
                  viewer_background_color=(50., 50., 50.),
                  object_transparency=0.2, text_height=20,
-                 text_colour=(0., 0., 0.)):
+                 text_colour=(0., 0., 0.),
+                 anchor_labels=True,
+                 max_anchor_labels=50):
         super(ThreeDPanel, self).__init__(parent=parent,
                                           viewer_background_color=viewer_background_color)
         self.model = model
         self.model.observe("selected_changed", self.on_selected_change)
+        self.model.observe("assembly_updated", self.on_assembly_updated)
 
         self.viewer_display.View.SetBackgroundColor(colour_wx_to_occ(viewer_background_color))
 
         self.objects_transparency = object_transparency
         self.text_height = text_height
         self.text_colour = text_colour
+        self.anchor_labels = anchor_labels
+        self.max_anchor_labels = max_anchor_labels
+
+        self.loader = BackgroundLoader("3d loader")
+        self.scene = Scene(self.viewer_display)
+
+        # kinematic playback
+        self._playback = None
+        self._playback_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self._on_playback_frame, self._playback_timer)
 
         self.Bind(wx.EVT_SIZE, self.OnSize)
 
@@ -52,183 +69,208 @@ class ThreeDPanel(Wx3dViewer):
         self.Layout()
 
     def on_selected_change(self, change):
-        """Callback function for listener"""
+        """Callback function for listener
 
-        # TODO: investigate why importing Part
-        # at top of file causes an app crash
-        from osvcad.nodes import Part
+        The selection is loaded in a worker thread; a newer selection cancels
+        the load of the previous one.
 
+        """
         logger.debug("Selection changed")
+        self.stop_playback()
+        self.loader.submit(partial(self._load, self.model.selected),
+                           on_done=self._show,
+                           on_error=self._load_failed)
+
+    def on_assembly_updated(self, assembly):
+        r"""Callback for a displayed assembly patched in place (see
+        Model.file_saved())
+
+        The scene is updated by diff: only the rebuilt shapes are displayed
+        again and the moved ones are relocated.
+
+        """
+        logger.debug("Displayed assembly updated")
+        self.stop_playback()
+        self.scene.update(self.assembly_content(assembly))
+
+    def _load(self, sel, token):
+        r"""Load and build the geometry of the selection (worker thread)
+
+        Parameters
+        ----------
+        sel : str
+            Path to the selected file or folder
+        token : osvcad.ui.worker.CancelToken
 
-        sel = self.model.selected
-
-        if not isdir(sel):
-            # what extension ?
-            ext = splitext(sel)[1].lower()
-
-            logger.info("File extension : %s" % ext)
-
-            if ext == ".py":
-                with open(sel) as f:
-                    content = f.read()
-
-                if is_valid_python(content) is True:
-                    with wx.BusyInfo("Loading Python defined geometry ...") as _:
-                        module_ = imp.load_source(sel, sel)
-                    has_part = hasattr(module_, "part")
-                    has_assembly = hasattr(module_, "assembly")
-                    has_anchors = hasattr(module_, "anchors")
-
-                    self.erase_all()
-
-                    if has_assembly is True:
-                        logger.info("%s has assembly" % sel)
-                        try:
-                            self.display_assembly(module_.assembly)
-                            self.viewer_display.FitAll()
-                        except KeyError as ke:
-                            self.erase_all()
-                            logger.exception(ke)
-                    else:
-                        if has_part is True:
-                            logger.info("%s has part" % sel)
-                            if has_anchors:
-                                p = Part.from_py_script(sel)
-                                self.display_part(p, transparency=0.3)
-                                self.viewer_display.FitAll()
-                            else:
-                                self.display_part(module_.part)
-                                self.viewer_display.FitAll()
-                        else:
-                            self.erase_all()
-                            logger.warning("Nothing to display")
-                else:  # the file is not a valid Python file
-                    logger.warning("Not a valid python file")
-                    self.erase_all()
-
-            elif ext in [".step", ".stp"]:
-                self.erase_all()
-                with wx.BusyInfo("Loading STEP ...") as _:
-                    shapes = StepImporter(sel).shapes
-                    logger.info("%i shapes in %s" % (len(shapes), sel))
-                    for shape in shapes:
-                        color_255 = (255, 255, 255)
-                        self.display_shape(shape,
-                                           color_=colour_wx_to_occ(color_255),
-                                           transparency=0.1)
-                        self.viewer_display.FitAll()
-
-            elif ext in [".iges", ".igs"]:
-                self.erase_all()
-                with wx.BusyInfo("Loading IGES ...") as _:
-                    shapes = IgesImporter(sel).shapes
-                    logger.info("%i shapes in %s" % (len(shapes), sel))
-                    for shape in shapes:
-                        color_255 = (51, 255, 255)
-                        self.display_shape(shape,
-                                           color_=colour_wx_to_occ(color_255),
-                                           transparency=0.1)
-                        self.viewer_display.FitAll()
-
-            elif ext == ".stl":
-                self.erase_all()
-                with wx.BusyInfo("Loading STL ...") as _:
-                    shape = StlImporter(sel).shape
-                    color_255 = (0, 255, 0)
-                    self.display_shape(shape,
-                                       color_=colour_wx_to_occ(color_255),
-                                       transparency=0.1)
-                    self.viewer_display.FitAll()
-
-            elif ext == ".json":  # parts library
-                self.erase_all()
-
-                with wx.BusyInfo("Loading parts library ...") as _:
-                    with open(sel) as json_file:
-                        json_file_content = json.load(json_file)
-                        # print(json_file_content["data"].keys())
-                        # find the biggest bounding box
-                        biggest_bb = [0, 0, 0]
-                        # smallest_bb = [0, 0, 0]
-                        for i, k in enumerate(json_file_content["data"].keys()):
-                            library_part = Part.from_library_part(sel, k)
-                            bb = BoundingBox(library_part.node_shape.shape)
-                            if bb.x_span > biggest_bb[0]:
-                                biggest_bb[0] = bb.x_span
-                            # if bb.x_span < smallest_bb[0]:
-                            #     smallest_bb[0] = bb.x_span
-                            if bb.y_span > biggest_bb[1]:
-                                biggest_bb[1] = bb.y_span
-                            # if bb.y_span < smallest_bb[1]:
-                            #     smallest_bb[1] = bb.y_span
-                            if bb.z_span > biggest_bb[2]:
-                                biggest_bb[2] = bb.z_span
-                            # if bb.z_span < smallest_bb[2]:
-                            #     smallest_bb[2] = bb.y_span
-                        biggest_dimension = max(biggest_bb)
-                        # smallest_dimension = min(smallest_bb)
-
-                        nb_per_row = int(math.sqrt(len(json_file_content["data"].keys())))
-
-                        for i, k in enumerate(json_file_content["data"].keys()):
-                            library_part = Part.from_library_part(sel, k)
-                            x_pos = biggest_dimension*2 * (i % nb_per_row)
-                            y_pos = biggest_dimension*2 * (i // nb_per_row)
-                            library_part = library_part.translate((x_pos, y_pos, 0))
-                            self.display_part(library_part, transparency=0.3)
-                            self.display_message(gp_Pnt(x_pos + biggest_dimension / 5, y_pos + biggest_dimension / 5, 0),
-                                                 k,
-                                                 message_color=(1, 1, 1),
-                                                 height=10)
-                            self.viewer_display.FitAll()
-            elif ext == ".stepzip":
-                self.erase_all()
-                with wx.BusyInfo("Loading STEPZIP ...") as _:
-                    self.display_part(Part.from_stepzip(sel), transparency=0.3)
-                    self.viewer_display.FitAll()
-            elif ext == ".anchors":
-                self.erase_all()
+        Returns
+        -------
+        SceneContent or None or _DISPLAYED
+            The content to display. None if there is nothing to display,
+            _DISPLAYED if the geometry has already been displayed while
+            loading
+
+        """
+        # TODO: investigate why importing Part
+        # at top of file causes an app crash
+        from osvcad.nodes import Part
+        from osvcad.library import library_part_ids, load_library, \
+            ShelfLayout
+
+        if isdir(sel):  # a directory is selected
+            return None
+
+        # what extension ?
+        ext = splitext(sel)[1].lower()
+
+        logger.info("File extension : %s" % ext)
+
+        if ext == ".py":
+            evaluation = self.model.evaluate(sel)
+            token.check()
+
+            if evaluation.has_assembly is True:
+                logger.info("%s has assembly" % sel)
+                try:
+                    return self.assembly_content(evaluation.assembly)
+                except KeyError as ke:
+                    logger.exception(ke)
+                    return None
+            elif evaluation.has_part is True:
+                logger.info("%s has part" % sel)
+                return self.part_content(evaluation.part, transparency=0.3)
             else:
-                logger.error("File has an extension %s that is not "
-                             "handled by the 3D panel" % ext)
-                self.erase_all()
+                logger.warning("Nothing to display")
+                return None
+
+        elif ext in [".step", ".stp"]:
+            logger.info("Loading STEP ...")
+            shapes = StepImporter(sel).shapes
+            logger.info("%i shapes in %s" % (len(shapes), sel))
+            return self._shapes_content(sel, shapes, (255, 255, 255))
+
+        elif ext in [".iges", ".igs"]:
+            logger.info("Loading IGES ...")
+            shapes = IgesImporter(sel).shapes
+            logger.info("%i shapes in %s" % (len(shapes), sel))
+            return self._shapes_content(sel, shapes, (51, 255, 255))
+
+        elif ext == ".stl":
+            logger.info("Loading STL ...")
+            shape = StlImporter(sel).shape
+            return self._shapes_content(sel, [shape], (0, 255, 0))
+
+        elif ext == ".json":  # parts library
+            logger.info("Loading parts library ...")
+            # the parts are displayed as soon as they are loaded
+            token.post(self._erase)
+            layout = ShelfLayout.square(len(library_part_ids(sel)))
+            for k, library_part, (minimum, maximum) in load_library(sel):
+                token.check()
+                x_pos, y_pos, z_pos = layout.place(minimum, maximum)
+                library_part = library_part.translate((x_pos, y_pos, z_pos))
+                label_position = gp_Pnt(minimum[0] + x_pos,
+                                        minimum[1] + y_pos,
+                                        maximum[2])
+                token.post(self._display_library_part,
+                           k,
+                           library_part,
+                           label_position)
+            return _DISPLAYED
+
+        elif ext == ".stepzip":
+            logger.info("Loading STEPZIP ...")
+            return self.part_content(Part.from_stepzip(sel),
+                                     transparency=0.3)
+        elif ext == ".anchors":
+            return None
+        else:
+            logger.error("File has an extension %s that is not "
+                         "handled by the 3D panel" % ext)
+            return None
+
+    def _show(self, content):
+        r"""Display the result of _load() (UI thread)
+
+        A SceneContent is displayed by diff with what is already displayed:
+        selecting the same assembly again, or an assembly that shares parts
+        with the displayed one, only updates what changed.
 
-        else:  # a directory is selected
-            self.erase_all()
+        """
+        if content is _DISPLAYED:
+            self.viewer_display.FitAll()
+        elif content is None:
+            self._erase()
+        else:
+            self.scene.update(content)
+            self.viewer_display.FitAll()
+        self.Layout()
+        logger.debug("code change detected in 3D panel")
 
+    def _load_failed(self, exception):
+        r"""Clear the view after a failed load (UI thread)"""
+        self._erase()
         self.Layout()
 
-        logger.debug("code change detected in 3D panel")
+    def _erase(self):
+        r"""Erase everything, including what the scene does not manage"""
+        self.erase_all()
+        self.scene.forget()
 
-    def _display_anchors(self, anchors):
-        for k, anchor in anchors.items():
-            vec_direction = gp_Vec(*anchor["direction"])
-            vec_direction.Multiply(100. / vec_direction.Magnitude())
+    @staticmethod
+    def _shapes_content(path, shapes, color_255):
+        r"""Content of the shapes of a CAD file
 
-            to_arrow_cone_start = gp_Vec(vec_direction.X(), vec_direction.Y(), vec_direction.Z())
-            to_arrow_cone_start.Multiply(4./5.)
+        The shapes are identified by the file and its modification time:
+        selecting the same unchanged file again does not redisplay them.
 
-            arrow_cone = gp_Vec(vec_direction.X(), vec_direction.Y(), vec_direction.Z())
-            arrow_cone.Multiply(1./5.)
+        """
+        content = SceneContent()
+        mtime = getmtime(path)
+        for i, shape in enumerate(shapes):
+            content.add_shape((path, mtime, i), shape,
+                              color_255=color_255,
+                              transparency=0.1)
+        return content
+
+    def _display_library_part(self, k, library_part, label_position):
+        self.display_shape(library_part.node_shape.shape,
+                           color_=colour_wx_to_occ((102, 0, 102)),
+                           transparency=0.3)
+        self.display_message(label_position,
+                             k,
+                             message_color=(1, 1, 1),
+                             height=10)
+        self.viewer_display.FitAll()
+
+    def _add_anchors(self, content, anchors):
+        r"""Add anchors to a content as 2 batched glyphs (segments and
+        arrowheads)
+
+        The anchor names are only displayed if anchor_labels is True and
+        there are no more than max_anchor_labels anchors: past that number,
+        the labels clutter the view and slow it down.
 
-            edge_start = gp_Pnt(*anchor["position"])
-            edge_end = edge_start.Translated(vec_direction)
+        """
+        if len(anchors) == 0:
+            return
+        segments, arrowheads = anchors_glyphs(anchors)
 
-            # Display the line in yellow
-            self.display_shape(edge(edge_start, edge_end),
-                               color_=colour_wx_to_occ((255, 255, 51)))
+        # Display the lines in yellow
+        content.add_glyph(segments, (255, 255, 51))
+        content.add_glyph(arrowheads, (255, 255, 51))
 
-            self.display_vector(
-                arrow_cone,
-                gp_Pnt(*anchor["position"]).Translated(to_arrow_cone_start))
+        if self.anchor_labels is True \
+                and len(anchors) <= self.max_anchor_labels:
+            for k, anchor in anchors.items():
+                content.add_label(tuple(anchor["position"]),
+                                  k,
+                                  height=20,
+                                  color=(0, 0, 0))
 
-            self.display_message(gp_Pnt(*anchor["position"]),
-                                 k,
-                                 height=20,
-                                 message_color=(0, 0, 0))
+    def part_content(self, part, color_255=None, transparency=0.):
+        r"""Content to display a single Part (shape + anchors)
 
-    def display_part(self, part, color_255=None, transparency=0.):
-        r"""Display a single Part (shape + anchors)
+        The source shape of the part is displayed, placed by the part matrix
 
         Parameters
         ----------
@@ -236,6 +278,10 @@ class ThreeDPanel(Wx3dViewer):
         color_255 : tuple of integers from 0 to 255
         transparency : float from 0 to 1
 
+        Returns
+        -------
+        SceneContent
+
         """
         if color_255 is None:
             # color_255 = (randint(0, 255), randint(0, 255), randint(0, 255))
@@ -243,32 +289,151 @@ class ThreeDPanel(Wx3dViewer):
             # by default, always use the same color to view a part
             color_255 = (102, 0, 102)
 
-        self.display_shape(part.node_shape.shape,
-                           color_=colour_wx_to_occ(color_255),
-                           transparency=transparency)
+        content = SceneContent()
+        shape = part.source_shape.shape
+        content.add_shape((id(shape), 0, color_255, transparency),
+                          shape,
+                          part.matrix,
+                          color_255=color_255,
+                          transparency=transparency)
+        self._add_anchors(content, part.anchors)
+        return content
 
-        self._display_anchors(part.anchors)
+    def assembly_content(self, assembly, transparency=0.):
+        r"""Content to display an assembly of parts and assemblies
 
-    def display_assembly(self, assembly, transparency=0.):
-        r"""Display an assembly of parts and assemblies
+        Each Part is displayed as its source shape placed by its world
+        matrix, so that the instances of a shape share their presentation and
+        a moved part is only relocated. The parts of a sub-assembly have the
+        color of the sub-assembly.
 
         Parameters
         ----------
         assembly : AssemblyGeometryNode
         transparency : float from 0 to 1
 
+        Returns
+        -------
+        SceneContent
+
         """
         assembly.build()
 
+        content = SceneContent()
+        occurrences = dict()
         for i, node in enumerate(assembly.nodes()):
-            # for k, v in node.anchors.items():
-            #     frame.p.display_vector(gp_Vec(*node.anchors[k]["direction"]),
-            #                            gp_Pnt(*node.anchors[k]["position"]))
-            self.display_shape(node.node_shape.shape,
-                               # color_=colour_wx_to_occ((randint(0, 255),
-                               #                          randint(0, 255),
-                               #                          randint(0, 255))),
-                               color_=colour_wx_to_occ(color_from_sequence(i, "colors")),
-                               transparency=transparency)
-
-            self._display_anchors(assembly.anchors)
+            color_255 = color_from_sequence(i, "colors")
+            if hasattr(node, "leaves"):
+                leaves = [(part, np.dot(node.matrix, matrix))
+                          for part, matrix in node.leaves()]
+            else:
+                leaves = [(node, node.matrix)]
+            for part, matrix in leaves:
+                shape = part.source_shape.shape
+                # the instances of a shape with the same color are told apart
+                # by their order of occurrence
+                identity = (id(shape), color_255, transparency)
+                occurrence = occurrences.get(identity, 0)
+                occurrences[identity] = occurrence + 1
+                content.add_shape((id(shape), occurrence, color_255,
+                                   transparency),
+                                  shape,
+                                  matrix,
+                                  color_255=color_255,
+                                  transparency=transparency,
+                                  node=node)
+
+        self._add_anchors(content, assembly.anchors)
+        return content
+
+    def display_part(self, part, color_255=None, transparency=0.):
+        r"""Display a single Part (shape + anchors)
+
+        Parameters
+        ----------
+        part : PartGeometryNode
+        color_255 : tuple of integers from 0 to 255
+        transparency : float from 0 to 1
+
+        """
+        self.scene.update(self.part_content(part, color_255, transparency))
+
+    def display_assembly(self, assembly, transparency=0.):
+        r"""Display an assembly of parts and assemblies
+
+        Parameters
+        ----------
+        assembly : AssemblyGeometryNode
+        transparency : float from 0 to 1
+
+        """
+        self.scene.update(self.assembly_content(assembly, transparency))
+
+    def play_constraint(self,
+                        assembly,
+                        master,
+                        slave,
+                        parameter="angle",
+                        start=0.,
+                        stop=360.,
+                        duration=2.,
+                        fps=30,
+                        loop=False):
+        r"""Animate the angle or the distance of the ConstraintAnchor between
+        2 nodes of the displayed assembly
+
+        Each frame only computes the world matrices of the slave and of its
+        descendants and relocates their displayed shapes: nothing is built
+        or displayed again. The anchors are not moved during playback.
+
+        Parameters
+        ----------
+        assembly : Assembly
+            The displayed assembly
+        master, slave : GeometryNode
+            The nodes linked by the ConstraintAnchor
+        parameter : str, optional (default is "angle")
+            "angle" or "distance"
+        start, stop : float, optional (default are 0. and 360.)
+            Range of the swept parameter
+        duration : float, optional (default is 2.)
+            Duration of the sweep in seconds
+        fps : int, optional (default is 30)
+            Frames per second
+        loop : bool, optional (default is False)
+            Start again at the end of the sweep?
+
+        """
+        if parameter not in ("angle", "distance"):
+            raise ValueError("parameter should be 'angle' or 'distance'")
+        sweep = ConstraintSweep(assembly, master, slave)
+        for node in sweep.moved:
+            if node not in self.scene.node_keys:
+                raise ValueError("The assembly is not displayed")
+        self.stop_playback()
+        self._playback = (sweep, parameter, start, stop, duration, loop,
+                          time.time())
+        self._playback_timer.Start(max(1, int(1000 / fps)))
+
+    def stop_playback(self):
+        r"""Stop the kinematic playback, if any"""
+        if self._playback is not None:
+            self._playback_timer.Stop()
+            self._playback = None
+
+    def _on_playback_frame(self, event):
+        r"""Relocate the moved shapes for the current time (timer event)"""
+        if self._playback is None:
+            return
+        sweep, parameter, start, stop, duration, loop, t0 = self._playback
+        progress = (time.time() - t0) / duration
+        progress = progress % 1. if loop is True else min(progress, 1.)
+        value = start + (stop - start) * progress
+
+        for node, matrices in sweep.matrices(**{parameter: value}):
+            for key, matrix in zip(self.scene.node_keys[node], matrices):
+                self.scene.move(key, matrix)
+        self.scene.redraw()
+
+        if loop is False and progress >= 1.:
+            self.stop_playback()
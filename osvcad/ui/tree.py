@@ -4,7 +4,7 @@
 r"""Tree widget"""
 
 import logging
-from os import listdir
+import threading
 from os.path import exists, isdir, normpath, join, basename
 
 import wx
@@ -13,11 +13,42 @@ from wx.lib.pubsub import pub
 
 from corelib.core.files import p_
 
+from osvcad.thumbnails import ThumbnailCache, EXTENSIONS as \
+    THUMBNAIL_EXTENSIONS
 from osvcad.ui.utils import get_file_extension
+from osvcad.ui.watcher import directory_watcher, directory_entries
 
 logger = logging.getLogger(__name__)
 
 
+class ThumbnailPreview(wx.PopupWindow):
+    r"""Full size thumbnail of a CAD file, shown next to the mouse pointer
+    (the icons of the tree are 16x16)"""
+    def __init__(self, parent):
+        wx.PopupWindow.__init__(self, parent)
+        self.bitmap = wx.StaticBitmap(self)
+        self.png_file_path = None
+
+    def show(self, png_file_path, position):
+        r"""Show a thumbnail
+
+        Parameters
+        ----------
+        png_file_path : str
+        position : wx.Point
+            Screen position of the mouse pointer
+
+        """
+        if png_file_path != self.png_file_path:
+            self.bitmap.SetBitmap(wx.Bitmap(png_file_path,
+                                            wx.BITMAP_TYPE_PNG))
+            self.SetClientSize(self.bitmap.GetBestSize())
+            self.png_file_path = png_file_path
+        self.Position(position, (16, 16))
+        if not self.IsShown():
+            self.Show()
+
+
 class Tree(wx.lib.agw.customtreectrl.CustomTreeCtrl):
     """wx.lib.agw.customtreectrl.CustomTreeCtrl
     tailored for osvcad cases manipulation"""
@@ -67,6 +98,22 @@ class Tree(wx.lib.agw.customtreectrl.CustomTreeCtrl):
         self.disabled_extensions = disabled_extensions
         self.excluded_extensions = excluded_extensions
 
+        # thumbnails rendered by the osvcad-thumbnails command line tool
+        self.thumbnails = ThumbnailCache()
+        # file path -> thumbnail, previewed at full size on mouse over
+        self._thumbnail_files = dict()
+        self.preview = ThumbnailPreview(self)
+        self.Bind(wx.EVT_MOTION, self._on_motion)
+        self.Bind(wx.EVT_LEAVE_WINDOW, self._on_leave)
+
+        # loaded (expanded) directories -> their items. The loaded
+        # directories are watched and updated incrementally
+        self._directory_items = dict()
+        self._changed_directories = set()
+        self._changed_lock = threading.Lock()
+        self.watcher = directory_watcher(self._on_directory_changed)
+        self.Bind(wx.EVT_WINDOW_DESTROY, self._on_destroy)
+
         self.add_icon(p_(__file__, './icons/folder.png'),
                       wx.BITMAP_TYPE_PNG,
                       'FOLDER')
@@ -101,10 +148,54 @@ class Tree(wx.lib.agw.customtreectrl.CustomTreeCtrl):
             # The modifications have already been made
             pass
         else:
-            # Simplest option: delete the children at the root
-            self.GetRootItem().DeleteChildren(self)
-            # self._load_dir(self.GetRootItem(), self.root_directory)
-            self._load_dir(self.GetRootItem(), self.model.root_folder)
+            # only update what changed in the loaded directories
+            for directory, item in list(self._directory_items.items()):
+                self._sync_dir(item, directory)
+
+    def _on_destroy(self, event):
+        self.watcher.stop()
+        event.Skip()
+
+    def _on_motion(self, event):
+        r"""Preview the thumbnail of the item under the mouse pointer"""
+        item, _ = self.HitTest(event.GetPosition())
+        png_file_path = None
+        if item is not None:
+            png_file_path = self._thumbnail_files.get(self.GetPyData(item))
+        if png_file_path is None:
+            self.preview.Hide()
+        else:
+            self.preview.show(png_file_path,
+                              self.ClientToScreen(event.GetPosition()))
+        event.Skip()
+
+    def _on_leave(self, event):
+        self.preview.Hide()
+        event.Skip()
+
+    def _on_directory_changed(self, directory):
+        r"""Callback of the watcher (watcher thread)
+
+        The changes are coalesced: a burst of changes in a directory only
+        updates it once.
+
+        """
+        with self._changed_lock:
+            schedule = len(self._changed_directories) == 0
+            self._changed_directories.add(directory)
+        if schedule is True:
+            wx.CallAfter(self._apply_directory_changes)
+
+    def _apply_directory_changes(self):
+        r"""Update the changed directories (UI thread)"""
+        with self._changed_lock:
+            directories = self._changed_directories
+            self._changed_directories = set()
+        for directory in directories:
+            item = self._directory_items.get(directory)
+            if item is not None:
+                logger.debug("%s changed" % directory)
+                self._sync_dir(item, directory)
 
     def add_icon(self, filepath, wxBitmapType, name):
         """ Adds an icon to the imagelist and registers it with the
@@ -136,6 +227,10 @@ class Tree(wx.lib.agw.customtreectrl.CustomTreeCtrl):
             raise Exception("%s is not a valid directory" % root_directory)
 
         self.DeleteAllItems()  # delete existing root, if any
+        for directory in self._directory_items:
+            self.watcher.unwatch(directory)
+        self._directory_items.clear()
+        self._thumbnail_files.clear()
 
         # add directory as root, load direct children and expand
         root_item = self.AddRoot(basename(root_directory),
@@ -155,6 +250,9 @@ class Tree(wx.lib.agw.customtreectrl.CustomTreeCtrl):
         for the given directory and append the items to the tree.
         Throws an exception if the directory is invalid.
 
+        The loaded directory is then watched, its changes are applied
+        incrementally by _sync_dir()
+
         Note
         ----
         Does not add items if the node already has children
@@ -168,46 +266,126 @@ class Tree(wx.lib.agw.customtreectrl.CustomTreeCtrl):
 
         # check if node already has children
         if self.GetChildrenCount(item) == 0:
-            files_and_dirs = listdir(directory)  # get files in directory
-            logger.debug("Directory %s contains : %s" % (directory,
-                                                         str(files_and_dirs)))
-            files = []
-            dirs = []
-            for f in files_and_dirs:
-                if f != "__pycache__":
-                    if isdir(join(directory, f)):
-                        dirs.append(f)
-                    else:
-                        files.append(f)
+            dirs, files = directory_entries(directory,
+                                            self.excluded_extensions)
+            logger.debug("Directory %s contains %i directories and %i files"
+                         % (directory, len(dirs), len(files)))
 
             # add nodes to tree
-            for f in sorted(dirs):
-                # imagekey = self.process_file_extension(join(directory, f))
-                child = self.AppendItem(item,
-                                        f,
-                                        ct_type=0,
-                                        image=self.iconentries['FOLDER'],
-                                        selImage=-1,
-                                        data=normpath(join(directory, f)))
-                self.SetItemHasChildren(child, True)
-
-            for f in sorted(files):
-                imagekey = self.process_file_extension(join(directory, f))
-                if get_file_extension(f) not in self.excluded_extensions:
-                    child = self.AppendItem(item,
-                                            f,
-                                            ct_type=0 if get_file_extension(
-                                                f) not in self.checkable_extensions
-                                            else 1,
-                                            image=imagekey,
-                                            selImage=-1,
-                                            data=normpath(join(directory, f)))
-                    # GF : add the data because it is retrieved by the
-                    # selectionChanged handler
-                    # self.SetPyData(child, Directory(normpath(
-                    #                          join(directory, f))))
-                    if get_file_extension(f) in self.disabled_extensions:
-                        self.EnableItem(child, enable=False, torefresh=False)
+            for f in dirs:
+                self._add_entry(item, directory, f, is_dir=True)
+            for f in files:
+                self._add_entry(item, directory, f, is_dir=False)
+
+        directory = normpath(directory)
+        self._directory_items[directory] = item
+        self.watcher.watch(directory)
+
+    def _add_entry(self, item, directory, name, is_dir, index=None):
+        r"""Add a directory or file item
+
+        Parameters
+        ----------
+        item : GenericTreeItem
+            The item of the directory
+        directory : str
+        name : str
+            Name of the entry in directory
+        is_dir : bool
+        index : int or None, optional (default is None)
+            Position of the new item, None to append it
+
+        """
+        path = normpath(join(directory, name))
+        if is_dir is True:
+            # imagekey = self.process_file_extension(join(directory, f))
+            kwargs = dict(ct_type=0,
+                          image=self.iconentries['FOLDER'],
+                          selImage=-1,
+                          data=path)
+        else:
+            imagekey = self.thumbnail_icon(path)
+            if imagekey is None:
+                imagekey = self.process_file_extension(path)
+            ext = get_file_extension(name)
+            kwargs = dict(ct_type=0 if ext not in self.checkable_extensions
+                          else 1,
+                          image=imagekey,
+                          selImage=-1,
+                          # GF : add the data because it is retrieved by the
+                          # selectionChanged handler
+                          data=path)
+        if index is None:
+            child = self.AppendItem(item, name, **kwargs)
+        else:
+            child = self.InsertItem(item, index, name, **kwargs)
+
+        if is_dir is True:
+            # the children are only listed when the item is expanded
+            self.SetItemHasChildren(child, True)
+        elif get_file_extension(name) in self.disabled_extensions:
+            self.EnableItem(child, enable=False, torefresh=False)
+        return child
+
+    def _sync_dir(self, item, directory):
+        r"""Update the items of a loaded directory after a change on disk
+
+        Only the removed entries are deleted and only the new entries are
+        added: the other items (and their expansion state) are kept.
+
+        """
+        try:
+            dirs, files = directory_entries(directory,
+                                            self.excluded_extensions)
+        except OSError:  # the directory itself has been removed
+            dirs, files = list(), list()
+        wanted = [(name, True) for name in dirs] + \
+                 [(name, False) for name in files]
+        wanted_names = set(name for name, _ in wanted)
+
+        for child in list(item.GetChildren()):
+            if basename(self.GetPyData(child)) not in wanted_names:
+                self._forget_dir(self.GetPyData(child))
+                self._thumbnail_files.pop(self.GetPyData(child), None)
+                self.Delete(child)
+
+        existing = set(basename(self.GetPyData(child))
+                       for child in item.GetChildren())
+        for index, (name, is_dir) in enumerate(wanted):
+            if name not in existing:
+                self._add_entry(item, directory, name, is_dir, index=index)
+
+    def _forget_dir(self, directory):
+        r"""Stop watching a directory and its loaded sub-directories"""
+        for loaded in list(self._directory_items.keys()):
+            if loaded == directory or loaded.startswith(join(directory, "")):
+                self.watcher.unwatch(loaded)
+                del self._directory_items[loaded]
+
+    def thumbnail_icon(self, filename):
+        r"""Key of the icon made from the cached thumbnail of a CAD file
+
+        Parameters
+        ----------
+        filename : str
+
+        Returns
+        -------
+        int or None
+            None if the file has no thumbnail in the cache. The thumbnail
+            itself is previewed when the mouse is over the item
+
+        """
+        if get_file_extension(filename).lower() not in THUMBNAIL_EXTENSIONS:
+            return None
+        png_file_path = self.thumbnails.lookup(filename)
+        if png_file_path is None:
+            return None
+        self._thumbnail_files[filename] = png_file_path
+        # identical files share their thumbnail, hence their icon
+        if png_file_path not in self.iconentries:
+            self.add_icon(png_file_path, wx.BITMAP_TYPE_PNG, png_file_path)
+        return self.iconentries.get(png_file_path)
 
     def process_file_extension(self, filename):
         """Helper function.
@@ -287,6 +465,8 @@ class Tree(wx.lib.agw.customtreectrl.CustomTreeCtrl):
 
         # 0 children -> _load() reloads the children when re-expanded
         item.DeleteChildren(self)
+        # the collapsed directories are not watched anymore
+        self._forget_dir(self.GetPyData(item))
 
         event.Skip()
 
@@ -0,0 +1,210 @@
+# coding: utf-8
+
+r"""Watching of the directories displayed in the file tree
+
+The watchers report the directories whose list of entries changed, so that
+the tree only updates these directories. watchdog (inotify on Linux) is used
+if it is installed, otherwise the watched directories are polled by a
+background thread.
+
+The callbacks are called in the watcher threads.
+
+"""
+
+import logging
+import os
+import threading
+from os.path import dirname, normpath
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    HAS_WATCHDOG = True
+except ImportError:
+    HAS_WATCHDOG = False
+
+logger = logging.getLogger(__name__)
+
+
+def directory_entries(directory, excluded_extensions=None):
+    r"""Sub-directories and files of a directory
+
+    os.scandir gets the type of the entries with the listing, without a
+    stat call per entry on most platforms.
+
+    Parameters
+    ----------
+    directory : str
+    excluded_extensions : list[str] or None, optional (default is None)
+        Extensions of the files that are not listed
+
+    Returns
+    -------
+    tuple(list[str], list[str]) : sorted names of the sub-directories and of
+                                  the files
+
+    """
+    if excluded_extensions is None:
+        excluded_extensions = []
+    dirs, files = list(), list()
+    for entry in os.scandir(directory):
+        if entry.name == "__pycache__":
+            continue
+        try:
+            is_dir = entry.is_dir()
+        except OSError:  # removed in the meantime
+            continue
+        if is_dir:
+            dirs.append(entry.name)
+        elif os.path.splitext(entry.name)[1].lower() \
+                not in excluded_extensions:
+            files.append(entry.name)
+    return sorted(dirs), sorted(files)
+
+
+class PollingWatcher(object):
+    r"""Watches directories by listing them periodically
+
+    Parameters
+    ----------
+    callback : callable
+        Called as callback(directory) when the entries of a watched
+        directory change
+    interval : float, optional (default is 1.)
+        Time between 2 listings of the watched directories, in seconds
+
+    """
+    def __init__(self, callback, interval=1.):
+        self.callback = callback
+        self.interval = interval
+        self._snapshots = dict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _snapshot(directory):
+        try:
+            return frozenset((entry.name, entry.is_dir())
+                             for entry in os.scandir(directory))
+        except OSError:
+            return None
+
+    def watch(self, directory):
+        r"""Start watching a directory (not recursive)"""
+        directory = normpath(directory)
+        snapshot = self._snapshot(directory)
+        with self._lock:
+            self._snapshots[directory] = snapshot
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run,
+                                            name="directory watcher")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def unwatch(self, directory):
+        r"""Stop watching a directory"""
+        with self._lock:
+            self._snapshots.pop(normpath(directory), None)
+
+    def stop(self):
+        r"""Stop watching all directories"""
+        self._stop.set()
+        with self._lock:
+            self._snapshots.clear()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                directories = list(self._snapshots.keys())
+            for directory in directories:
+                snapshot = self._snapshot(directory)
+                with self._lock:
+                    if directory not in self._snapshots \
+                            or self._snapshots[directory] == snapshot:
+                        continue
+                    self._snapshots[directory] = snapshot
+                self.callback(directory)
+
+
+if HAS_WATCHDOG:
+    class _Handler(FileSystemEventHandler):
+        r"""Reports the directory of the created, deleted and moved
+        entries"""
+        def __init__(self, callback):
+            super(_Handler, self).__init__()
+            self.callback = callback
+
+        def on_created(self, event):
+            self.callback(dirname(normpath(event.src_path)))
+
+        def on_deleted(self, event):
+            self.callback(dirname(normpath(event.src_path)))
+
+        def on_moved(self, event):
+            self.callback(dirname(normpath(event.src_path)))
+            self.callback(dirname(normpath(event.dest_path)))
+
+
+class WatchdogWatcher(object):
+    r"""Watches directories with watchdog (inotify on Linux)
+
+    Parameters
+    ----------
+    callback : callable
+        Called as callback(directory) when the entries of a watched
+        directory change
+
+    """
+    def __init__(self, callback):
+        self.callback = callback
+        self._observer = Observer()
+        self._observer.daemon = True
+        self._watches = dict()
+        self._started = False
+
+    def watch(self, directory):
+        r"""Start watching a directory (not recursive)"""
+        directory = normpath(directory)
+        if directory in self._watches:
+            return
+        self._watches[directory] = self._observer.schedule(
+            _Handler(self.callback), directory, recursive=False)
+        if self._started is False:
+            self._observer.start()
+            self._started = True
+
+    def unwatch(self, directory):
+        r"""Stop watching a directory"""
+        watch = self._watches.pop(normpath(directory), None)
+        if watch is not None:
+            self._observer.unschedule(watch)
+
+    def stop(self):
+        r"""Stop watching all directories"""
+        self._watches.clear()
+        if self._started is True:
+            self._observer.stop()
+
+
+def directory_watcher(callback, polling_interval=1.):
+    r"""The best available directory watcher
+
+    Parameters
+    ----------
+    callback : callable
+        Called as callback(directory), in a watcher thread, when the entries
+        of a watched directory change
+    polling_interval : float, optional (default is 1.)
+        Interval of the polling watcher, if watchdog is not installed
+
+    Returns
+    -------
+    WatchdogWatcher or PollingWatcher
+
+    """
+    if HAS_WATCHDOG:
+        logger.info("Watching directories with watchdog")
+        return WatchdogWatcher(callback)
+    logger.info("watchdog is not installed, polling directories")
+    return PollingWatcher(callback, polling_interval)
@@ -0,0 +1,121 @@
+# coding: utf-8
+
+r"""Background loading of geometry
+
+Loading and building geometry runs in a worker thread and the results are
+marshalled back to the UI thread with wx.CallAfter. Submitting a new load
+cancels the previous one: its results are never delivered.
+
+"""
+
+import logging
+import threading
+
+import wx
+
+logger = logging.getLogger(__name__)
+
+
+class Cancelled(Exception):
+    r"""Raised in a worker thread when its load has been superseded"""
+    pass
+
+
+class CancelToken(object):
+    r"""Cancellation flag shared by a load and its BackgroundLoader"""
+    def __init__(self):
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self):
+        r"""Has the load been superseded?"""
+        return self._event.is_set()
+
+    def cancel(self):
+        r"""Mark the load as superseded"""
+        self._event.set()
+
+    def check(self):
+        r"""Stop a load that has been superseded
+
+        To be called by the load function between 2 expensive steps
+
+        Raises
+        ------
+        Cancelled
+
+        """
+        if self.cancelled:
+            raise Cancelled()
+
+    def post(self, callback, *args):
+        r"""Call callback(*args) in the UI thread, unless the load has been
+        superseded by then. Used to deliver partial results."""
+        wx.CallAfter(self._deliver, callback, args)
+
+    def _deliver(self, callback, args):
+        if not self.cancelled:
+            callback(*args)
+
+
+class BackgroundLoader(object):
+    r"""Runs one load at a time in a worker thread
+
+    Parameters
+    ----------
+    name : str, optional (default is "loader")
+        Name of the worker threads, for logging
+
+    """
+    def __init__(self, name="loader"):
+        self.name = name
+        self._token = None
+
+    def submit(self, load, on_done, on_error=None):
+        r"""Run a load in a worker thread, cancelling the current one
+
+        Parameters
+        ----------
+        load : callable
+            Called as load(token) in the worker thread, token being a
+            CancelToken
+        on_done : callable
+            Called as on_done(result) in the UI thread with the value
+            returned by load
+        on_error : callable or None, optional (default is None)
+            Called as on_error(exception) in the UI thread if load raises
+
+        Returns
+        -------
+        CancelToken
+
+        """
+        self.cancel()
+        token = CancelToken()
+        self._token = token
+        thread = threading.Thread(target=self._run,
+                                  name=self.name,
+                                  args=(token, load, on_done, on_error))
+        thread.daemon = True
+        thread.start()
+        return token
+
+    def cancel(self):
+        r"""Cancel the current load, if any"""
+        if self._token is not None:
+            self._token.cancel()
+            self._token = None
+
+    @staticmethod
+    def _run(token, load, on_done, on_error):
+        try:
+            result = load(token)
+        except Cancelled:
+            logger.debug("Load cancelled")
+            return
+        except Exception as e:
+            logger.exception(e)
+            if on_error is not None:
+                token.post(on_error, e)
+            return
+        token.post(on_done, result)
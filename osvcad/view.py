@@ -14,6 +14,8 @@ from OCC.Core.gp import gp_Pnt, gp_Vec
 import ccad.display as cd
 from aocutils.display.wx_viewer import Wx3dViewerFrame, colour_wx_to_occ
 
+from osvcad.graph_layout import hierarchical_layout
+
 
 class OsvCadFrame(Wx3dViewerFrame):
     r"""Specialization of aocutil's Wx3dViewerFrame for OsvCad"""
@@ -107,6 +109,8 @@ def view_assembly(assembly):
 def view_assembly_graph(assembly):
     r"""Create a Matplotlib graph of the plot
 
+    The nodes are laid out as a tree, from the root of the assembly
+
     Parameters
     ----------
     assembly : AssemblyGeometryNode
@@ -118,7 +122,7 @@ def view_assembly_graph(assembly):
 
     values = [val_map.get(node, 0.25) for node in assembly.nodes()]
 
-    pos = nx.circular_layout(assembly)
+    pos = hierarchical_layout(assembly)
 
     nx.draw_networkx_nodes(assembly,
                            pos,
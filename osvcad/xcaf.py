@@ -0,0 +1,467 @@
+# coding: utf-8
+
+r"""STEP export and import of Assemblies through XCAF documents
+
+Each distinct source shape is a single product of the XCAF document and each
+placed Part is a component (an instance) that references it with its
+location: a shape repeated many times (e.g. a screw) is written once in the
+STEP file. The sub-assemblies are nested assemblies and the instance ids of
+the nodes are the names of the components.
+
+The import does the opposite: the Parts created for the instances of a
+product share its shape (placed by OCC locations, without copy). The whole
+STEP file is read and all its geometry is transferred to the XCAF document
+up front; only the Parts and the Assemblies (the osvcad nodes) of the
+components are created when they are asked for.
+
+"""
+
+import logging
+from os.path import basename, splitext, exists
+
+import numpy as np
+
+from OCC.Core.IFSelect import IFSelect_RetDone
+from OCC.Core.Interface import Interface_Static_SetCVal, \
+    Interface_Static_CVal
+from OCC.Core.STEPCAFControl import STEPCAFControl_Writer, \
+    STEPCAFControl_Reader
+from OCC.Core.STEPControl import STEPControl_AsIs
+from OCC.Core.TCollection import TCollection_ExtendedString, \
+    TCollection_AsciiString
+from OCC.Core.TDataStd import TDataStd_Name_Set, TDataStd_Name_GetID, \
+    Handle_TDataStd_Name
+from OCC.Core.TDF import TDF_Label, TDF_LabelSequence, TDF_Tool_Entry
+from OCC.Core.TDocStd import Handle_TDocStd_Document
+from OCC.Core.XCAFApp import XCAFApp_Application
+from OCC.Core.XCAFDoc import XCAFDoc_DocumentTool
+from ccad.model import Solid
+
+from osvcad.brep import topods_shape
+from osvcad.geometry import location_from_matrix, matrix_from_location
+from osvcad.nodes import Part, Assembly
+
+logger = logging.getLogger(__name__)
+
+# Values of the write.step.schema OCC parameter
+STEP_SCHEMAS = ("AP214CD", "AP214DIS", "AP214IS", "AP203", "AP242DIS")
+
+
+def new_document():
+    r"""Create an empty XCAF document
+
+    Returns
+    -------
+    tuple(Handle_TDocStd_Document, XCAFDoc_ShapeTool)
+
+    """
+    h_doc = Handle_TDocStd_Document()
+    app = XCAFApp_Application.GetApplication().GetObject()
+    app.NewDocument(TCollection_ExtendedString("MDTV-CAF"), h_doc)
+    doc = h_doc.GetObject()
+    shape_tool = XCAFDoc_DocumentTool().ShapeTool(doc.Main()).GetObject()
+    return h_doc, shape_tool
+
+
+def _set_name(label, name):
+    TDataStd_Name_Set(label, TCollection_ExtendedString(str(name)))
+
+
+def _product_name(part, index):
+    r"""Name of the product of a source shape : the name of the file it was
+    read from, else the instance id of the first Part that uses it"""
+    origin = getattr(part, "origin", None)
+    if origin is not None and len(origin.files) > 0:
+        return splitext(basename(origin.files[0]))[0]
+    if part.instance_id is not None:
+        return part.instance_id
+    return "part_%i" % index
+
+
+class _DocumentBuilder(object):
+    r"""Adds the nodes of an Assembly to an XCAF document, one product per
+    source shape"""
+    def __init__(self, shape_tool):
+        self.shape_tool = shape_tool
+        # id(source shape) -> (source shape, label)
+        self.products = dict()
+        self.nb_components = 0
+
+    def product(self, part):
+        r"""Label of the product of the source shape of a Part"""
+        key = id(part.source_shape)
+        if key not in self.products:
+            label = self.shape_tool.AddShape(topods_shape(part.source_shape),
+                                             False)
+            _set_name(label, _product_name(part, len(self.products)))
+            # the source shape is kept alive for its id to stay unique
+            self.products[key] = (part.source_shape, label)
+        return self.products[key][1]
+
+    def assembly(self, assembly):
+        r"""Label of a new XCAF assembly with the nodes of an Assembly"""
+        label = self.shape_tool.NewShape()
+        _set_name(label, assembly.instance_id
+                  if assembly.instance_id is not None else "assembly")
+        for node in assembly.nodes():
+            if hasattr(node, "leaves"):
+                referred = self.assembly(node)
+            else:
+                referred = self.product(node)
+            component = self.shape_tool.AddComponent(
+                label, referred, location_from_matrix(node.matrix))
+            self.nb_components += 1
+            if node.instance_id is not None:
+                _set_name(component, node.instance_id)
+        return label
+
+
+def assembly_document(node):
+    r"""XCAF document of an Assembly or a Part
+
+    Parameters
+    ----------
+    node : Assembly or Part
+
+    Returns
+    -------
+    tuple(Handle_TDocStd_Document, int, int)
+        The document, its number of products and of components
+
+    """
+    h_doc, shape_tool = new_document()
+    builder = _DocumentBuilder(shape_tool)
+    if hasattr(node, "leaves"):
+        node.build()
+        builder.assembly(node)
+    else:
+        builder.product(node)
+    return h_doc, len(builder.products), builder.nb_components
+
+
+def write_step(node, step_file_path, schema="AP214IS"):
+    r"""Write an Assembly (or a Part) to a STEP file with its structure
+
+    Parameters
+    ----------
+    node : Assembly or Part
+    step_file_path : str
+    schema : str, optional (default is "AP214IS")
+        STEP schema, one of STEP_SCHEMAS
+
+    Raises
+    ------
+    ValueError
+        If the schema is not accepted by OCC
+    IOError
+        If the STEP file cannot be written
+
+    """
+    h_doc, nb_products, nb_components = assembly_document(node)
+
+    # write.step.schema is global to the process : it is restored after the
+    # write so that it does not leak into the next exports
+    previous_schema = Interface_Static_CVal("write.step.schema")
+    if not Interface_Static_SetCVal("write.step.schema", schema):
+        msg = "Unknown STEP schema %s (expected one of %s)" % \
+              (schema, ", ".join(STEP_SCHEMAS))
+        logger.error(msg)
+        raise ValueError(msg)
+    try:
+        writer = STEPCAFControl_Writer()
+        writer.SetNameMode(True)
+        writer.Transfer(h_doc, STEPControl_AsIs)
+        status = writer.Write(step_file_path)
+    finally:
+        Interface_Static_SetCVal("write.step.schema", previous_schema)
+    if status != IFSelect_RetDone:
+        msg = "Cannot write the STEP file %s" % step_file_path
+        logger.error(msg)
+        raise IOError(msg)
+    logger.info("%i products and %i components written to %s (%s)" %
+                (nb_products, nb_components, step_file_path, schema))
+
+
+def _label_entry(label):
+    r"""Entry (e.g. '0:1:1:2') of a label, its key in the document"""
+    entry = TCollection_AsciiString()
+    TDF_Tool_Entry(label, entry)
+    return entry.ToCString()
+
+
+def _label_name(label):
+    r"""Name of a label, None if it has none"""
+    name = Handle_TDataStd_Name()
+    if label.FindAttribute(TDataStd_Name_GetID(), name):
+        return name.GetObject().Get().PrintToString()
+    return None
+
+
+class StepComponent(object):
+    r"""Component of the assembly tree of a STEP file
+
+    No geometry is loaded: the tree describes the file.
+
+    Parameters
+    ----------
+    name : str
+    label : TDF_Label
+        Label of the product (the shape or the assembly) of the component
+    matrix : np.ndarray
+        4x4 matrix of the component in its parent assembly
+    children : list[StepComponent]
+        Empty if the component is a shape
+
+    """
+    def __init__(self, name, label, matrix, children):
+        self.name = name
+        self.label = label
+        self.matrix = matrix
+        self.children = children
+
+    @property
+    def is_assembly(self):
+        r"""Is the component a (sub-)assembly?"""
+        return len(self.children) > 0
+
+    @property
+    def nb_instances(self):
+        r"""Number of shape instances in the component"""
+        if not self.is_assembly:
+            return 1
+        return sum(child.nb_instances for child in self.children)
+
+    def __repr__(self):
+        return "StepComponent %s (%i instances)" % (self.name,
+                                                    self.nb_instances)
+
+
+class StepAssemblyReader(object):
+    r"""Reads the assembly structure of a STEP file
+
+    All the geometry of the file is transferred to the XCAF document when
+    the reader is created, whatever component is read afterwards. The Parts
+    and Assemblies are then created on demand, for the requested component
+    only. The instances of a product share its shape.
+
+    Parameters
+    ----------
+    step_file_path : str
+
+    Raises
+    ------
+    IOError
+        If the file does not exist or cannot be read
+
+    """
+    def __init__(self, step_file_path):
+        if not exists(step_file_path):
+            msg = "STEP file (%s) does not exist" % step_file_path
+            logger.error(msg)
+            raise IOError(msg)
+        self.step_file_path = step_file_path
+
+        reader = STEPCAFControl_Reader()
+        reader.SetNameMode(True)
+        if reader.ReadFile(step_file_path) != IFSelect_RetDone:
+            msg = "Cannot read the STEP file %s" % step_file_path
+            logger.error(msg)
+            raise IOError(msg)
+        self.h_doc, self.shape_tool = new_document()
+        if not reader.Transfer(self.h_doc):
+            msg = "Cannot transfer the STEP file %s" % step_file_path
+            logger.error(msg)
+            raise IOError(msg)
+
+        # product entry -> shared source shape
+        self.prototypes = dict()
+
+        free_labels = TDF_LabelSequence()
+        self.shape_tool.GetFreeShapes(free_labels)
+        self.roots = [self._describe(free_labels.Value(i),
+                                     _label_name(free_labels.Value(i)),
+                                     np.identity(4))
+                      for i in range(1, free_labels.Length() + 1)]
+        logger.info("%s : %i root components, %i instances" %
+                    (step_file_path,
+                     len(self.roots),
+                     sum(root.nb_instances for root in self.roots)))
+
+    def _describe(self, label, name, matrix):
+        r"""Assembly tree below a product label"""
+        children = list()
+        if self.shape_tool.IsAssembly(label):
+            components = TDF_LabelSequence()
+            self.shape_tool.GetComponents(label, components, False)
+            for i in range(1, components.Length() + 1):
+                component = components.Value(i)
+                referred = TDF_Label()
+                self.shape_tool.GetReferredShape(component, referred)
+                component_name = _label_name(component)
+                if component_name is None:
+                    component_name = _label_name(referred)
+                children.append(self._describe(
+                    referred,
+                    component_name,
+                    matrix_from_location(
+                        self.shape_tool.GetLocation(component))))
+        return StepComponent(name, label, matrix, children)
+
+    def find(self, path):
+        r"""Component from the names of the components that lead to it
+
+        Parameters
+        ----------
+        path : list[str]
+            Names from a root component, e.g. ["car", "chassis"]
+
+        Returns
+        -------
+        StepComponent
+
+        Raises
+        ------
+        KeyError
+            If no component has this path
+
+        """
+        return self._lineage(path)[-1]
+
+    def _lineage(self, path):
+        r"""Components along a path of names, from the root component"""
+        components = self.roots
+        lineage = list()
+        for name in path:
+            matching = [c for c in components if c.name == name]
+            if len(matching) == 0:
+                raise KeyError("No component %s in %s" %
+                               ("/".join(path), self.step_file_path))
+            lineage.append(matching[0])
+            components = matching[0].children
+        if len(lineage) == 0:
+            raise KeyError("Empty component path")
+        return lineage
+
+    def placement(self, path):
+        r"""4x4 matrix of a component in the frame of the file: the matrices
+        of the components that lead to it composed with its own matrix
+
+        Parameters
+        ----------
+        path : list[str]
+            See find()
+
+        Returns
+        -------
+        np.ndarray
+
+        """
+        matrix = np.identity(4)
+        for component in self._lineage(path):
+            matrix = np.dot(matrix, component.matrix)
+        return matrix
+
+    def prototype(self, label):
+        r"""Shared source shape of a product
+
+        Parameters
+        ----------
+        label : TDF_Label
+
+        Returns
+        -------
+        ccad.model.Solid
+
+        """
+        entry = _label_entry(label)
+        if entry not in self.prototypes:
+            self.prototypes[entry] = Solid(self.shape_tool.GetShape(label))
+        return self.prototypes[entry]
+
+    def node(self, component, parent_matrix=None):
+        r"""Part or Assembly of a component
+
+        Parameters
+        ----------
+        component : StepComponent
+        parent_matrix : np.ndarray or None, optional (default is None)
+            4x4 matrix of the parent assembly. None means identity
+
+        Returns
+        -------
+        Part or Assembly
+
+        """
+        matrix = component.matrix if parent_matrix is None \
+            else np.dot(parent_matrix, component.matrix)
+        if component.is_assembly:
+            nodes = [self.node(child, matrix) for child in component.children]
+            assembly = Assembly(root=nodes[0], instance_id=component.name)
+            for node in nodes[1:]:
+                assembly.add_node(node)
+            return assembly
+
+        source_shape = self.prototype(component.label)
+        # the placed shape shares the geometry of the source shape
+        placed = Solid(topods_shape(source_shape).Moved(
+            location_from_matrix(matrix)))
+        return Part(placed,
+                    dict(),
+                    instance_id=component.name,
+                    source_shape=source_shape,
+                    matrix=matrix,
+                    source_anchors=dict())
+
+    def assembly(self, path=None):
+        r"""Part or Assembly of the whole file or of a component
+
+        The geometry is already transferred: reading a single component
+        only saves the creation of the other nodes. A component is placed
+        in the frame of the file (see placement()), not in the frame of its
+        parent assembly.
+
+        Parameters
+        ----------
+        path : list[str] or None, optional (default is None)
+            Names of the components that lead to the component (see find()).
+            None for the whole file
+
+        Returns
+        -------
+        Part or Assembly
+
+        """
+        if path is not None:
+            parent_matrix = self.placement(path[:-1]) if len(path) > 1 \
+                else None
+            return self.node(self.find(path), parent_matrix)
+        if len(self.roots) == 1:
+            return self.node(self.roots[0])
+        nodes = [self.node(root) for root in self.roots]
+        assembly = Assembly(root=nodes[0],
+                            instance_id=splitext(
+                                basename(self.step_file_path))[0])
+        for node in nodes[1:]:
+            assembly.add_node(node)
+        return assembly
+
+
+def read_step(step_file_path, path=None):
+    r"""Assembly (or Part) of a STEP file, with its structure
+
+    The whole file is transferred, even when only a component is read (see
+    StepAssemblyReader).
+
+    Parameters
+    ----------
+    step_file_path : str
+    path : list[str] or None, optional (default is None)
+        Names of the components that lead to the component to read, None to
+        read the whole file
+
+    Returns
+    -------
+    Part or Assembly
+
+    """
+    return StepAssemblyReader(step_file_path).assembly(path)
@@ -62,5 +62,6 @@ setup(
                  ['osvcad/ui/osvcad.ico',
                   'osvcad/ui/osvcadui.ini'])],
     entry_points={},
-    scripts=['bin/osvcad-ui']
+    scripts=['bin/osvcad-ui', 'bin/osvcad-thumbnails', 'bin/osvcad-catalog',
+             'bin/osvcad-store']
     )
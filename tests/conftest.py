@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+r"""Shared fixtures of the tests"""
+
+import pytest
+
+
+class _Part(object):
+    r"""Minimal stand-in for a Part"""
+    def __init__(self, instance_id):
+        self.instance_id = instance_id
+
+
+@pytest.fixture
+def part_stand_in():
+    r"""Factory of Part stand-ins, for the writers that only need the
+    instance ids of the Parts of a MeshSet"""
+    return _Part
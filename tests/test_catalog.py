@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+r"""catalog.py tests"""
+
+import json
+import os
+import zipfile
+from os.path import join, dirname
+
+from osvcad.catalog import PartsCatalog
+from osvcad.nomenclature import decode_part_name, parse_dimensional
+from osvcad.stepzip import MANIFEST
+
+CHASSIS = join(dirname(__file__), "..", "sample_projects", "car", "shelf",
+               "chassis")
+
+
+def _stepzip_1(folder, name, anchors):
+    r"""Version 1 stepzip file (the STEP file is not read by the scan)"""
+    path = join(folder, "%s.stepzip" % name)
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("%s.stp" % name, "ISO-10303-21;")
+        zf.writestr("%s.anchors" % name, anchors)
+    return path
+
+
+def _stepzip_2(folder, name, bounding_box):
+    r"""Version 2 stepzip file with a manifest"""
+    path = join(folder, "%s.stepzip" % name)
+    manifest = {"format": "stepzip", "version": 2, "name": name,
+                "step": "%s.stp" % name, "brep": "%s.brep" % name,
+                "anchors": "%s.janchors" % name, "shape_hash": "abc",
+                "bounding_box": bounding_box, "volume": 12.}
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr(MANIFEST, json.dumps(manifest))
+        zf.writestr(manifest["step"], "ISO-10303-21;")
+        zf.writestr(manifest["anchors"], json.dumps(
+            {"D3": {"position": [0, 0, 0], "direction": [0, 0, 1]}}))
+    return path
+
+
+def test_decode_part_name():
+    r"""Fields of the names of the sample shelf"""
+    names = [f[:-len(".stepzip")] for f in sorted(os.listdir(CHASSIS))
+             if f.endswith(".stepzip")]
+    assert len(names) == 10
+    for name in names:
+        assert decode_part_name(name)["sector"] == "CAR"
+    fields = decode_part_name("CAR-CHASSIS-ARCHLEFT-705_515_184_mm-STEEL--")
+    assert fields["function"] == "ARCHLEFT"
+    assert fields["material"] == "STEEL"
+    assert fields["alpha"] == ""
+    assert parse_dimensional("D416_l174_mm") == ([("D", 416.), ("l", 174.)],
+                                                 "mm")
+    assert decode_part_name("AERO-LANDING-GEAR-STRUT-10_mm-STEEL-BOEING-3")[
+        "domain"] == "LANDING-GEAR"
+    assert decode_part_name("rim") is None
+
+
+def test_catalog_sample_shelf(tmpdir):
+    r"""Scan of the sample chassis shelf, without loading the STEP files"""
+    catalog = PartsCatalog(str(tmpdir.join("catalog.sqlite")))
+    report = catalog.scan(CHASSIS, geometry=False)
+    assert len(report.added) == 10
+    entries = catalog.query(domain="CHASSIS", material="STEEL",
+                            min_length=700.)
+    assert sorted(entry.function for entry in entries) == \
+        ["ARCHLEFT", "ARCHRIGHT", "ARCHSTRUT", "ARCHSTRUT",
+         "DASHBOARDSUPPORT", "SEATSSUPPORT"]
+    assert all(len(entry.anchors) > 0 for entry in entries)
+
+
+def test_catalog_query(tmpdir):
+    r"""Queries on the fields, the length and the anchors"""
+    folder = str(tmpdir.mkdir("shelf"))
+    _stepzip_1(folder, "CAR-CHASSIS-ARCHLEFT-705_515_184_mm-STEEL--",
+               "D3 0,0,0,0,-1,0\nA1 1,0,0,0,0,1\n")
+    _stepzip_1(folder, "CAR-CHASSIS-HAT-102_40_70_mm-STEEL--",
+               "D3 0,0,0,0,-1,0\n")
+    _stepzip_2(folder, "CAR-CHASSIS-BASE-2.38_0.179_1.18-STEEL--",
+               [0., 0., 0., 2380., 179., 1180.])
+    catalog = PartsCatalog(str(tmpdir.join("catalog.sqlite")))
+
+    report = catalog.scan(folder, geometry=False)
+    assert len(report.added) == 3
+    assert len(catalog) == 3
+
+    entries = catalog.query(domain="CHASSIS", material="STEEL",
+                            min_length=700., anchor="D3")
+    assert [entry.function for entry in entries] == ["ARCHLEFT", "BASE"]
+    assert entries[0].length == 705.
+    assert entries[0].bounding_box is None
+    assert entries[0].anchors["A1"]["position"] == (1., 0., 0.)
+    assert entries[1].length == 2380.
+    assert entries[1].volume == 12.
+    assert catalog.query(shape_hash="abc")[0].function == "BASE"
+    assert catalog.query(anchor="A1", max_length=200.) == []
+
+
+def test_catalog_incremental_scan(tmpdir):
+    r"""Only the new and modified files are read again"""
+    folder = str(tmpdir.mkdir("shelf"))
+    hat = _stepzip_1(folder, "CAR-CHASSIS-HAT-102_40_70_mm-STEEL--",
+                     "D3 0,0,0,0,-1,0\n")
+    arch = _stepzip_1(folder, "CAR-CHASSIS-ARCHLEFT-705_515_184_mm-STEEL--",
+                      "D3 0,0,0,0,-1,0\n")
+    catalog = PartsCatalog(str(tmpdir.join("catalog.sqlite")))
+    catalog.scan(folder, geometry=False)
+
+    report = catalog.scan(folder, geometry=False)
+    assert report.unchanged == 2
+
+    os.utime(hat, (0, 0))
+    os.remove(arch)
+    _stepzip_1(folder, "CAR-CHASSIS-STRUT-127_126_796_mm-STEEL--",
+               "A1 0,0,0,0,-1,0\n")
+    report = catalog.scan(folder, geometry=False)
+    assert report.touched == [hat]
+    assert report.removed == [arch]
+    assert len(report.added) == 1
+    assert [entry.function for entry in catalog.query(anchor="D3")] == \
+        ["HAT"]
+
+
+def test_catalog_scan_other_folders(tmpdir):
+    r"""The scan of a folder leaves the parts of the other folders alone,
+    even when their names only differ by the case or a suffix"""
+    hat = "CAR-CHASSIS-HAT-102_40_70_mm-STEEL--"
+    for name in ("shelf", "SHELF", "shelf_2"):
+        _stepzip_1(str(tmpdir.mkdir(name)), hat, "D3 0,0,0,0,-1,0\n")
+    catalog = PartsCatalog(str(tmpdir.join("catalog.sqlite")))
+    for name in ("SHELF", "shelf_2"):
+        catalog.scan(str(tmpdir.join(name)), geometry=False)
+
+    report = catalog.scan(str(tmpdir.join("shelf")), geometry=False)
+    assert len(report.added) == 1
+    assert report.removed == []
+    assert len(catalog) == 3
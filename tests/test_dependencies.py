@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+r"""dependencies.py tests"""
+
+from os.path import abspath
+
+from osvcad.dependencies import Origin, DependencyTracker
+
+
+class _Part(object):
+    r"""Minimal stand-in for a Part created by a constructor"""
+    built = 0
+
+    def __init__(self, origin):
+        self.origin = origin
+        self.source_shape = "shape %i" % _Part.built
+        self.source_anchors = dict()
+
+    @classmethod
+    def invalidate(cls, path):
+        pass
+
+    @classmethod
+    def from_py_script(cls, py_script_path):
+        _Part.built += 1
+        return cls(Origin("from_py_script",
+                          dict(py_script_path=py_script_path),
+                          [py_script_path]))
+
+    def replace_source(self, source_shape, source_anchors):
+        self.source_shape = source_shape
+        self.source_anchors = source_anchors
+
+
+class _Assembly(object):
+    r"""Minimal stand-in for an Assembly"""
+    def __init__(self, nodes):
+        self._nodes = nodes
+        self.updated = list()
+
+    def nodes(self):
+        return self._nodes
+
+    def leaves(self):
+        return list()
+
+    def update_placements(self, node):
+        self.updated.append(node)
+
+
+def test_rebuild_dependents():
+    r"""Only the parts that depend on the changed file are rebuilt, once per
+    origin, and the placements are updated up to the top assembly"""
+    plate_1 = _Part.from_py_script("plate.py")
+    plate_2 = _Part.from_py_script("plate.py")
+    screw = _Part.from_py_script("screw.py")
+    sub_assembly = _Assembly([plate_2, screw])
+    assembly = _Assembly([plate_1, sub_assembly])
+
+    tracker = DependencyTracker()
+    tracker.track(assembly)
+
+    assert len(tracker.dependents("plate.py")) == 2
+    assert len(tracker.dependents(abspath("screw.py"))) == 1
+
+    nb_built = _Part.built
+    assert tracker.rebuild("plate.py") == [assembly]
+    assert _Part.built == nb_built + 1
+    assert plate_1.source_shape is plate_2.source_shape
+    assert screw.source_shape != plate_1.source_shape
+    assert assembly.updated == [plate_1, sub_assembly]
+    assert sub_assembly.updated == [plate_2]
+
+    tracker.forget(assembly)
+    assert tracker.dependents("plate.py") == []
+
+
+def test_origin_key():
+    r"""Origins with the same constructor and arguments have the same key"""
+    assert Origin("from_step", dict(step_file_path="a.stp"), ["a.stp"]).key \
+        == Origin("from_step", dict(step_file_path="a.stp"), ["a.stp"]).key
+    assert Origin("from_step", dict(step_file_path="a.stp"), ["a.stp"]).key \
+        != Origin("from_step", dict(step_file_path="b.stp"), ["b.stp"]).key
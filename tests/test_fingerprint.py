@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+r"""fingerprint.py tests"""
+
+from os.path import join, dirname
+
+import numpy as np
+from ccad.model import transformed
+
+from osvcad.fingerprint import Fingerprint, alignment, is_mirror, \
+    _same_points
+from osvcad.mass_properties import shape_mass_properties
+from osvcad.mesh import mesh_parts
+from osvcad.nodes import Part
+from osvcad.transformations import rotation_matrix, reflection_matrix, \
+    translation_matrix
+
+ARCH = join(dirname(__file__), "..", "sample_projects", "car", "shelf",
+            "chassis", "CAR-CHASSIS-ARCHLEFT-705_515_184_mm-STEEL--.stp")
+
+
+def _points_fingerprint(points, faces=12):
+    r"""Fingerprint of a set of unit point masses"""
+    centre = points.mean(axis=0)
+    r = points - centre
+    inertia = np.identity(3) * (r ** 2).sum() - np.dot(r.T, r)
+    moments, axes = np.linalg.eigh(inertia)
+    counts = {"solids": 1, "shells": 1, "faces": faces, "edges": 30,
+              "vertices": points.shape[0]}
+    return Fingerprint(float(points.shape[0]), 1., centre, moments, axes,
+                       counts, points)
+
+
+def _placed(points, matrix):
+    return np.dot(points, matrix[:3, :3].T) + matrix[:3, 3]
+
+
+def test_alignment():
+    r"""Copies and mirror images of an asymmetric set of points"""
+    points = np.random.RandomState(0).rand(20, 3) * [3., 2., 1.]
+    source = _points_fingerprint(points)
+    moved = np.dot(translation_matrix((10., -5., 2.)),
+                   rotation_matrix(0.7, (1., 2., 3.)))
+    mirror = np.dot(moved, reflection_matrix((0., 0., 0.), (1., 0., 0.)))
+
+    copy = _points_fingerprint(_placed(points, moved))
+    assert copy.invariant_digest == source.invariant_digest
+    assert copy.placed_digest != source.placed_digest
+    matrix = alignment(source, copy)
+    assert np.allclose(_placed(points, matrix), _placed(points, moved))
+    assert not is_mirror(source, copy)
+
+    image = _points_fingerprint(_placed(points, mirror))
+    assert image.invariant_digest == source.invariant_digest
+    matrix = alignment(source, image)
+    assert np.linalg.det(matrix[:3, :3]) < 0
+    assert np.allclose(_placed(points, matrix), _placed(points, mirror))
+    assert is_mirror(source, image)
+
+    other = _points_fingerprint(_placed(points, moved), faces=13)
+    assert alignment(source, other) is None
+
+
+def test_mesh_parts_share_mirror():
+    r"""A part and its mirror image share their mesh"""
+    left = Part.from_step(ARCH, anchors=dict(), instance_id="left")
+    mirror = np.dot(translation_matrix((0., 2000., 0.)),
+                    reflection_matrix((0., 0., 0.), (0., 1., 0.)))
+    # a distinct source shape, as read from another file
+    right = Part(transformed(left.node_shape, mirror[:3]), dict(),
+                 instance_id="right")
+    mesh_set = mesh_parts([left, right], processes=0)
+    assert len(mesh_set.meshes) == 1
+    assert sorted(np.linalg.det(matrix[:3, :3]) < 0
+                  for _, matrix, _ in mesh_set.instances) == [False, True]
+
+
+def test_mass_properties_share_mirror():
+    r"""The mass properties of a mirror image come from its prototype"""
+    left = Part.from_step(ARCH, anchors=dict(), instance_id="left")
+    mirror = np.dot(translation_matrix((0., 2000., 0.)),
+                    reflection_matrix((0., 0., 0.), (0., 1., 0.)))
+    right = transformed(left.node_shape, mirror[:3])
+
+    volume, centre, dimension = shape_mass_properties(left.node_shape)
+    right_volume, right_centre, right_dimension = \
+        shape_mass_properties(right)
+    assert right_volume == volume
+    assert right_dimension == dimension
+    assert np.allclose(right_centre, _placed(centre[None, :], mirror)[0])
+
+
+def test_same_points_both_ways():
+    r"""Points matched to the same neighbour do not make the sets equal"""
+    points = np.array([[0., 0., 0.], [0., 0., 0.], [1., 0., 0.]])
+    others = np.array([[0., 0., 0.], [1., 0., 0.], [5., 0., 0.]])
+    assert not _same_points(points, others, 1e-6)
+    assert _same_points(points[::-1], points, 1e-6)
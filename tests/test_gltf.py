@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+r"""gltf.py tests"""
+
+import json
+import struct
+
+import numpy as np
+
+from osvcad.mesh import Mesh, MeshSet
+from osvcad.gltf import write_glb
+
+
+def test_write_glb_instancing(tmpdir, part_stand_in):
+    r"""A mesh shared by 2 parts is written once, referenced by 2 nodes"""
+    mesh = Mesh([[0, 0, 0], [1, 0, 0], [0, 1, 0]], [[0, 1, 2]])
+    translation = np.identity(4)
+    translation[:3, 3] = (10, 0, 0)
+    mesh_set = MeshSet({"k": mesh},
+                       [(part_stand_in("a"), np.identity(4), "k"),
+                        (part_stand_in("b"), translation, "k")])
+    path = str(tmpdir.join("two.glb"))
+
+    write_glb(None, path, mesh_set=mesh_set)
+
+    with open(path, "rb") as f:
+        content = f.read()
+    magic, version, length = struct.unpack("<4sII", content[:12])
+    json_length, _ = struct.unpack("<II", content[12:20])
+    document = json.loads(content[20:20 + json_length].decode("utf-8"))
+
+    assert magic == b"glTF"
+    assert version == 2
+    assert length == len(content)
+    assert len(document["meshes"]) == 1
+    assert [n["name"] for n in document["nodes"][1:]] == ["a", "b"]
+    assert document["nodes"][2]["matrix"][12] == 10
+    assert document["buffers"][0]["byteLength"] == 3 * 12 + 3 * 4
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+r"""graph_layout.py tests"""
+
+import networkx as nx
+
+from osvcad.graph_layout import hierarchical_layout
+
+
+def test_hierarchical_layout():
+    r"""Nodes are one level below their parent, parents centred above
+    their children"""
+    graph = nx.DiGraph()
+    graph.add_edges_from([("r", "a"), ("r", "b"), ("a", "c"), ("a", "d")])
+
+    layout = hierarchical_layout(graph, root="r")
+
+    assert layout["r"][1] == 0.
+    assert layout["a"][1] == layout["b"][1] == -1.
+    assert layout["c"][1] == layout["d"][1] == -2.
+    assert layout["a"][0] == (layout["c"][0] + layout["d"][0]) / 2.
+    assert len(set(layout[node][0] for node in ("b", "c", "d"))) == 3
+
+
+def test_hierarchical_layout_cache():
+    r"""The layout is cached until the graph changes"""
+    graph = nx.DiGraph()
+    graph.add_edges_from([("r", "a"), ("r", "b")])
+
+    layout = hierarchical_layout(graph)
+    assert hierarchical_layout(graph) is layout
+
+    graph.add_edge("b", "c")
+    assert "c" in hierarchical_layout(graph)
+
+
+def test_hierarchical_layout_root():
+    r"""Another root gives another layout"""
+    graph = nx.DiGraph()
+    graph.add_edges_from([("r", "a"), ("a", "b")])
+
+    assert hierarchical_layout(graph, root="r")["r"][1] == 0.
+    assert hierarchical_layout(graph, root="a")["a"][1] == 0.
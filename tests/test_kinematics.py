@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+r"""kinematics.py tests"""
+
+import numpy as np
+
+from osvcad.geometry import transformation_from_2_anchors, homogeneous
+from osvcad.kinematics import anchor_motion_matrix
+
+
+def test_anchor_motion_matrix_delta():
+    r"""Changing the angle and distance of a constraint is a rigid motion
+    around the master anchor"""
+    master = {"position": (1., 2., 3.), "direction": (0., 0., 1.)}
+    slave = {"position": (5., 0., 0.), "direction": (1., 0., 0.)}
+
+    built = homogeneous(transformation_from_2_anchors(master, slave,
+                                                      angle=10.,
+                                                      distance=5.))
+    expected = homogeneous(transformation_from_2_anchors(master, slave,
+                                                         angle=70.,
+                                                         distance=-2.))
+
+    delta = np.dot(anchor_motion_matrix(master, 70., -2.),
+                   np.linalg.inv(anchor_motion_matrix(master, 10., 5.)))
+
+    assert np.allclose(np.dot(delta, built), expected)
+
+
+def test_anchor_motion_matrix_identity():
+    r"""No angle and no distance : no motion"""
+    anchor = {"position": (1., 2., 3.), "direction": (0., 1., 1.)}
+    assert np.allclose(anchor_motion_matrix(anchor), np.identity(4))
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+r"""library.py tests"""
+
+from osvcad.library import ShelfLayout
+
+
+def test_shelf_layout_rows():
+    r"""Boxes are laid out left to right, then on the next row"""
+    layout = ShelfLayout(nb_per_row=2, gap_ratio=0.5)
+
+    # 10 x 10 boxes centred on the origin
+    t0 = layout.place((-5, -5, 0), (5, 5, 1))
+    t1 = layout.place((-5, -5, 0), (5, 5, 1))
+    t2 = layout.place((-5, -5, 0), (5, 5, 1))
+
+    assert t0 == (5, 5, 0)
+    assert t1 == (20, 5, 0)
+    assert t2 == (5, 20, 0)
+
+
+def test_shelf_layout_square():
+    r"""About as many rows as columns"""
+    assert ShelfLayout.square(100).nb_per_row == 10
+    assert ShelfLayout.square(1).nb_per_row == 1
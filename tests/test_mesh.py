@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+r"""mesh.py tests"""
+
+import numpy as np
+import pytest
+
+from osvcad.mesh import Mesh, MeshLods, MeshSet, select_lods, mesh_parts, \
+    LOD_DEFLECTIONS
+
+
+def test_mesh_transformed():
+    r"""Test the transformation of a Mesh by a 4x4 matrix"""
+    mesh = Mesh([[0, 0, 0], [1, 0, 0], [0, 1, 0]], [[0, 1, 2]])
+
+    # translation [1, 2, 3] matrix
+    matrix = np.array([[1, 0, 0, 1],
+                       [0, 1, 0, 2],
+                       [0, 0, 1, 3],
+                       [0, 0, 0, 1]])
+
+    moved = mesh.transformed(matrix)
+
+    assert np.allclose(moved.vertices[1], [2, 2, 3])
+    assert moved.triangles.tolist() == [[0, 1, 2]]
+
+
+def test_mesh_mirrored():
+    r"""A mirroring transformation reverses the triangles winding"""
+    mesh = Mesh([[0, 0, 0], [1, 0, 0], [0, 1, 0]], [[0, 1, 2]])
+
+    mirrored = mesh.transformed(np.diag([1, -1, 1, 1]))
+
+    assert np.allclose(mirrored.vertices[2], [0, -1, 0])
+    assert mirrored.triangles.tolist() == [[2, 1, 0]]
+
+
+def _triangles_mesh(nb_triangles):
+    r"""A mesh with a given number of (degenerate) triangles"""
+    return Mesh(np.zeros((3, 3)), np.zeros((nb_triangles, 3)))
+
+
+def test_lod_select():
+    r"""The coarsest level that is accurate enough on screen is selected"""
+    lods = MeshLods({0.1: _triangles_mesh(10),
+                     0.01: _triangles_mesh(1000)})
+
+    assert lods.select(projected_size=10.).nb_triangles == 10
+    assert lods.select(projected_size=100.).nb_triangles == 1000
+    assert lods.select(projected_size=10000.).nb_triangles == 1000
+
+
+def test_select_lods_budget():
+    r"""The most instanced shapes are refined first within the budget"""
+    lods = {"screw": MeshLods({0.1: _triangles_mesh(10),
+                               0.01: _triangles_mesh(100)}),
+            "plate": MeshLods({0.1: _triangles_mesh(10),
+                               0.01: _triangles_mesh(100)})}
+    counts = {"screw": 4, "plate": 1}
+
+    selected = select_lods(lods, counts, triangle_budget=420)
+
+    assert selected["screw"].nb_triangles == 100
+    assert selected["plate"].nb_triangles == 10
+
+
+def test_mesh_set_selected():
+    r"""The finest levels by default, the budget choice otherwise"""
+    lods = MeshLods({0.1: _triangles_mesh(10),
+                     0.01: _triangles_mesh(100)})
+    mesh_set = MeshSet({"screw": lods, "nut": _triangles_mesh(5)},
+                       [(None, np.identity(4), "screw"),
+                        (None, np.identity(4), "screw"),
+                        (None, np.identity(4), "nut")])
+
+    assert mesh_set.selected()["screw"].nb_triangles == 100
+    # the nut takes 5 triangles of the budget
+    assert mesh_set.selected(200)["screw"].nb_triangles == 10
+    assert mesh_set.selected(205)["screw"].nb_triangles == 100
+    assert mesh_set.selected(205)["nut"].nb_triangles == 5
+
+
+def test_mesh_parts_absolute_lods():
+    r"""The levels of detail cannot be absolute deflections"""
+    with pytest.raises(ValueError):
+        mesh_parts([], relative=False, deflections=LOD_DEFLECTIONS)
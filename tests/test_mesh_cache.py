@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+r"""mesh_cache.py tests"""
+
+import numpy as np
+
+from osvcad.mesh_data import Mesh
+from osvcad.mesh_cache import MeshCache
+
+
+def test_mesh_cache_roundtrip(tmpdir):
+    r"""A stored mesh is mapped back with the same content"""
+    cache = MeshCache(str(tmpdir))
+    mesh = Mesh([[0, 0, 0], [1, 0, 0], [0, 1, 0]], [[0, 1, 2]])
+    key = MeshCache.key("abc", 0.01, 0.5, True)
+
+    assert cache.get(key) is None
+
+    cache.put(key, mesh)
+    mapped = cache.get(key)
+
+    assert key in cache
+    assert np.array_equal(mapped.vertices, mesh.vertices)
+    assert np.array_equal(mapped.triangles, mesh.triangles)
+
+
+def test_mesh_cache_key():
+    r"""The key depends on the shape hash and on the meshing parameters"""
+    key = MeshCache.key("abc", 0.01, 0.5, True)
+
+    assert key == MeshCache.key("abc", 0.01, 0.5, True)
+    assert key != MeshCache.key("abd", 0.01, 0.5, True)
+    assert key != MeshCache.key("abc", 0.02, 0.5, True)
+
+
+def test_mesh_cache_alias(tmpdir):
+    r"""The copies found by the fingerprints are remembered"""
+    cache = MeshCache(str(tmpdir))
+    matrix = np.identity(4)
+    matrix[:3, 3] = (1, 2, 3)
+
+    assert cache.get_alias("copy") is None
+
+    cache.put_alias("copy", "prototype", matrix)
+    prototype, alias_matrix = cache.get_alias("copy")
+
+    assert prototype == "prototype"
+    assert np.array_equal(alias_matrix, matrix)
+    assert "copy" not in cache
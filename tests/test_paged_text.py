@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+r"""paged_text.py tests"""
+
+from os.path import join, dirname
+
+import pytest
+
+from osvcad.paged_text import PagedText
+
+RIM = join(dirname(__file__), "cad_files", "rim.stp")
+
+
+def test_pages_cover_the_file():
+    r"""The pages start on lines and their concatenation is the file"""
+    paged = PagedText(RIM, page_size=100000)
+    try:
+        with open(RIM, "rb") as f:
+            content = f.read()
+        assert paged.nb_pages == (len(content) + 99999) // 100000
+        pages = [paged.page_bytes(i) for i in range(paged.nb_pages)]
+        assert b"".join(pages) == content
+        assert all(page.endswith(b"\n") for page in pages[:-1])
+        assert paged.page(0).startswith("ISO-10303-21;")
+        with pytest.raises(IndexError):
+            paged.page(paged.nb_pages)
+    finally:
+        paged.close()
+
+
+def test_find():
+    r"""A search over the whole file finds the page and the position of a
+    text"""
+    paged = PagedText(RIM, page_size=100000)
+    try:
+        start, end = paged.find("endsec;")
+        page, position = paged.position_in_page(start)
+        assert page == 0
+        assert paged.page_bytes(0)[position:position + end - start] == \
+            b"ENDSEC;"
+        assert paged.find("endsec;", case_sensitive=True) is None
+
+        start, _ = paged.find("END-ISO-10303-21;")
+        assert paged.page_of(start) == paged.nb_pages - 1
+        assert paged.find("END-ISO-10303-21;", start + 1) is None
+    finally:
+        paged.close()
+
+
+def test_empty_file(tmpdir):
+    r"""An empty file has a single empty page"""
+    path = tmpdir.join("empty.stp")
+    path.write("")
+    paged = PagedText(str(path))
+    assert paged.nb_pages == 1
+    assert paged.page(0) == ""
+    assert paged.find("ENDSEC") is None
+    paged.close()
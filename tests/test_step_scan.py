@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+r"""step_scan.py tests"""
+
+from os.path import join, dirname
+
+import pytest
+
+from osvcad.step_scan import scan_step, parse_parameters
+
+
+def test_parse_parameters():
+    r"""Strings, references, aggregates, unset and typed parameters"""
+    assert parse_parameters("('it''s',#12,(#1,#2),$,*,.T.,1.5,"
+                            "LENGTH_MEASURE(0.01))") == \
+        ["it's", "#12", ["#1", "#2"], None, None, ".T.", "1.5",
+         ("LENGTH_MEASURE", ["0.01"])]
+    with pytest.raises(ValueError):
+        parse_parameters("'a')")
+    with pytest.raises(ValueError):
+        parse_parameters("('a',(#1)")
+
+
+def test_scan_step():
+    r"""Header, products and entity counts of a STEP file"""
+    statistics = scan_step(join(dirname(__file__), "cad_files", "rim.stp"))
+    assert statistics.schemas == ["CONFIG_CONTROL_DESIGN"]
+    assert statistics.file_name["name"] == "rim"
+    assert statistics.file_name["preprocessor_version"] == "ST-DEVELOPER v15"
+    assert statistics.file_description == [[""], "2;1"]
+    assert statistics.products == ["Document"]
+    assert statistics.entity_counts["ADVANCED_FACE"] == 385
+    assert statistics.entity_counts["MANIFOLD_SOLID_BREP"] == 1
+    assert statistics.entity_counts["LENGTH_UNIT NAMED_UNIT SI_UNIT"] == 1
+    assert statistics.nb_faces == 385
+    assert statistics.nb_entities == 29698
+
+
+def test_scan_not_step(tmpdir):
+    r"""A file that is not a STEP file is rejected"""
+    path = tmpdir.join("part.stp")
+    path.write("solid part\nendsolid part\n")
+    with pytest.raises(ValueError):
+        scan_step(str(path))
+
+
+def test_scan_step_cancelled():
+    r"""The scan checks its cancellation token"""
+    class _Token(object):
+        def __init__(self):
+            self.nb_checks = 0
+
+        def check(self):
+            self.nb_checks += 1
+            if self.nb_checks > 1:
+                raise RuntimeError("cancelled")
+
+    token = _Token()
+    with pytest.raises(RuntimeError):
+        scan_step(join(dirname(__file__), "cad_files", "rim.stp"), token)
+    assert token.nb_checks == 2
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+r"""stepzip.py tests"""
+
+import json
+import os
+import zipfile
+from os.path import join, dirname
+
+import numpy as np
+import pytest
+
+from osvcad.stepzip import read_anchors, create_stepzip, extract_stepzip, \
+    read_manifest, read_stepzip_mesh, read_stepzip_anchors, member_offset, \
+    member_memmap, extraction_directory, MANIFEST
+
+
+def test_read_anchors():
+    r"""Read the anchors of the rim"""
+    anchors = read_anchors(join(dirname(__file__), "cad_files", "rim.anchors"))
+    assert anchors["axle"] == {"position": (0., 0., 0.),
+                               "direction": (0., 0., 1.)}
+    assert anchors["tyre"]["position"] == (0., 0., 114.869)
+
+
+def _stepzip_2(path, vertices, triangles):
+    r"""Version 2 stepzip file written without OCC"""
+    manifest = {"format": "stepzip", "version": 2, "name": "tri",
+                "step": "tri.stp", "brep": "tri.brep",
+                "anchors": "tri.janchors",
+                "mesh": {"vertices": "tri.vertices",
+                         "triangles": "tri.triangles",
+                         "nb_vertices": len(vertices),
+                         "nb_triangles": len(triangles)}}
+    anchors = {"top": {"position": [0, 0, 1], "direction": [0, 0, 1]}}
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(MANIFEST, json.dumps(manifest))
+        zf.writestr("tri.stp", "ISO-10303-21;")
+        zf.writestr(zipfile.ZipInfo("tri.brep"), "brep",
+                    compress_type=zipfile.ZIP_STORED)
+        zf.writestr(zipfile.ZipInfo("tri.janchors"), json.dumps(anchors),
+                    compress_type=zipfile.ZIP_STORED)
+        zf.writestr(zipfile.ZipInfo("tri.vertices"),
+                    np.array(vertices, dtype=np.float32).tobytes(),
+                    compress_type=zipfile.ZIP_STORED)
+        zf.writestr(zipfile.ZipInfo("tri.triangles"),
+                    np.array(triangles, dtype=np.uint32).tobytes(),
+                    compress_type=zipfile.ZIP_STORED)
+
+
+def test_stepzip_1(tmpdir):
+    r"""A version 1 stepzip file has no manifest and extracts both files"""
+    step_file = tmpdir.join("tri.stp")
+    step_file.write("ISO-10303-21;")
+    anchors_file = tmpdir.join("tri.anchors")
+    anchors_file.write("top 0,0,1,0,0,1\n")
+    stepzip = create_stepzip(str(step_file), str(anchors_file), version=1,
+                             stepzip_file=str(tmpdir.join("tri.stepzip")))
+    step_file.remove()
+    anchors_file.remove()
+
+    assert read_manifest(stepzip) is None
+    step_file_path, anchors_file_path = extract_stepzip(stepzip)
+    assert step_file_path == str(step_file)
+    assert read_anchors(anchors_file_path)["top"]["direction"] == (0, 0, 1)
+
+
+def test_stepzip_2(tmpdir):
+    r"""The mesh of a version 2 stepzip file is mapped from the zip file and
+    only the STEP and anchors files are extracted"""
+    path = str(tmpdir.join("tri.stepzip"))
+    _stepzip_2(path, [[0, 0, 0], [1, 0, 0], [0, 1, 0]], [[0, 1, 2]])
+
+    manifest = read_manifest(path)
+    assert manifest["version"] == 2
+
+    vertices = member_memmap(path, "tri.vertices", np.float32, (3, 3))
+    assert isinstance(vertices, np.memmap)
+    assert not vertices.flags.writeable
+
+    mesh = read_stepzip_mesh(path, manifest)
+    assert not mesh.vertices.flags.owndata
+    assert np.allclose(mesh.vertices[1], (1, 0, 0))
+    assert mesh.triangles.tolist() == [[0, 1, 2]]
+
+    assert read_stepzip_anchors(path, manifest)["top"]["position"] == \
+        (0, 0, 1)
+
+    cache = tmpdir.join("cache")
+    step_file_path, anchors_file_path = \
+        extract_stepzip(path, cache_directory=str(cache))
+    assert step_file_path == join(extraction_directory(path, str(cache)),
+                                  "tri.stp")
+    assert read_anchors(anchors_file_path)["top"]["position"] == (0, 0, 1)
+    # nothing is extracted next to the stepzip file
+    assert sorted(os.listdir(str(tmpdir))) == ["cache", "tri.stepzip"]
+    assert sorted(os.listdir(dirname(step_file_path))) == \
+        ["tri.janchors", "tri.stp"]
+
+    with pytest.raises(ValueError):
+        member_offset(path, "tri.stp")  # compressed
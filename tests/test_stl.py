@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+r"""stl.py tests"""
+
+import struct
+
+import numpy as np
+
+from osvcad.mesh import Mesh, MeshLods, MeshSet
+from osvcad.stl import stl_records, write_stl, STL_DTYPE
+
+
+def _triangle():
+    return Mesh([[0, 0, 0], [1, 0, 0], [0, 1, 0]], [[0, 1, 2]])
+
+
+def test_stl_records_transformation():
+    r"""Triangles are placed by each matrix and get unit normals"""
+    translation = np.identity(4)
+    translation[:3, 3] = (0, 0, 5)
+
+    records = stl_records(_triangle(), np.array([np.identity(4),
+                                                 translation]))
+
+    assert records.shape == (2,)
+    assert np.allclose(records["normal"], [[0, 0, 1], [0, 0, 1]])
+    assert np.allclose(records["vertices"][1][:, 2], 5)
+
+
+def test_stl_records_mirror():
+    r"""A mirrored triangle keeps its normal pointing outwards"""
+    records = stl_records(_triangle(), np.diag([1., 1., -1., 1.]))
+
+    assert np.allclose(records["normal"], [[0, 0, -1]])
+
+
+def test_write_stl_merged(tmpdir, part_stand_in):
+    r"""All the instances end up in a single binary STL file"""
+    mesh_set = MeshSet({"k": _triangle()},
+                       [(part_stand_in("a"), np.identity(4), "k"),
+                        (part_stand_in("b"), np.identity(4), "k")])
+    path = str(tmpdir.join("assembly.stl"))
+
+    write_stl(None, path, mesh_set=mesh_set)
+
+    with open(path, "rb") as f:
+        content = f.read()
+    assert struct.unpack("<I", content[80:84])[0] == 2
+    assert len(content) == 84 + 2 * STL_DTYPE.itemsize
+
+
+def test_write_stl_per_part(tmpdir, part_stand_in):
+    r"""One STL file per part, named after its instance id"""
+    mesh_set = MeshSet({"k": _triangle()},
+                       [(part_stand_in("a"), np.identity(4), "k"),
+                        (part_stand_in("b"), np.identity(4), "k")])
+
+    paths = write_stl(None, str(tmpdir), mesh_set=mesh_set, merged=False)
+
+    assert [p.split("/")[-1] for p in paths] == ["a.stl", "b.stl"]
+
+
+def test_write_stl_triangle_budget(tmpdir, part_stand_in):
+    r"""The levels of detail are chosen within the triangle budget"""
+    fine = Mesh(np.zeros((3, 3)), np.zeros((4, 3)))
+    mesh_set = MeshSet({"k": MeshLods({0.1: _triangle(), 0.01: fine})},
+                       [(part_stand_in("a"), np.identity(4), "k"),
+                        (part_stand_in("b"), np.identity(4), "k")])
+    path = str(tmpdir.join("assembly.stl"))
+
+    write_stl(None, path, mesh_set=mesh_set, triangle_budget=4)
+    assert struct.unpack("<I", tmpdir.join("assembly.stl").read_binary()
+                         [80:84])[0] == 2
+
+    write_stl(None, path, mesh_set=mesh_set)
+    assert struct.unpack("<I", tmpdir.join("assembly.stl").read_binary()
+                         [80:84])[0] == 8
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+r"""store.py tests"""
+
+import shutil
+from os.path import join, dirname, exists
+
+from osvcad.store import ShapeStore
+
+RIM = join(dirname(__file__), "cad_files", "rim.stp")
+
+
+def _reexported(source, path):
+    r"""Copy of a STEP file with other bytes (same geometry)"""
+    with open(source) as f:
+        content = f.read()
+    with open(path, "w") as f:
+        f.write(content.replace("HEADER;", "HEADER;\n/* exported again */",
+                                1))
+    return path
+
+
+def test_store_copies(tmpdir):
+    r"""The copies of a geometry resolve to the same stored shape"""
+    copy = str(tmpdir.join("wheel_rim.stp"))
+    shutil.copy(RIM, copy)
+    reexported = _reexported(RIM, str(tmpdir.join("rim_2.stp")))
+    store = ShapeStore(str(tmpdir.join("store")))
+
+    shape = store.load(RIM)
+    assert store.load(copy) is shape
+    assert store.load(reexported) is shape
+    # the byte identical copy is not parsed
+    assert store.session_parsed == 2
+
+    report = store.report()
+    assert report.nb_files == 3
+    assert report.nb_shapes == 1
+    assert report.saved_bytes == 2 * report.stored_bytes
+
+
+def test_store_next_session(tmpdir):
+    r"""A stored CAD file is not parsed again once the index is saved"""
+    directory = str(tmpdir.join("store"))
+    store = ShapeStore(directory)
+    store.load(RIM)
+    # the index is only written by save()
+    assert not exists(join(directory, "index.json"))
+    store.save()
+    assert exists(join(directory, "index.json"))
+
+    store = ShapeStore(directory)
+    shape = store.load(RIM)
+    assert store.session_parsed == 0
+    assert store.load(RIM) is shape
+    assert store.report().session_loads == 2
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+r"""thumbnails.py tests"""
+
+import shutil
+from os.path import join, dirname
+
+from osvcad.thumbnails import ThumbnailCache, cad_files
+
+
+def test_thumbnail_cache_lookup(tmpdir):
+    r"""A registered thumbnail is found without hashing the CAD file and is
+    invalidated by a modification of the CAD file"""
+    cad_file_path = str(tmpdir.join("part.stp"))
+    with open(cad_file_path, "w") as f:
+        f.write("ISO-10303-21;")
+    cache = ThumbnailCache(str(tmpdir.join("thumbnails")))
+
+    assert cache.lookup(cad_file_path) is None
+
+    key = cache.key(cad_file_path)
+    with open(cache.path(key), "wb") as f:
+        f.write(b"png")
+    cache.register([(cad_file_path, 128, key)])
+
+    assert cache.lookup(cad_file_path) == cache.path(key)
+    assert cache.lookup(cad_file_path, size=64) is None
+
+    with open(cad_file_path, "w") as f:
+        f.write("ISO-10303-21; modified")
+    assert cache.lookup(cad_file_path) is None
+    assert cache.key(cad_file_path) != key
+
+
+def test_thumbnail_key_content(tmpdir):
+    r"""Identical files share their thumbnail, whatever their names"""
+    step_file = join(dirname(__file__), "cad_files", "rim.stp")
+    copy = str(tmpdir.join("wheel_rim.stp"))
+    other_copy = str(tmpdir.mkdir("shelf").join("RIM-42.stp"))
+    shutil.copy(step_file, copy)
+    shutil.copy(step_file, other_copy)
+    assert ThumbnailCache.key(copy) == ThumbnailCache.key(other_copy)
+    assert ThumbnailCache.key(copy, 64) != ThumbnailCache.key(copy)
+
+    # a single byte changed
+    with open(other_copy, "r+b") as f:
+        f.seek(100)
+        byte = f.read(1)
+        f.seek(100)
+        f.write(b"x" if byte != b"x" else b"y")
+    assert ThumbnailCache.key(copy) != ThumbnailCache.key(other_copy)
+
+
+def test_cad_files():
+    r"""Only STEP and stepzip files are listed"""
+    paths = cad_files(join(dirname(__file__), "..", "sample_projects",
+                           "car", "shelf"))
+    assert len(paths) > 0
+    assert all(path.endswith((".stp", ".step", ".stepzip")) for path in paths)
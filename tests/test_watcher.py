@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+r"""ui/watcher.py tests"""
+
+import threading
+
+from osvcad.ui.watcher import directory_entries, PollingWatcher
+
+
+def test_directory_entries(tmpdir):
+    r"""Directories and files are listed apart, sorted, without the
+    excluded extensions"""
+    tmpdir.mkdir("b_dir")
+    tmpdir.mkdir("a_dir")
+    tmpdir.mkdir("__pycache__")
+    tmpdir.join("part.stp").write("")
+    tmpdir.join("assembly.py").write("")
+    tmpdir.join("notes.TXT").write("")
+
+    dirs, files = directory_entries(str(tmpdir), [".txt"])
+
+    assert dirs == ["a_dir", "b_dir"]
+    assert files == ["assembly.py", "part.stp"]
+
+
+def test_polling_watcher(tmpdir):
+    r"""A new file in a watched directory is reported"""
+    changed = list()
+    event = threading.Event()
+
+    def callback(directory):
+        changed.append(directory)
+        event.set()
+
+    watcher = PollingWatcher(callback, interval=0.05)
+    watcher.watch(str(tmpdir))
+    try:
+        tmpdir.join("part.stp").write("")
+        assert event.wait(5.)
+    finally:
+        watcher.stop()
+    assert changed == [str(tmpdir)]
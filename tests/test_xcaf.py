@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+r"""xcaf.py tests"""
+
+from os.path import join, dirname
+
+import numpy as np
+import pytest
+
+from osvcad.nodes import Part, Assembly
+from osvcad.step_scan import scan_step
+from osvcad.transformations import translation_matrix
+from osvcad.xcaf import StepAssemblyReader
+
+RIM = join(dirname(__file__), "cad_files", "rim.stp")
+
+
+def _two_rims():
+    r"""Assembly of 2 Parts that share their source shape"""
+    rim_1 = Part.from_step(RIM, anchors=dict(), instance_id="rim_1")
+    rim_2 = Part.from_step(RIM, anchors=dict(), instance_id="rim_2")
+    rim_2.reset(translation_matrix((1000., 0., 0.)))
+    assembly = Assembly(root=rim_1, instance_id="wheels")
+    assembly.add_node(rim_2)
+    return assembly
+
+
+def test_to_step_instancing(tmpdir):
+    r"""A source shape placed twice is written once"""
+    path = str(tmpdir.join("wheels.stp"))
+
+    _two_rims().to_step(path)
+
+    statistics = scan_step(path)
+    rim_faces = scan_step(RIM).nb_faces
+    assert statistics.nb_faces == rim_faces
+    assert statistics.entity_counts["NEXT_ASSEMBLY_USAGE_OCCURRENCE"] == 2
+    assert sorted(statistics.products) == ["rim", "wheels"]
+
+
+def test_to_step_schema(tmpdir):
+    r"""The schema of an export does not leak into the next one"""
+    ap203 = str(tmpdir.join("ap203.stp"))
+    default = str(tmpdir.join("default.stp"))
+
+    _two_rims().to_step(ap203, schema="AP203")
+    _two_rims().to_step(default)
+
+    assert scan_step(ap203).schemas == ["CONFIG_CONTROL_DESIGN"]
+    assert scan_step(default).schemas[0].startswith("AUTOMOTIVE_DESIGN")
+    with pytest.raises(ValueError):
+        _two_rims().to_step(str(tmpdir.join("bad.stp")), schema="AP214")
+
+
+def test_read_step_shared_geometry(tmpdir):
+    r"""The instances of a product read from a STEP file share its shape"""
+    path = str(tmpdir.join("wheels.stp"))
+    _two_rims().to_step(path)
+
+    reader = StepAssemblyReader(path)
+    assert [root.name for root in reader.roots] == ["wheels"]
+    assert reader.roots[0].nb_instances == 2
+    assert len(reader.prototypes) == 0
+
+    assembly = reader.assembly()
+    leaves = assembly.leaves()
+    assert sorted(part.instance_id for part, _ in leaves) == \
+        ["rim_1", "rim_2"]
+    assert leaves[0][0].source_shape is leaves[1][0].source_shape
+    assert len(reader.prototypes) == 1
+    translations = sorted(matrix[0, 3] for _, matrix in leaves)
+    assert np.allclose(translations, [0., 1000.])
+
+    rim_2 = reader.assembly(["wheels", "rim_2"])
+    assert np.allclose(rim_2.matrix[:3, 3], (1000., 0., 0.))
+
+
+def test_read_step_component_placement(tmpdir):
+    r"""A component read by its path is placed by its ancestors too"""
+    path = str(tmpdir.join("car.stp"))
+    wheels = _two_rims()
+    wheels.transform(translation_matrix((0., 500., 0.))[:3])
+    Assembly(root=wheels, instance_id="car").to_step(path)
+
+    reader = StepAssemblyReader(path)
+    assert np.allclose(reader.find(["car", "wheels"]).matrix[:3, 3],
+                       (0., 500., 0.))
+    assert np.allclose(reader.placement(["car", "wheels", "rim_2"])[:3, 3],
+                       (1000., 500., 0.))
+    rim_2 = reader.assembly(["car", "wheels", "rim_2"])
+    assert np.allclose(rim_2.matrix[:3, 3], (1000., 500., 0.))